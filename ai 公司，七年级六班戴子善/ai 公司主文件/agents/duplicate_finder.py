@@ -0,0 +1,312 @@
+# File: agents/duplicate_finder.py
+# 重复文件查找
+# 先按大小分组，再比较开头和结尾数据块的部分哈希，只对仍然冲突的文件计算完整哈希；
+# 哈希在进程池中计算，并按 (设备, inode, 大小, mtime) 缓存到 SQLite，重复运行几乎不需要再读文件
+
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .organize_plan import MoveOp, _unique_destination
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_BLOCK = 64 * 1024
+HASH_CHUNK = 1024 * 1024
+DEFAULT_HASH_CACHE = os.path.join(os.path.expanduser("~"), ".ai_workflow", "hash_cache.sqlite3")
+# 需要计算的文件少于该数量时直接在当前进程中计算（进程启动本身有开销）
+PROCESS_POOL_THRESHOLD = 8
+DUPLICATES_FOLDER = "duplicates"
+
+_SKIP_DIRS = {".git", ".svn", ".hg", "__pycache__", "node_modules", DUPLICATES_FOLDER}
+
+
+def partial_hash(path: str, size: int) -> str:
+    """文件开头和结尾各一个数据块的哈希（小文件即为整个文件的哈希）"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_BLOCK))
+        if size > PARTIAL_BLOCK:
+            f.seek(max(PARTIAL_BLOCK, size - PARTIAL_BLOCK))
+            digest.update(f.read(PARTIAL_BLOCK))
+    return digest.hexdigest()
+
+
+def full_hash(path: str) -> str:
+    """整个文件的哈希"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _hash_job(job: Tuple[str, str, int]) -> Tuple[str, Optional[str]]:
+    """在工作进程中计算哈希，job 为 (种类, 路径, 大小)"""
+    kind, path, size = job
+    try:
+        return path, partial_hash(path, size) if kind == "partial" else full_hash(path)
+    except OSError as e:
+        logger.warning(f"无法读取文件 {path}: {str(e)}")
+        return path, None
+
+
+class HashCache:
+    """按 (设备, inode, 大小, mtime) 缓存部分哈希和完整哈希；文件被修改后键随之变化，自然失效"""
+
+    def __init__(self, db_path: Optional[str] = DEFAULT_HASH_CACHE):
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                dev INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                partial TEXT,
+                full TEXT,
+                PRIMARY KEY (dev, inode, size, mtime_ns)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[int, int, int, int], kind: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {'partial' if kind == 'partial' else 'full'} FROM file_hashes "
+                f"WHERE dev = ? AND inode = ? AND size = ? AND mtime_ns = ?", key
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_many(self, items: List[Tuple[Tuple[int, int, int, int], str]], kind: str) -> None:
+        column = 'partial' if kind == 'partial' else 'full'
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO file_hashes (dev, inode, size, mtime_ns, {column}) VALUES (?, ?, ?, ?, ?) "
+                f"ON CONFLICT (dev, inode, size, mtime_ns) DO UPDATE SET {column} = excluded.{column}",
+                [key + (value,) for key, value in items]
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class FileInfo:
+    """参与比较的文件"""
+    __slots__ = ("path", "size", "mtime", "key")
+
+    def __init__(self, path: str, stat: os.stat_result):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class DuplicateGroup:
+    """一组内容相同的文件，original 为最早修改的那个"""
+    __slots__ = ("size", "digest", "files")
+
+    def __init__(self, size: int, digest: str, files: List[FileInfo]):
+        self.size = size
+        self.digest = digest
+        self.files = sorted(files, key=lambda info: (info.mtime, info.path))
+
+    @property
+    def original(self) -> str:
+        return self.files[0].path
+
+    @property
+    def duplicates(self) -> List[str]:
+        return [info.path for info in self.files[1:]]
+
+    @property
+    def wasted_bytes(self) -> int:
+        return self.size * (len(self.files) - 1)
+
+
+class DuplicateFinder:
+    """
+    重复文件查找器。
+
+    用法::
+
+        finder = DuplicateFinder()
+        for group in finder.iter_groups("/data"):
+            print(group.original, group.duplicates)
+    """
+
+    def __init__(self, hash_cache: Optional[HashCache] = None, max_workers: Optional[int] = None,
+                 min_size: int = 1):
+        """
+        初始化查找器
+
+        Args:
+            hash_cache (Optional[HashCache]): 哈希缓存，默认使用 ~/.ai_workflow/hash_cache.sqlite3
+            max_workers (Optional[int]): 计算哈希的进程数，默认为 CPU 核数
+            min_size (int, optional): 忽略小于该字节数的文件
+        """
+        self.hash_cache = hash_cache or HashCache()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_size = min_size
+        self.stats = {"files": 0, "size_candidates": 0, "partial_hashed": 0, "full_hashed": 0, "cache_hits": 0}
+
+    def _collect(self, root: str) -> Dict[int, List[FileInfo]]:
+        """遍历目录，按大小分组；同一 inode 的硬链接只保留一个"""
+        by_size: Dict[int, List[FileInfo]] = defaultdict(list)
+        seen_inodes = set()
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in _SKIP_DIRS and not d.startswith('.')]
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.lstat(path)
+                except OSError:
+                    continue
+                if not os.path.stat.S_ISREG(stat.st_mode) or stat.st_size < self.min_size:
+                    continue
+                inode = (stat.st_dev, stat.st_ino)
+                if inode in seen_inodes:
+                    continue
+                seen_inodes.add(inode)
+                self.stats["files"] += 1
+                by_size[stat.st_size].append(FileInfo(path, stat))
+        return {size: infos for size, infos in by_size.items() if len(infos) > 1}
+
+    def _hash_all(self, infos: List[FileInfo], kind: str, executor: Optional[ProcessPoolExecutor]) -> Dict[str, str]:
+        """计算一批文件的哈希，先查缓存，未命中的交给进程池"""
+        result, pending = {}, []
+        for info in infos:
+            cached = self.hash_cache.get(info.key, kind)
+            if cached:
+                result[info.path] = cached
+                self.stats["cache_hits"] += 1
+            else:
+                pending.append(info)
+        if not pending:
+            return result
+        jobs = [(kind, info.path, info.size) for info in pending]
+        if executor is not None and len(jobs) >= PROCESS_POOL_THRESHOLD:
+            hashed = executor.map(_hash_job, jobs, chunksize=16)
+        else:
+            hashed = map(_hash_job, jobs)
+        keys = {info.path: info.key for info in pending}
+        fresh = []
+        for path, digest in hashed:
+            if digest:
+                result[path] = digest
+                fresh.append((keys[path], digest))
+        self.hash_cache.set_many(fresh, kind)
+        self.stats[f"{kind}_hashed"] += len(fresh)
+        return result
+
+    def iter_groups(self, root: str) -> Iterator[DuplicateGroup]:
+        """
+        查找重复文件，每确认一组就产出一组（按文件大小从大到小）
+
+        Args:
+            root (str): 要检查的目录
+
+        Yields:
+            DuplicateGroup: 一组重复文件
+        """
+        self.stats = dict.fromkeys(self.stats, 0)
+        candidates = self._collect(os.path.abspath(root))
+        self.stats["size_candidates"] = sum(len(infos) for infos in candidates.values())
+        executor = None
+        try:
+            if self.max_workers > 1 and self.stats["size_candidates"] >= PROCESS_POOL_THRESHOLD:
+                try:
+                    # 查重在多线程的服务进程里运行，用 spawn 避免 fork 复制其他线程持有的锁
+                    executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                   mp_context=multiprocessing.get_context("spawn"))
+                except (OSError, NotImplementedError) as e:
+                    logger.warning(f"无法启动进程池，改为在当前进程中计算哈希: {str(e)}")
+            for size in sorted(candidates, reverse=True):
+                infos = candidates[size]
+                partials = self._hash_all(infos, "partial", executor)
+                by_partial: Dict[str, List[FileInfo]] = defaultdict(list)
+                for info in infos:
+                    if info.path in partials:
+                        by_partial[partials[info.path]].append(info)
+                for partial, group in by_partial.items():
+                    if len(group) < 2:
+                        continue
+                    if size <= 2 * PARTIAL_BLOCK:
+                        # 部分哈希已覆盖整个文件
+                        yield DuplicateGroup(size, partial, group)
+                        continue
+                    fulls = self._hash_all(group, "full", executor)
+                    by_full: Dict[str, List[FileInfo]] = defaultdict(list)
+                    for info in group:
+                        if info.path in fulls:
+                            by_full[fulls[info.path]].append(info)
+                    for digest, same in by_full.items():
+                        if len(same) > 1:
+                            yield DuplicateGroup(size, digest, same)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def find(self, root: str) -> List[DuplicateGroup]:
+        """查找重复文件并返回全部分组"""
+        return list(self.iter_groups(root))
+
+
+def plan_duplicate_moves(groups: List[DuplicateGroup], root: str) -> List[MoveOp]:
+    """
+    生成把重复文件移到 root/duplicates/ 的计划（保留每组最早的文件），可交给 FileOrganizer.execute 执行和撤销
+
+    Args:
+        groups (List[DuplicateGroup]): 重复文件分组
+        root (str): 整理的根目录
+
+    Returns:
+        List[MoveOp]: 移动计划
+    """
+    target_dir = os.path.join(os.path.abspath(root), DUPLICATES_FOLDER)
+    plan, taken = [], set()
+    for group in groups:
+        for path in group.duplicates:
+            dst = _unique_destination(os.path.join(target_dir, os.path.basename(path)), taken)
+            taken.add(dst)
+            plan.append(MoveOp(path, dst, DUPLICATES_FOLDER, group.size))
+    return plan
+
+
+def link_duplicates(groups: List[DuplicateGroup]) -> Dict[str, int]:
+    """
+    把重复文件替换为指向原文件的硬链接（先在旁边建立链接再原子替换，失败时不影响原文件）
+
+    Args:
+        groups (List[DuplicateGroup]): 重复文件分组
+
+    Returns:
+        Dict[str, int]: 替换数、失败数和节省的字节数
+    """
+    linked, failed, saved = 0, 0, 0
+    for group in groups:
+        for path in group.duplicates:
+            tmp = f"{path}.dedupe-{os.getpid()}-{int(time.time() * 1000)}"
+            try:
+                os.link(group.original, tmp)
+                os.replace(tmp, path)
+                linked += 1
+                saved += group.size
+            except OSError as e:
+                logger.error(f"建立硬链接失败 {path}: {str(e)}")
+                failed += 1
+                if os.path.lexists(tmp):
+                    os.remove(tmp)
+    return {"linked": linked, "failed": failed, "saved_bytes": saved}
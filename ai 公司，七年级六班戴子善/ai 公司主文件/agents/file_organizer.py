@@ -1,7 +1,9 @@
 import os
-import shutil
 from datetime import datetime
 from .base_agent import Agent
+from ai_workflow_system import get_metadata_index
+from .organize_plan import FileOrganizer, format_plan, load_category_rules
+from .duplicate_finder import DuplicateFinder, link_duplicates, plan_duplicate_moves
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,8 +11,16 @@ logger = logging.getLogger(__name__)
 class FileOrganizerAgent(Agent):
     """文件整理员，负责管理和组织用户文件"""
     
-    def __init__(self):
+    def __init__(self, metadata_index=None, category_rules_path=None):
         super().__init__("file_organizer", "文件整理员")
+        # 分类规则可通过 JSON 文件配置（分类目录名 -> 扩展名列表）
+        self.organizer = FileOrganizer(load_category_rules(
+            category_rules_path or os.environ.get("AI_WORKFLOW_ORGANIZER_RULES")))
+        # 文件元数据索引（与工作流共用一个连接，路径由 AI_WORKFLOW_METADATA_DB 配置），
+        # 目录未变化时查询不必重新遍历文件系统
+        self.metadata_index = metadata_index or get_metadata_index()
+        # 重复文件查找，哈希按 (inode, 大小, mtime) 缓存，再次检查同一目录几乎不需要读取文件
+        self.duplicate_finder = DuplicateFinder()
         self.system_prompt = """你是一位专业的文件整理员，负责管理和组织用户的文件系统。
 你的任务是：
 1. 浏览文件系统
@@ -22,56 +32,108 @@ class FileOrganizerAgent(Agent):
     def browse_directory(self, path='.'):
         """浏览目录"""
         try:
-            items = []
-            for item in os.listdir(path):
-                full_path = os.path.join(path, item)
-                item_info = {
-                    'name': item,
-                    'path': full_path,
-                    'type': 'directory' if os.path.isdir(full_path) else 'file',
-                    'size': os.path.getsize(full_path),
-                    'modified': datetime.fromtimestamp(os.path.getmtime(full_path))
-                }
-                items.append(item_info)
+            items = self.metadata_index.list_directory(path)
+            for item in items:
+                item['modified'] = datetime.fromtimestamp(item['modified'])
             return items
         except Exception as e:
             logger.error(f"浏览目录失败: {str(e)}")
             return []
 
-    def organize_files(self, path, pattern=None):
-        """整理文件"""
+    def find_files(self, path='.', extensions=None, min_size=None, max_size=None,
+                   older_than_days=None, newer_than_days=None, limit=100):
+        """按扩展名、大小和修改时间查找文件（先增量刷新索引）"""
         try:
-            # 按文件类型分类
-            extensions = {
-                'documents': ['.pdf', '.doc', '.docx', '.txt', '.md'],
-                'images': ['.jpg', '.jpeg', '.png', '.gif'],
-                'audio': ['.mp3', '.wav', '.flac'],
-                'video': ['.mp4', '.avi', '.mkv'],
-                'code': ['.py', '.js', '.html', '.css', '.json']
-            }
-            
-            # 创建分类目录
-            for category in extensions:
-                os.makedirs(os.path.join(path, category), exist_ok=True)
-            
-            # 移动文件
-            moved_files = []
-            for item in os.listdir(path):
-                if os.path.isfile(os.path.join(path, item)):
-                    ext = os.path.splitext(item)[1].lower()
-                    for category, exts in extensions.items():
-                        if ext in exts:
-                            src = os.path.join(path, item)
-                            dst = os.path.join(path, category, item)
-                            shutil.move(src, dst)
-                            moved_files.append((item, category))
-                            break
-            
-            return moved_files
+            self.metadata_index.refresh(path)
+            items = self.metadata_index.query(
+                root=path, extensions=extensions, min_size=min_size, max_size=max_size,
+                older_than=older_than_days * 86400 if older_than_days is not None else None,
+                newer_than=newer_than_days * 86400 if newer_than_days is not None else None,
+                limit=limit
+            )
+            for item in items:
+                item['modified'] = datetime.fromtimestamp(item['modified'])
+            return items
         except Exception as e:
-            logger.error(f"整理文件失败: {str(e)}")
+            logger.error(f"查找文件失败: {str(e)}")
             return []
 
+    def organize_files(self, path, pattern=None, dry_run=False):
+        """
+        整理文件：先生成完整的移动计划，dry_run 时只返回计划，否则并行执行并写入日志
+
+        Returns:
+            dict: plan（移动计划）和 report（执行报告，dry_run 时为None）
+        """
+        try:
+            plan = self.organizer.plan(path, pattern)
+            if dry_run or not plan:
+                return {'plan': plan, 'report': None}
+            return {'plan': plan, 'report': self.organizer.execute(plan, root=os.path.abspath(path))}
+        except Exception as e:
+            logger.error(f"整理文件失败: {str(e)}")
+            return {'plan': [], 'report': None}
+
+    def stream_duplicate_report(self, path='.'):
+        """
+        查找重复文件，每确认一组就产出一段 Markdown 报告
+
+        Yields:
+            str: 报告片段
+        """
+        yield f"## 重复文件: {path}\n\n"
+        groups, wasted = 0, 0
+        try:
+            for group in self.duplicate_finder.iter_groups(path):
+                groups += 1
+                wasted += group.wasted_bytes
+                chunk = f"### {group.size / 1024:.1f} KB × {len(group.files)}\n- 保留 {group.original}\n"
+                chunk += "".join(f"- 重复 {duplicate}\n" for duplicate in group.duplicates)
+                yield chunk + "\n"
+        except Exception as e:
+            logger.error(f"查找重复文件失败: {str(e)}")
+            yield f"查找重复文件失败: {str(e)}\n"
+            return
+        stats = self.duplicate_finder.stats
+        yield (f"共 {groups} 组重复文件，可节省 {wasted / 1024 / 1024:.1f} MB"
+               f"（检查 {stats['files']} 个文件，部分哈希 {stats['partial_hashed']} 个，"
+               f"完整哈希 {stats['full_hashed']} 个，缓存命中 {stats['cache_hits']} 次）。\n")
+
+    def dedupe_files(self, path='.', mode='folder'):
+        """
+        去除重复文件，每组保留最早修改的文件
+
+        Args:
+            path (str): 要检查的目录
+            mode (str): folder 把重复文件移到 duplicates/ 目录（写入日志，可撤销）；hardlink 替换为硬链接
+
+        Returns:
+            dict: folder 模式为整理报告，hardlink 模式为 linked、failed 和 saved_bytes；没有重复文件时为None
+        """
+        if mode not in ('folder', 'hardlink'):
+            raise ValueError(f"不支持的去重方式: {mode}")
+        try:
+            groups = self.duplicate_finder.find(path)
+            if not groups:
+                return None
+            if mode == 'hardlink':
+                return link_duplicates(groups)
+            return self.organizer.execute(plan_duplicate_moves(groups, path), root=os.path.abspath(path))
+        except Exception as e:
+            logger.error(f"去除重复文件失败: {str(e)}")
+            return None
+
+    def undo_last_organize(self):
+        """撤销最近一次整理"""
+        jobs = self.organizer.jobs()
+        if not jobs:
+            return None
+        return self.organizer.rollback(jobs[-1])
+
+    def recover_interrupted(self):
+        """继续执行中途中断的整理批次"""
+        return [self.organizer.resume(job_id) for job_id in self.organizer.incomplete_jobs()]
+
     def generate_response(self, user_input):
         """生成响应"""
         if "浏览" in user_input:
@@ -86,14 +148,48 @@ class FileOrganizerAgent(Agent):
                 response += f"{icon} {item['name']}\n"
                 response += f"大小: {size} | 修改时间: {modified}\n\n"
             
+        elif "预览整理" in user_input:
+            path = user_input.split("预览整理")[-1].strip() or '.'
+            result = self.organize_files(path, dry_run=True)
+            response = f"## 文件整理计划（预览，未移动任何文件）\n\n{format_plan(result['plan'])}"
+
+        elif "查找重复" in user_input:
+            path = user_input.split("查找重复")[-1].strip() or '.'
+            response = "".join(self.stream_duplicate_report(path))
+
+        elif "去重" in user_input:
+            mode = 'hardlink' if "硬链接" in user_input else 'folder'
+            path = user_input.split("去重")[-1].strip() or '.'
+            report = self.dedupe_files(path, mode)
+            if report is None:
+                response = "没有找到重复文件。\n"
+            elif mode == 'hardlink':
+                response = (f"## 去重报告\n\n已将 {report['linked']} 个重复文件替换为硬链接，失败 {report['failed']} 个，"
+                            f"节省 {report['saved_bytes'] / 1024 / 1024:.1f} MB。\n")
+            else:
+                response = (f"## 去重报告\n\n已将 {len(report['moved'])} 个重复文件移动到 duplicates 目录，"
+                            f"失败 {len(report['failed'])} 个。批次 {report['job_id']} 可通过“撤销整理”还原。\n")
+
+        elif "撤销整理" in user_input:
+            result = self.undo_last_organize()
+            if result is None:
+                response = "没有可以撤销的整理记录。\n"
+            else:
+                response = f"## 撤销整理\n\n已恢复 {result['restored']} 个文件，失败 {result['failed']} 个。\n"
+
         elif "整理" in user_input:
             path = user_input.split("整理")[-1].strip() or '.'
-            moved_files = self.organize_files(path)
+            report = self.organize_files(path)['report']
             
             response = f"## 文件整理报告\n\n"
-            if moved_files:
-                for file, category in moved_files:
+            if report and report['moved']:
+                for file, category in report['moved']:
                     response += f"- 已将 {file} 移动到 {category} 目录\n"
+                for file, error in report['failed']:
+                    response += f"- 移动 {file} 失败: {error}\n"
+                response += (f"\n共移动 {len(report['moved'])} 个文件，{report['bytes'] / 1024 / 1024:.1f} MB，"
+                             f"耗时 {report['seconds']:.2f} 秒（{report['files_per_second']:.0f} 个/秒，"
+                             f"{report['mb_per_second']:.1f} MB/秒）。批次 {report['job_id']} 可通过“撤销整理”还原。\n")
             else:
                 response += "没有找到需要整理的文件。\n"
                 
@@ -101,5 +197,9 @@ class FileOrganizerAgent(Agent):
             response = "我可以帮您:\n"
             response += "1. 浏览目录内容 (例如: '浏览 /path/to/directory')\n"
             response += "2. 整理文件 (例如: '整理 /path/to/directory')\n"
+            response += "3. 预览整理计划 (例如: '预览整理 /path/to/directory')\n"
+            response += "4. 撤销最近一次整理 (例如: '撤销整理')\n"
+            response += "5. 查找重复文件 (例如: '查找重复 /path/to/directory')\n"
+            response += "6. 去除重复文件 (例如: '去重 /path/to/directory' 或 '硬链接去重 /path/to/directory')\n"
             
         return response
\ No newline at end of file
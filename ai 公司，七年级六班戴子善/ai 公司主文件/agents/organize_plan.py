@@ -0,0 +1,410 @@
+# File: agents/organize_plan.py
+# 文件整理的计划与执行
+# 先生成完整的移动计划（可预览），再用有上限的线程池执行：同一文件系统内直接改名，跨设备时复制并校验；
+# 每一步写入只追加的日志，崩溃后可以恢复，也可以一次性撤销整个批次
+
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import errno
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY_RULES = {
+    'documents': ['.pdf', '.doc', '.docx', '.txt', '.md'],
+    'images': ['.jpg', '.jpeg', '.png', '.gif'],
+    'audio': ['.mp3', '.wav', '.flac'],
+    'video': ['.mp4', '.avi', '.mkv'],
+    'code': ['.py', '.js', '.html', '.css', '.json']
+}
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".ai_workflow", "organizer_journal")
+DEFAULT_MOVE_WORKERS = 4
+TMP_SUFFIX = ".organize-tmp"
+# 每写入多少条日志强制落盘一次（开始和结束记录总是立即落盘）
+JOURNAL_FSYNC_EVERY = 32
+
+
+def load_category_rules(path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    读取分类规则：JSON 对象，键为分类目录名，值为扩展名列表；未提供或读取失败时使用默认规则
+
+    Args:
+        path (Optional[str]): 规则文件路径
+
+    Returns:
+        Dict[str, List[str]]: 分类规则
+    """
+    if not path:
+        return dict(DEFAULT_CATEGORY_RULES)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        return {category: [ext.lower() if ext.startswith('.') else f'.{ext.lower()}' for ext in exts]
+                for category, exts in rules.items()}
+    except (OSError, ValueError, AttributeError) as e:
+        logger.error(f"读取分类规则失败，使用默认规则: {str(e)}")
+        return dict(DEFAULT_CATEGORY_RULES)
+
+
+class MoveOp:
+    """计划中的一次移动"""
+    __slots__ = ("src", "dst", "category", "size")
+
+    def __init__(self, src: str, dst: str, category: str, size: int):
+        self.src = src
+        self.dst = dst
+        self.category = category
+        self.size = size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"src": self.src, "dst": self.dst, "category": self.category, "size": self.size}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MoveOp":
+        return cls(data["src"], data["dst"], data.get("category", ""), data.get("size", 0))
+
+
+def _unique_destination(dst: str, taken: set) -> str:
+    """目标已存在或已被计划占用时，改为 “名称 (1).扩展名” 形式"""
+    if dst not in taken and not os.path.lexists(dst):
+        return dst
+    stem, ext = os.path.splitext(dst)
+    index = 1
+    while True:
+        candidate = f"{stem} ({index}){ext}"
+        if candidate not in taken and not os.path.lexists(candidate):
+            return candidate
+        index += 1
+
+
+def plan_moves(path: str, rules: Dict[str, List[str]], pattern: Optional[str] = None,
+               overrides: Optional[Dict[str, str]] = None) -> List[MoveOp]:
+    """
+    生成整理计划：把 path 下（不含子目录）的文件按扩展名移到对应的分类目录，同名文件自动改名，不覆盖
+
+    Args:
+        path (str): 要整理的目录
+        rules (Dict[str, List[str]]): 分类规则
+        pattern (Optional[str]): 只整理匹配该通配符的文件
+        overrides (Optional[Dict[str, str]]): 指定文件的目标分类（源路径 -> 分类目录），优先于扩展名规则
+
+    Returns:
+        List[MoveOp]: 移动计划
+    """
+    path = os.path.abspath(path)
+    by_ext = {ext.lower(): category for category, exts in rules.items() for ext in exts}
+    overrides = overrides or {}
+    plan, taken = [], set()
+    with os.scandir(path) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            if not entry.is_file(follow_symlinks=False) or entry.name.endswith(TMP_SUFFIX):
+                continue
+            if pattern and not fnmatch.fnmatch(entry.name, pattern):
+                continue
+            category = overrides.get(entry.path) or by_ext.get(os.path.splitext(entry.name)[1].lower())
+            if not category:
+                continue
+            dst = _unique_destination(os.path.join(path, category, entry.name), taken)
+            taken.add(dst)
+            plan.append(MoveOp(entry.path, dst, category, entry.stat(follow_symlinks=False).st_size))
+    return plan
+
+
+def format_plan(plan: List[MoveOp], limit: int = 200) -> str:
+    """把计划格式化为便于预览的 Markdown"""
+    if not plan:
+        return "没有找到需要整理的文件。\n"
+    total = sum(op.size for op in plan)
+    lines = [f"共 {len(plan)} 个文件，{total / 1024 / 1024:.1f} MB\n"]
+    for op in plan[:limit]:
+        renamed = "（重名，已改名）" if os.path.basename(op.dst) != os.path.basename(op.src) else ""
+        lines.append(f"- {os.path.basename(op.src)} → {op.category}/{os.path.basename(op.dst)}{renamed}")
+    if len(plan) > limit:
+        lines.append(f"- …… 其余 {len(plan) - limit} 个文件")
+    return "\n".join(lines) + "\n"
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def move_file(src: str, dst: str) -> str:
+    """
+    移动单个文件且不覆盖目标：同一文件系统内直接改名，跨设备时复制到临时文件、校验后再改名并删除源文件
+
+    Returns:
+        str: 使用的方式，"rename" 或 "copy"
+
+    Raises:
+        FileExistsError: 目标已存在
+        OSError: 移动失败
+    """
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, "目标已存在", dst)
+    try:
+        os.rename(src, dst)
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp = dst + TMP_SUFFIX
+    shutil.copy2(src, tmp)
+    if os.path.getsize(tmp) != os.path.getsize(src) or _file_digest(tmp) != _file_digest(src):
+        os.remove(tmp)
+        raise OSError(errno.EIO, "复制后校验失败", src)
+    os.rename(tmp, dst)
+    os.remove(src)
+    return "copy"
+
+
+class OrganizeJournal:
+    """
+    一个整理批次的只追加日志（JSON Lines）。
+
+    记录依次为 begin（含完整计划）、每个完成的 moved、最后的 commit；撤销时追加 undone 和 rolled_back。
+    只有 begin 没有 commit 的日志说明批次中途中断。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.job_id = os.path.splitext(os.path.basename(path))[0]
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+
+    def append(self, record: Dict[str, Any], sync: bool = False) -> None:
+        """追加一条记录"""
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(dict(record, ts=time.time()), ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if sync or self._unsynced >= JOURNAL_FSYNC_EVERY:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def read(self) -> Dict[str, Any]:
+        """
+        读取日志状态
+
+        Returns:
+            Dict[str, Any]: plan（计划）、moved（已完成的源路径 -> 记录）、undone（已撤销的源路径集合）、
+            committed、rolled_back
+        """
+        state = {"plan": [], "moved": {}, "undone": set(), "committed": False, "rolled_back": False, "root": None}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半
+                        continue
+                    op = record.get("op")
+                    if op == "begin":
+                        state["plan"] = [MoveOp.from_dict(item) for item in record.get("plan", [])]
+                        state["root"] = record.get("root")
+                    elif op == "moved":
+                        state["moved"][record["src"]] = record
+                    elif op == "undone":
+                        state["undone"].add(record["src"])
+                    elif op == "commit":
+                        state["committed"] = True
+                    elif op == "rolled_back":
+                        state["rolled_back"] = True
+        except FileNotFoundError:
+            pass
+        return state
+
+
+class FileOrganizer:
+    """
+    文件整理执行器：生成计划、执行、崩溃恢复和撤销。
+    """
+
+    def __init__(self, rules: Optional[Dict[str, List[str]]] = None, journal_dir: str = DEFAULT_JOURNAL_DIR,
+                 max_workers: int = DEFAULT_MOVE_WORKERS):
+        """
+        初始化执行器
+
+        Args:
+            rules (Optional[Dict[str, List[str]]]): 分类规则，默认使用 DEFAULT_CATEGORY_RULES
+            journal_dir (str, optional): 日志目录
+            max_workers (int, optional): 并行移动的线程数
+        """
+        self.rules = rules or dict(DEFAULT_CATEGORY_RULES)
+        self.journal_dir = journal_dir
+        self.max_workers = max(1, max_workers)
+
+    def plan(self, path: str, pattern: Optional[str] = None,
+             overrides: Optional[Dict[str, str]] = None) -> List[MoveOp]:
+        """生成整理计划（不修改任何文件）"""
+        return plan_moves(path, self.rules, pattern, overrides)
+
+    def execute(self, plan: List[MoveOp], root: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行计划
+
+        Args:
+            plan (List[MoveOp]): 移动计划
+            root (Optional[str]): 被整理的目录（记录在日志中）
+
+        Returns:
+            Dict[str, Any]: 报告：job_id、moved（[(文件名, 分类)]）、failed（[(文件名, 错误)]）、
+            字节数、耗时、每秒文件数和吞吐量
+        """
+        job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        journal = self._journal(job_id)
+        journal.append({"op": "begin", "root": root, "plan": [op.to_dict() for op in plan]}, sync=True)
+        return self._run(plan, journal)
+
+    def _run(self, plan: List[MoveOp], journal: OrganizeJournal) -> Dict[str, Any]:
+        """用线程池执行移动并写日志，最后写入 commit"""
+        for directory in {os.path.dirname(op.dst) for op in plan}:
+            os.makedirs(directory, exist_ok=True)
+
+        started = time.time()
+        moved, failed = [], []
+        result_lock = threading.Lock()
+
+        def run(op: MoveOp) -> None:
+            try:
+                method = move_file(op.src, op.dst)
+                journal.append({"op": "moved", "src": op.src, "dst": op.dst, "method": method})
+                with result_lock:
+                    moved.append(op)
+            except OSError as e:
+                logger.error(f"移动文件失败 {op.src} -> {op.dst}: {str(e)}")
+                with result_lock:
+                    failed.append((op, str(e)))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="organize") as executor:
+            list(executor.map(run, plan))
+        journal.append({"op": "commit", "moved": len(moved), "failed": len(failed)}, sync=True)
+        journal.close()
+
+        elapsed = time.time() - started
+        moved_bytes = sum(op.size for op in moved)
+        return {
+            "job_id": journal.job_id,
+            "moved": [(os.path.basename(op.src), op.category) for op in moved],
+            "failed": [(os.path.basename(op.src), error) for op, error in failed],
+            "bytes": moved_bytes,
+            "seconds": elapsed,
+            "files_per_second": len(moved) / elapsed if elapsed > 0 else float(len(moved)),
+            "mb_per_second": moved_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0.0
+        }
+
+    def _journal(self, job_id: str) -> OrganizeJournal:
+        return OrganizeJournal(os.path.join(self.journal_dir, f"{job_id}.jsonl"))
+
+    def jobs(self) -> List[str]:
+        """所有批次ID（按时间先后）"""
+        try:
+            return sorted(name[:-6] for name in os.listdir(self.journal_dir) if name.endswith(".jsonl"))
+        except FileNotFoundError:
+            return []
+
+    def incomplete_jobs(self) -> List[str]:
+        """中途中断（没有 commit 也没有撤销）的批次"""
+        result = []
+        for job_id in self.jobs():
+            state = self._journal(job_id).read()
+            if state["plan"] and not state["committed"] and not state["rolled_back"]:
+                result.append(job_id)
+        return result
+
+    def rollback(self, job_id: str) -> Dict[str, Any]:
+        """
+        撤销一个批次：按相反顺序把已移动的文件移回原处，并清理跨设备复制留下的临时文件。
+        中断的批次同样适用。
+
+        Args:
+            job_id (str): 批次ID
+
+        Returns:
+            Dict[str, Any]: 恢复和失败的文件数
+        """
+        journal = self._journal(job_id)
+        state = journal.read()
+        if state["rolled_back"]:
+            return {"job_id": job_id, "restored": 0, "failed": 0}
+        restored, failures = 0, 0
+        for op in state["plan"]:
+            tmp = op.dst + TMP_SUFFIX
+            if op.src not in state["moved"] and os.path.exists(tmp) and os.path.exists(op.src):
+                os.remove(tmp)
+        for src, record in reversed(list(state["moved"].items())):
+            if src in state["undone"]:
+                continue
+            try:
+                move_file(record["dst"], src)
+                journal.append({"op": "undone", "src": src, "dst": record["dst"]})
+                restored += 1
+            except OSError as e:
+                logger.error(f"撤销移动失败 {record['dst']} -> {src}: {str(e)}")
+                failures += 1
+        # 改名成功但日志还没来得及写入的文件：源文件不存在而目标存在
+        for op in state["plan"]:
+            if op.src not in state["moved"] and not os.path.exists(op.src) and os.path.exists(op.dst):
+                try:
+                    move_file(op.dst, op.src)
+                    journal.append({"op": "undone", "src": op.src, "dst": op.dst})
+                    restored += 1
+                except OSError as e:
+                    logger.error(f"撤销移动失败 {op.dst} -> {op.src}: {str(e)}")
+                    failures += 1
+        if not failures:
+            journal.append({"op": "rolled_back"}, sync=True)
+        journal.close()
+        # 删除撤销后变空的分类目录
+        for directory in {os.path.dirname(op.dst) for op in state["plan"]}:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        return {"job_id": job_id, "restored": restored, "failed": failures}
+
+    def resume(self, job_id: str) -> Dict[str, Any]:
+        """
+        继续执行一个中断的批次：跳过已完成的移动，清理临时文件后在同一日志中执行剩余部分
+
+        Args:
+            job_id (str): 批次ID
+
+        Returns:
+            Dict[str, Any]: 剩余部分的执行报告
+        """
+        journal = self._journal(job_id)
+        state = journal.read()
+        remaining = []
+        for op in state["plan"]:
+            if op.src in state["moved"] or not os.path.exists(op.src):
+                continue
+            tmp = op.dst + TMP_SUFFIX
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            remaining.append(op)
+        logger.info(f"继续执行整理批次 {job_id}，剩余 {len(remaining)} 个文件")
+        return self._run(remaining, journal)
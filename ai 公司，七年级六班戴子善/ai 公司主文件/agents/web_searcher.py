@@ -1,6 +1,9 @@
-import requests
+import os
 from bs4 import BeautifulSoup
 from .base_agent import Agent
+from ai_workflow_system import ProjectUtils
+from web_search import DEFAULT_SEARCH_URL, DuckDuckGoBackend, WebSearchPipeline, normalize_url
+from page_fetcher import PageFetcher
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,8 +11,16 @@ logger = logging.getLogger(__name__)
 class WebSearchAgent(Agent):
     """网络搜索员，负责搜索互联网信息"""
     
-    def __init__(self):
+    def __init__(self, backend=None, query_suggester=None, fetcher=None, pages_to_read=3):
         super().__init__("web_searcher", "网络搜索员")
+        # 搜索后端可替换（例如指向 stub_search_server 的 DuckDuckGoBackend）
+        self.pipeline = WebSearchPipeline(backend or DuckDuckGoBackend(
+            os.environ.get("AI_WORKFLOW_SEARCH_URL", DEFAULT_SEARCH_URL)))
+        self.query_suggester = query_suggester or ProjectUtils.suggest_search_queries
+        # 结果页面的正文缓存在磁盘上，重复研究同一主题时不必重新下载
+        self.fetcher = fetcher or PageFetcher(os.environ.get(
+            "AI_WORKFLOW_PAGE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".ai_workflow", "page_cache")))
+        self.pages_to_read = pages_to_read
         self.system_prompt = """你是一位专业的网络搜索员，负责在互联网上查找信息。
 你的任务是：
 1. 分析用户的搜索需求
@@ -18,47 +29,48 @@ class WebSearchAgent(Agent):
 4. 提供信息来源链接"""
 
     def search_web(self, query):
-        """执行网络搜索"""
-        try:
-            # 使用DuckDuckGo搜索API
-            search_url = f"https://api.duckduckgo.com/?q={query}&format=json"
-            response = requests.get(search_url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                results = []
-                
-                # 处理搜索结果
-                for result in data.get('RelatedTopics', [])[:5]:
-                    if 'Text' in result:
-                        results.append({
-                            'title': result.get('Text', '').split(' - ')[0],
-                            'description': result.get('Text', ''),
-                            'url': result.get('FirstURL', '')
-                        })
-                
-                return results
-            else:
-                logger.error(f"搜索请求失败: {response.status_code}")
-                return []
-                
-        except Exception as e:
-            logger.error(f"搜索出错: {str(e)}")
-            return []
+        """执行单条网络搜索"""
+        return self.pipeline.search([query])
+
+    def search_many(self, queries):
+        """并发执行多条搜索，结果按 URL 去重"""
+        return self.pipeline.search(queries)
+
+    def read_pages(self, results, limit=None):
+        """
+        并发抓取前几个搜索结果的页面正文，写回到结果的 content 字段
+
+        Returns:
+            list: 传入的结果列表
+        """
+        targets = [result for result in results if result.get('url')][:limit or self.pages_to_read]
+        by_url = {normalize_url(result['url']): result for result in targets}
+        for page in self.fetcher.fetch_many(result['url'] for result in targets):
+            result = by_url.get(normalize_url(page['url']))
+            if result is not None and page['text']:
+                result['content'] = page['text']
+        return results
 
     def generate_response(self, user_input):
-        """生成搜索响应"""
-        # 执行搜索
-        results = self.search_web(user_input)
+        """生成搜索响应：原始问题加上扩展出的查询建议一起并发搜索"""
+        queries = [user_input]
+        try:
+            queries += self.query_suggester([user_input])
+        except Exception as e:
+            logger.error(f"生成搜索查询建议失败: {str(e)}")
+        results = self.read_pages(self.search_many(queries))
         
         if not results:
             return f'抱歉，我无法找到关于"{user_input}"的搜索结果。请尝试使用不同的关键词。'
         
+        response = f"## 搜索结果: {user_input}\n\n"
         for i, result in enumerate(results, 1):
             response += f"### {i}. {result['title']}\n"
             response += f"{result['description']}\n"
+            if result.get('content'):
+                response += f"\n> {result['content'][:300]}...\n\n"
             if result['url']:
                 response += f"[查看详情]({result['url']})\n"
             response += "\n---\n\n"
         
-        return response
\ No newline at end of file
+        return response
@@ -9,7 +9,25 @@ import sys
 import re
 import webbrowser
 import logging
-from typing import Dict, List, Optional, Union, Any, Tuple
+import heapq
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Union, Any, Tuple
+
+from llm_client import AsyncLLMClient, parse_stream_chunk
+from llm_transport import FirstByteTimeout, LLMTransport
+from metrics import REGISTRY
+from tracing import run_in_context, tracer
+from response_cache import ResponseCache, cache_key_for_payload
+from context_manager import ConversationContext, DEFAULT_TOKEN_BUDGET
+from file_index import FileIndex
+from file_reader import read_text
+from file_search import FileSearch
+from file_metadata_index import FileMetadataIndex
+from workflow_journal import WorkflowJournal
 
 # 配置日志
 logging.basicConfig(
@@ -26,7 +44,152 @@ DEEPSEEK_API_KEY = "sk-hzsahrutepvtipkgejivnxfeyevchbpnvzsaoxuxuehetiaf"
 if not DEEPSEEK_API_KEY:
     raise ValueError("请设置环境变量 DEEPSEEK_API_KEY")
 
-API_URL = "https://api.siliconflow.cn/v1/chat/completions"
+API_URL = os.environ.get("AI_WORKFLOW_API_URL", "https://api.siliconflow.cn/v1/chat/completions")
+
+_llm_transport = None
+_llm_transport_lock = threading.Lock()
+_async_llm_client = None
+_async_llm_client_lock = threading.Lock()
+
+# 响应缓存配置：AI_WORKFLOW_CACHE_DB 设为空字符串时只使用内存缓存
+CACHE_DB_PATH = os.environ.get(
+    "AI_WORKFLOW_CACHE_DB",
+    os.path.join(os.path.expanduser("~"), ".ai_workflow", "llm_cache.sqlite3")
+)
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+# 本地文件检索索引目录：AI_WORKFLOW_FILE_INDEX_DIR 设为空字符串时索引只保存在内存中
+FILE_INDEX_DIR = os.environ.get(
+    "AI_WORKFLOW_FILE_INDEX_DIR",
+    os.path.join(os.path.expanduser("~"), ".ai_workflow", "file_index")
+)
+# 每个 CEO 回合注入的本地文件片段的 token 上限
+FILE_CONTEXT_TOKENS = 2000
+
+# 文件元数据索引：AI_WORKFLOW_METADATA_DB 设为空字符串时使用内存数据库
+METADATA_DB_PATH = os.environ.get(
+    "AI_WORKFLOW_METADATA_DB",
+    os.path.join(os.path.expanduser("~"), ".ai_workflow", "file_metadata.sqlite3")
+)
+_metadata_index = None
+_metadata_index_lock = threading.Lock()
+
+# 工作流日志目录：每个会话的状态增量和快照保存在这里，用于崩溃或重启后恢复；设为空字符串时不记录
+WORKFLOW_JOURNAL_DIR = os.environ.get(
+    "AI_WORKFLOW_JOURNAL_DIR",
+    os.path.join(os.path.expanduser("~"), ".ai_workflow", "journals")
+)
+
+# 大模型调用指标，按智能体ID分组；只在首个增量和回合结束时记录，不逐段计数
+LLM_REQUESTS = REGISTRY.counter(
+    "ai_workflow_llm_requests", "智能体流式请求数（status 为上游状态码、cache、timeout 或 error）",
+    ["agent", "status"])
+LLM_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "ai_workflow_llm_time_to_first_token_seconds", "发出请求到收到第一段增量的时间", ["agent"])
+LLM_DURATION = REGISTRY.histogram(
+    "ai_workflow_llm_request_duration_seconds", "一次流式生成的总耗时", ["agent"])
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "ai_workflow_llm_tokens_per_second", "首个增量之后的生成速度", ["agent"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300))
+LLM_TOKENS = REGISTRY.counter(
+    "ai_workflow_llm_tokens", "上游报告的 token 用量（kind 为 prompt 或 completion）", ["agent", "kind"])
+
+
+def _llm_status(error: Exception) -> str:
+    """失败请求的状态标签：有状态码时为状态码，否则为 timeout 或 error"""
+    status = getattr(error, 'status_code', None) or getattr(error, 'status', None)
+    if status:
+        return str(status)
+    if isinstance(error, (FirstByteTimeout, requests.exceptions.Timeout)):
+        return "timeout"
+    return "error"
+
+
+def get_llm_transport() -> LLMTransport:
+    """
+    获取共享的大模型传输层（超时、重试、熔断与调用统计）。
+
+    Returns:
+        LLMTransport: 传输层实例
+    """
+    global _llm_transport
+    if _llm_transport is None:
+        with _llm_transport_lock:
+            if _llm_transport is None:
+                _llm_transport = LLMTransport(API_URL, DEEPSEEK_API_KEY)
+    return _llm_transport
+
+
+def get_async_llm_client() -> AsyncLLMClient:
+    """
+    获取共享的异步大模型客户端（所有智能体共用一个连接池，重试和熔断与同步路径共用同一个传输层）。
+
+    Returns:
+        AsyncLLMClient: 异步客户端
+    """
+    global _async_llm_client
+    if _async_llm_client is None:
+        with _async_llm_client_lock:
+            if _async_llm_client is None:
+                _async_llm_client = AsyncLLMClient(API_URL, DEEPSEEK_API_KEY, transport=get_llm_transport())
+    return _async_llm_client
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    获取共享的两级响应缓存（内存 LRU + SQLite）。
+
+    Returns:
+        ResponseCache: 缓存实例
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(db_path=CACHE_DB_PATH or None)
+    return _response_cache
+
+
+def get_metadata_index() -> FileMetadataIndex:
+    """
+    获取共享的文件元数据索引（SQLite，按目录 mtime 增量刷新）。
+
+    Returns:
+        FileMetadataIndex: 索引实例
+    """
+    global _metadata_index
+    if _metadata_index is None:
+        with _metadata_index_lock:
+            if _metadata_index is None:
+                _metadata_index = FileMetadataIndex(db_path=METADATA_DB_PATH or None)
+    return _metadata_index
+
+
+def cached_completion(payload: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+    """
+    发送非流式请求，相同的 (model, messages, temperature, max_tokens) 直接返回缓存结果。
+
+    Args:
+        payload (Dict[str, Any]): 请求体
+        use_cache (bool, optional): 是否使用缓存
+
+    Returns:
+        Dict[str, Any]: 接口返回的 JSON
+    """
+    if not use_cache:
+        return get_llm_transport().post_json(payload)
+
+    cache = get_response_cache()
+    key = cache_key_for_payload(payload)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    json_response = get_llm_transport().post_json(payload)
+    if json_response.get('choices'):
+        cache.set(key, json_response)
+    return json_response
 
 # ============ 项目工具函数 ============
 
@@ -34,20 +197,17 @@ class ProjectUtils:
     """项目工具类，提供项目创建和搜索相关功能"""
     
     @staticmethod
-    def generate_ai_project_name(user_request: str) -> str:
+    def generate_ai_project_name(user_request: str, use_cache: bool = True) -> str:
         """
         使用 DeepSeek API 智能生成项目名称。
 
         Args:
             user_request (str): 用户的初始创作需求，作为生成项目名称的上下文。
+            use_cache (bool, optional): 相同需求是否直接使用缓存的名称。默认为 True。
 
         Returns:
             str: AI 生成的项目名称。如果生成失败，则返回 "default_project_name"。
         """
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
         system_prompt = """您是一个专业的命名专家，擅长根据用户提供的项目描述，创作富有创意、привлекательным 和容易记住的项目名称。请根据用户的创作需求，生成一个不超过 15 个字的项目名称。名称应该简洁明了，能够准确概括项目的主题或内容，并且有一定的吸引力。"""
 
         messages = [
@@ -63,10 +223,7 @@ class ProjectUtils:
         }
 
         try:
-            response = requests.post(API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-
-            json_response = response.json()
+            json_response = cached_completion(payload, use_cache=use_cache)
             if 'choices' in json_response and json_response['choices']:
                 project_name = json_response['choices'][0]['message']['content'].strip()
                 project_name = project_name.strip()[:30]
@@ -83,9 +240,6 @@ class ProjectUtils:
         except requests.exceptions.RequestException as e:
             logger.error(f"API 请求失败，无法生成项目名称，错误信息: {e}，将使用默认名称 'default_project_name'。用户需求：{user_request}")
             return "default_project_name"
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析错误，无法解析项目名称，错误信息: {e}，将使用默认名称 'default_project_name'。API 响应内容：{response.text}")
-            return "default_project_name"
 
     @staticmethod
     def create_project_folder(user_request: str, base_path=None) -> str:
@@ -115,20 +269,17 @@ class ProjectUtils:
             return None
 
     @staticmethod
-    def suggest_search_queries(keywords: List[str]) -> List[str]:
+    def suggest_search_queries(keywords: List[str], use_cache: bool = True) -> List[str]:
         """
         使用 DeepSeek API 智能生成更丰富的搜索查询建议。
         
         Args:
             keywords (List[str]): 关键词列表
+            use_cache (bool, optional): 相同关键词是否直接使用缓存的建议。默认为 True。
             
         Returns:
             List[str]: 搜索查询建议列表
         """
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
         system_prompt = """您是一个专业的搜索查询专家，擅长根据关键词列表，生成更丰富、更有效的搜索查询建议。请针对以下关键词，生成 3-5 条不同的搜索查询，以便用户更有效地在互联网上找到相关信息。查询建议应该具体、实用，并覆盖关键词的不同方面。"""
 
         query_prompt = "关键词列表: " + ", ".join(keywords) + "\n\n请生成搜索查询建议 (每行一条):"
@@ -147,9 +298,7 @@ class ProjectUtils:
 
         search_queries = []
         try:
-            response = requests.post(API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            json_response = response.json()
+            json_response = cached_completion(payload, use_cache=use_cache)
             if 'choices' in json_response and json_response['choices']:
                 suggestions_text = json_response['choices'][0]['message']['content'].strip()
                 search_queries = [line.strip() for line in suggestions_text.splitlines() if line.strip()]
@@ -164,9 +313,6 @@ class ProjectUtils:
         except requests.exceptions.RequestException as e:
             logger.error(f"API 请求失败，无法生成搜索查询建议，错误信息: {e}，将使用默认示例查询。关键词: {keywords}")
             return [f"在浏览器中搜索： {keyword}" for keyword in keywords]
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析错误，无法解析搜索查询建议，错误信息: {e}，将使用默认示例查询。API 响应内容: {response.text}")
-            return [f"在浏览器中搜索： {keyword}" for keyword in keywords]
 
     @staticmethod
     def suggest_urls_for_queries(search_queries: List[str]) -> List[str]:
@@ -206,100 +352,238 @@ class Agent:
     """
     Agent 类，代表一个具有特定角色和系统提示的智能体。
     """
-    def __init__(self, name: str, system_prompt: str):
+    def __init__(self, name: str, system_prompt: str, use_cache: bool = False):
         """
         初始化 Agent 对象。
 
         Args:
             name (str): Agent 的名称。
             system_prompt (str): Agent 的系统提示，用于指导其行为。
+            use_cache (bool, optional): 是否缓存回复，相同提示直接重放（用于测试和重跑）。默认为 False。
         """
         self.name = name
         self.system_prompt = system_prompt
-        self.conversation_history = []
+        self.use_cache = use_cache
+        # 对话记录统一保存在 WorkflowManager.context 中（有条数上限并会滚动摘要），这里只保留最近一次回复
+        self.last_response = ""
+        # 指标标签，由 WorkflowManager 设置为智能体ID
+        self.agent_id = name
 
-    def generate_response(self, user_input: str) -> str:
+    def _build_payload(self, user_input: str) -> Dict[str, Any]:
         """
-        调用 DeepSeek API 生成回复。
+        构造流式请求体
 
         Args:
             user_input (str): 用户输入的内容。
 
         Returns:
-            str: Agent 生成的完整回复文本，或错误标识。
+            Dict[str, Any]: 请求体
         """
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
         messages = [
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": user_input}
         ]
 
-        payload = {
+        return {
             "model": "Pro/deepseek-ai/DeepSeek-V3",
             "messages": messages,
             "stream": True,
             "temperature": 0.7
         }
 
-        full_response = ""
+    def _on_delta(self, content: str) -> None:
+        """处理每段增量内容（控制台输出与实时提及检测）"""
+        print(content, end='', flush=True)
+        if self.name == "首席执行官":
+            mentions = AgentUtils.parse_mentions_realtime(content)
+            if mentions:
+                AgentUtils.display_popup(mentions)
+
+    def _finish_turn(self, user_input: str, full_response: str) -> None:
+        """记录完整回复"""
+        self.last_response = full_response
+
+    def _cached_reply(self, payload: Dict[str, Any]) -> Optional[str]:
+        """开启缓存时查询相同提示的历史回复"""
+        if not self.use_cache:
+            return None
+        return get_response_cache().get(cache_key_for_payload(payload))
+
+    def _store_reply(self, payload: Dict[str, Any], full_response: str) -> None:
+        """开启缓存时保存完整回复"""
+        if self.use_cache and full_response:
+            get_response_cache().set(cache_key_for_payload(payload), full_response)
+
+    def _record_metrics(self, status: str, started: float, first_token_at: Optional[float],
+                        chunk_count: int, usage: Dict[str, Any]) -> None:
+        """
+        记录一次流式生成的指标和追踪时间段（含首个增量事件）
+
+        Args:
+            status (str): 状态标签
+            started (float): 发出请求的时间（time.monotonic）
+            first_token_at (Optional[float]): 收到第一段增量的时间，没有收到时为None
+            chunk_count (int): 收到的增量段数，上游没有报告 completion_tokens 时作为近似值
+            usage (Dict[str, Any]): 上游报告的用量统计
+        """
+        finished = time.monotonic()
+        completion_tokens = usage.get('completion_tokens') or chunk_count
+        tracer.complete("llm.generate_response", started, finished, category="llm", agent=self.agent_id,
+                        status=status, completion_tokens=completion_tokens)
+        LLM_REQUESTS.inc(self.agent_id, status)
+        LLM_DURATION.observe(self.agent_id, value=finished - started)
+        if first_token_at is None:
+            return
+        tracer.instant("llm.first_token", at=first_token_at, category="llm", agent=self.agent_id)
+        LLM_TIME_TO_FIRST_TOKEN.observe(self.agent_id, value=first_token_at - started)
+        if finished > first_token_at:
+            LLM_TOKENS_PER_SECOND.observe(self.agent_id, value=completion_tokens / (finished - first_token_at))
+        LLM_TOKENS.inc(self.agent_id, "completion", amount=completion_tokens)
+        if usage.get('prompt_tokens'):
+            LLM_TOKENS.inc(self.agent_id, "prompt", amount=usage['prompt_tokens'])
+
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """
+        调用 DeepSeek API 流式生成回复，每收到一段增量内容就立即产出。
+
+        生成结束后，完整回复文本保存在 ``self.last_response`` 中；
+        如果请求失败，``self.last_response`` 为 "[API_ERROR]"，且不会产出任何内容。
+
+        Args:
+            user_input (str): 用户输入的内容。
+
+        Yields:
+            str: 上游返回的增量文本。
+        """
+        payload = self._build_payload(user_input)
+
+        self.last_response = ""
+        cached = self._cached_reply(payload)
+        if cached is not None:
+            LLM_REQUESTS.inc(self.agent_id, "cache")
+            tracer.instant("llm.cache_hit", category="llm", agent=self.agent_id)
+            yield cached
+            self._finish_turn(user_input, cached)
+            return
+
+        chunks = []
+        usage = {}
+        started = time.monotonic()
+        first_token_at = None
         try:
-            response = requests.post(API_URL, headers=headers, json=payload, stream=True)
-            response.raise_for_status()
-
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        decoded_line = line.decode('utf-8').strip()
-                        if decoded_line.startswith('data:'):
-                            json_str = decoded_line[5:].strip()
-                            if json_str == "[DONE]":
-                                continue
-                            try:
-                                json_data = json.loads(json_str)
-                                if 'choices' in json_data and json_data['choices']:
-                                    content = json_data['choices'][0]['delta'].get('content', '')
-                                    print(content, end='', flush=True)
-                                    full_response += content
-
-                                    if self.name == "首席执行官":
-                                        mentions = AgentUtils.parse_mentions_realtime(content)
-                                        if mentions:
-                                            AgentUtils.display_popup(mentions)
-
-                            except json.JSONDecodeError as e:
-                                logger.error(f"解析 JSON 失败: {e}")
-                                continue
-                    except Exception as e:
-                        logger.error(f"处理数据流时发生错误: {e}")
-                        continue
+            for line in get_llm_transport().stream_lines(payload):
+                try:
+                    content, line_usage = parse_stream_chunk(line)
+                except Exception as e:
+                    logger.error(f"处理数据流时发生错误: {e}")
+                    continue
+                if line_usage:
+                    usage = line_usage
+                if content:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    self._on_delta(content)
+                    chunks.append(content)
+                    yield content
             print("\n")
 
-            # 保存对话历史
-            self.conversation_history.append({
-                "role": "user",
-                "content": user_input
-            })
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": full_response
-            })
-
         except requests.exceptions.RequestException as e:
             logger.error(f"API 请求失败: {e}")
-            return "[API_ERROR]"
+            self._record_metrics(_llm_status(e), started, first_token_at, len(chunks), usage)
+            self.last_response = "[API_ERROR]"
+            return
+
+        self._record_metrics("200", started, first_token_at, len(chunks), usage)
+        full_response = "".join(chunks)
+        self._store_reply(payload, full_response)
+        self._finish_turn(user_input, full_response)
+
+    def generate_response(self, user_input: str) -> str:
+        """
+        调用 DeepSeek API 生成回复（阻塞直到生成结束）。
+
+        Args:
+            user_input (str): 用户输入的内容。
+
+        Returns:
+            str: Agent 生成的完整回复文本，或错误标识。
+        """
+        for _ in self.stream_response(user_input):
+            pass
+        return self.last_response
+
+    async def astream_response(self, user_input: str,
+                               client: Optional[AsyncLLMClient] = None) -> AsyncIterator[str]:
+        """
+        stream_response 的异步版本，通过共享连接池的异步客户端流式生成回复。
+
+        Args:
+            user_input (str): 用户输入的内容。
+            client (Optional[AsyncLLMClient]): 异步客户端，默认使用共享客户端。
+
+        Yields:
+            str: 上游返回的增量文本。
+        """
+        client = client or get_async_llm_client()
+        payload = self._build_payload(user_input)
+        self.last_response = ""
+        cached = self._cached_reply(payload)
+        if cached is not None:
+            LLM_REQUESTS.inc(self.agent_id, "cache")
+            tracer.instant("llm.cache_hit", category="llm", agent=self.agent_id)
+            yield cached
+            self._finish_turn(user_input, cached)
+            return
+
+        chunks = []
+        usage = {}
+        started = time.monotonic()
+        first_token_at = None
+        try:
+            async for content in client.stream_chat(payload, usage=usage):
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                self._on_delta(content)
+                chunks.append(content)
+                yield content
+        except Exception as e:
+            logger.error(f"API 请求失败: {e}")
+            self._record_metrics(_llm_status(e), started, first_token_at, len(chunks), usage)
+            self.last_response = "[API_ERROR]"
+            return
+
+        self._record_metrics("200", started, first_token_at, len(chunks), usage)
+        full_response = "".join(chunks)
+        self._store_reply(payload, full_response)
+        self._finish_turn(user_input, full_response)
+
+    async def agenerate_response(self, user_input: str,
+                                 client: Optional[AsyncLLMClient] = None) -> str:
+        """
+        generate_response 的异步版本。
+
+        Args:
+            user_input (str): 用户输入的内容。
+            client (Optional[AsyncLLMClient]): 异步客户端，默认使用共享客户端。
 
-        return full_response
+        Returns:
+            str: Agent 生成的完整回复文本，或错误标识。
+        """
+        async for _ in self.astream_response(user_input, client=client):
+            pass
+        return self.last_response
 
 
 class Task:
     """
     任务类，表示待办事项列表中的一个任务项。
     """
-    def __init__(self, agent: str, description: str, status: str = "待处理"):
+    __slots__ = ("task_id", "agent", "description", "status", "priority",
+                 "depends_on", "created_at", "completed_at")
+
+    def __init__(self, agent: str, description: str, status: str = "待处理",
+                 task_id: Optional[int] = None, priority: int = 0,
+                 depends_on: Optional[List[int]] = None):
         """
         初始化任务对象
         
@@ -307,19 +591,28 @@ class Task:
             agent (str): 负责任务的智能体名称
             description (str): 任务描述
             status (str, optional): 任务状态。默认为"待处理"
+            task_id (Optional[int]): 稳定的任务编号，由 TodoList 分配
+            priority (int, optional): 优先级，数值越大越先执行。默认为 0
+            depends_on (Optional[List[int]]): 依赖的任务编号列表
         """
+        self.task_id = task_id
         self.agent = agent
         self.description = description
         self.status = status
+        self.priority = priority
+        self.depends_on = tuple(depends_on or ())
         self.created_at = AgentUtils.get_current_timestamp()
         self.completed_at = None
         
     def to_dict(self) -> Dict[str, Any]:
         """将任务转换为字典格式"""
         return {
+            "task_id": self.task_id,
             "agent": self.agent,
             "description": self.description,
             "status": self.status,
+            "priority": self.priority,
+            "depends_on": list(self.depends_on),
             "created_at": self.created_at,
             "completed_at": self.completed_at
         }
@@ -331,11 +624,14 @@ class Task:
         
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Task':
-        """从字典创建任务对象"""
+        """从字典创建任务对象（兼容没有 task_id、priority、depends_on 的旧数据）"""
         task = cls(
             agent=data["agent"],
             description=data["description"],
-            status=data.get("status", "待处理")
+            status=data.get("status", "待处理"),
+            task_id=data.get("task_id"),
+            priority=data.get("priority", 0),
+            depends_on=data.get("depends_on")
         )
         task.created_at = data.get("created_at", AgentUtils.get_current_timestamp())
         task.completed_at = data.get("completed_at")
@@ -345,94 +641,281 @@ class Task:
 class TodoList:
     """
     待办事项列表类，管理工作流中的任务。
+
+    任务使用稳定编号寻址（移除已完成任务后编号不变），并维护按智能体和按状态的索引；
+    每个智能体的待处理任务放在按优先级排序的堆中，支持任务间依赖和拓扑排序调度。
+    已归档的历史任务有数量上限，超出部分可追加写入归档文件。
     """
-    def __init__(self):
-        """初始化待办事项列表"""
-        self.tasks = []  # 修复这里的缩进错误
-        self.task_history = []
-        
-    def add_task(self, agent: str, description: str) -> None:
+    PENDING = "待处理"
+    DONE = "已完成"
+
+    def __init__(self, history_limit: int = 200, archive_path: Optional[str] = None):
+        """
+        初始化待办事项列表
+
+        Args:
+            history_limit (int, optional): 内存中保留的历史任务数上限，0 表示不限制。默认为 200
+            archive_path (Optional[str]): 超出上限的历史任务追加写入的 JSON Lines 文件
+        """
+        self._tasks: Dict[int, Task] = {}
+        self._by_agent: Dict[str, Dict[int, None]] = {}
+        self._by_status: Dict[str, Dict[int, None]] = {}
+        self._agent_heaps: Dict[str, List[Tuple[int, int]]] = {}
+        self._completed_ids = set()
+        self._next_id = 1
+        self.history_limit = history_limit
+        self.archive_path = archive_path
+        self.task_history = deque(maxlen=history_limit or None)
+        self.archived_count = 0
+
+    @property
+    def tasks(self) -> List[Task]:
+        """当前活跃任务（按创建顺序）"""
+        return list(self._tasks.values())
+
+    def get_task(self, task_id: int) -> Optional[Task]:
+        """按编号获取活跃任务"""
+        return self._tasks.get(task_id)
+
+    def _index(self, task: Task) -> None:
+        """将任务加入各索引"""
+        self._tasks[task.task_id] = task
+        self._by_agent.setdefault(task.agent, {})[task.task_id] = None
+        self._by_status.setdefault(task.status, {})[task.task_id] = None
+        if task.status == self.PENDING:
+            heapq.heappush(self._agent_heaps.setdefault(task.agent, []), (-task.priority, task.task_id))
+        elif task.status == self.DONE:
+            self._completed_ids.add(task.task_id)
+
+    def _unindex(self, task: Task) -> None:
+        """将任务移出各索引（堆中的条目惰性删除）"""
+        self._tasks.pop(task.task_id, None)
+        self._by_agent.get(task.agent, {}).pop(task.task_id, None)
+        self._by_status.get(task.status, {}).pop(task.task_id, None)
+
+    def _set_status(self, task: Task, status: str) -> None:
+        """更新任务状态并同步状态索引"""
+        self._by_status.get(task.status, {}).pop(task.task_id, None)
+        if status == self.DONE:
+            task.complete()
+            self._completed_ids.add(task.task_id)
+        else:
+            task.status = status
+        self._by_status.setdefault(task.status, {})[task.task_id] = None
+
+    def add_task(self, agent: str, description: str, priority: int = 0,
+                 depends_on: Optional[List[int]] = None) -> Task:
         """
         添加新任务到待办事项列表
         
         Args:
             agent (str): 负责任务的智能体名称
             description (str): 任务描述
+            priority (int, optional): 优先级，数值越大越先执行。默认为 0
+            depends_on (Optional[List[int]]): 依赖的任务编号，必须是已存在的任务
+
+        Returns:
+            Task: 新建的任务
         """
-        self.tasks.append(Task(agent, description))
-        logger.info(f"已添加新任务给 {agent}: {description}")
+        depends_on = [task_id for task_id in (depends_on or [])
+                      if task_id in self._tasks or task_id in self._completed_ids]
+        task = Task(agent, description, task_id=self._next_id, priority=priority, depends_on=depends_on)
+        self._next_id += 1
+        self._index(task)
+        logger.info(f"已添加新任务 #{task.task_id} 给 {agent}: {description}")
+        return task
         
-    def complete_task(self, index: int) -> bool:
+    def complete_task(self, task_id: int) -> bool:
         """
-        将指定索引的任务标记为已完成
+        将指定编号的任务标记为已完成
         
         Args:
-            index (int): 任务索引
+            task_id (int): 任务编号
             
         Returns:
             bool: 操作是否成功
         """
-        if 0 <= index < len(self.tasks):
-            self.tasks[index].complete()
-            logger.info(f"已将任务 #{index+1} 标记为完成: {self.tasks[index].description}")
+        task = self._tasks.get(task_id)
+        if task is not None:
+            self._set_status(task, self.DONE)
+            logger.info(f"已将任务 #{task_id} 标记为完成: {task.description}")
             return True
-        logger.warning(f"无法完成任务: 索引 {index} 超出范围")
+        logger.warning(f"无法完成任务: 编号 {task_id} 不存在")
         return False
         
     def remove_completed_tasks(self) -> List[Task]:
         """
-        移除所有已完成的任务，并返回它们
+        移除所有已完成的任务，将其移入历史记录，并返回它们
         
         Returns:
             List[Task]: 已完成的任务列表
         """
-        completed = [task for task in self.tasks if task.status == "已完成"]
-        self.task_history.extend(completed)
-        self.tasks = [task for task in self.tasks if task.status != "已完成"]
+        completed = [self._tasks[task_id] for task_id in self._by_status.get(self.DONE, {})]
+        for task in completed:
+            self._unindex(task)
+            self._append_history(task)
         logger.info(f"已移除 {len(completed)} 个已完成的任务")
         return completed
+
+    @property
+    def history_total(self) -> int:
+        """累计移入历史的任务数（包括已归档的），用于计算增量"""
+        return self.archived_count + len(self.task_history)
+
+    def history_since(self, total: int) -> List[Task]:
+        """累计数为 total 之后新移入历史的任务"""
+        added = min(self.history_total - total, len(self.task_history))
+        return list(self.task_history)[-added:] if added > 0 else []
+
+    def apply_delta(self, active_tasks: List[Dict[str, Any]], history_added: List[Dict[str, Any]],
+                    next_task_id: int) -> None:
+        """
+        应用一条日志增量：追加新的历史任务，并用增量中的活跃任务替换当前的活跃任务
+
+        Args:
+            active_tasks (List[Dict[str, Any]]): 全部活跃任务
+            history_added (List[Dict[str, Any]]): 新移入历史的任务
+            next_task_id (int): 下一个任务编号
+        """
+        for task_data in history_added:
+            task = Task.from_dict(task_data)
+            self._append_history(task)
+            if task.status == self.DONE:
+                self._completed_ids.add(task.task_id)
+        self._tasks, self._by_agent, self._by_status, self._agent_heaps = {}, {}, {}, {}
+        for task_data in active_tasks:
+            self._index(Task.from_dict(task_data))
+        self._next_id = max(self._next_id, next_task_id)
+
+    def _append_history(self, task: Task) -> None:
+        """写入历史记录，超过上限的最早记录归档到文件"""
+        if self.history_limit and len(self.task_history) >= self.history_limit:
+            self._archive(self.task_history[0])
+        self.task_history.append(task)
+
+    def _archive(self, task: Task) -> None:
+        """将历史任务追加写入归档文件"""
+        self.archived_count += 1
+        if not self.archive_path:
+            return
+        try:
+            with open(self.archive_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(task.to_dict(), ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"无法归档历史任务 #{task.task_id}: {e}")
+
+    def is_ready(self, task: Task) -> bool:
+        """任务的所有依赖是否均已完成"""
+        return all(task_id in self._completed_ids for task_id in task.depends_on)
         
     def find_task_for_agent(self, agent: str) -> Optional[int]:
         """
-        查找指定智能体的待处理任务
+        查找指定智能体优先级最高、且依赖已满足的待处理任务
         
         Args:
             agent (str): 智能体名称
             
         Returns:
-            Optional[int]: 任务索引，如果没有找到则返回None
+            Optional[int]: 任务编号，如果没有找到则返回None
+        """
+        heap = self._agent_heaps.get(agent)
+        if not heap:
+            return None
+        blocked = []
+        found = None
+        while heap:
+            entry = heap[0]
+            task = self._tasks.get(entry[1])
+            if task is None or task.status != self.PENDING:
+                heapq.heappop(heap)  # 惰性删除已完成或已移除的任务
+                continue
+            if self.is_ready(task):
+                found = task.task_id
+                break
+            blocked.append(heapq.heappop(heap))
+        for entry in blocked:
+            heapq.heappush(heap, entry)
+        return found
+
+    def tasks_for_agent(self, agent: str) -> List[Task]:
+        """指定智能体的所有活跃任务"""
+        return [self._tasks[task_id] for task_id in self._by_agent.get(agent, {})]
+
+    def tasks_with_status(self, status: str) -> List[Task]:
+        """指定状态的所有活跃任务"""
+        return [self._tasks[task_id] for task_id in self._by_status.get(status, {})]
+
+    def schedule(self) -> List[Task]:
+        """
+        按依赖关系的拓扑顺序排列所有待处理任务，同一层级内优先级高、编号小的在前
+
+        Returns:
+            List[Task]: 调度顺序
         """
-        for i, task in enumerate(self.tasks):
-            if task.agent == agent and task.status == "待处理":
-                return i
-        return None
+        pending = {task.task_id: task for task in self.tasks_with_status(self.PENDING)}
+        waiting = {task_id: sum(1 for dep in task.depends_on if dep in pending)
+                   for task_id, task in pending.items()}
+        dependents: Dict[int, List[int]] = {}
+        for task_id, task in pending.items():
+            for dep in task.depends_on:
+                if dep in pending:
+                    dependents.setdefault(dep, []).append(task_id)
+
+        heap = [(-pending[task_id].priority, task_id) for task_id, count in waiting.items() if count == 0]
+        heapq.heapify(heap)
+        order = []
+        while heap:
+            _, task_id = heapq.heappop(heap)
+            order.append(pending[task_id])
+            for child in dependents.get(task_id, []):
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    heapq.heappush(heap, (-pending[child].priority, child))
+        return order
+
+    def ready_tasks(self) -> List[Task]:
+        """依赖已全部完成、可以立即执行的待处理任务（按调度顺序）"""
+        return [task for task in self.schedule() if self.is_ready(task)]
         
     def display(self) -> None:
         """打印待办事项列表"""
-        if not self.tasks:
+        if not self._tasks:
             print("\n---- To-Do List (空) ----\n")
             return
 
         print("\n---- To-Do List ----")
         print("| 任务 # | 指派给 | 任务描述                     | 状态     |")
         print("|------|--------|--------------------------|----------|")
-        for index, task in enumerate(self.tasks):
-            print(f"| {index+1:<6} | {task.agent:<6} | {task.description:<24} | {task.status:<8} |")
+        for task in self._tasks.values():
+            print(f"| {task.task_id:<6} | {task.agent:<6} | {task.description:<24} | {task.status:<8} |")
         print("--------------------\n")
     
     def to_dict(self) -> Dict[str, Any]:
         """将待办事项列表转换为字典格式"""
         return {
-            "active_tasks": [task.to_dict() for task in self.tasks],
-            "task_history": [task.to_dict() for task in self.task_history]
+            "active_tasks": [task.to_dict() for task in self._tasks.values()],
+            "task_history": [task.to_dict() for task in self.task_history],
+            "next_task_id": self._next_id
         }
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'TodoList':
-        """从字典创建待办事项列表对象"""
+        """从字典创建待办事项列表对象（兼容没有任务编号的旧数据，按顺序补齐编号）"""
         todo_list = cls()
-        todo_list.tasks = [Task.from_dict(task_data) for task_data in data.get("active_tasks", [])]
-        todo_list.task_history = [Task.from_dict(task_data) for task_data in data.get("task_history", [])]
+        history = [Task.from_dict(task_data) for task_data in data.get("task_history", [])]
+        active = [Task.from_dict(task_data) for task_data in data.get("active_tasks", [])]
+        next_id = max([task.task_id for task in history + active if task.task_id is not None] + [0]) + 1
+        for task in history + active:
+            if task.task_id is None:
+                task.task_id = next_id
+                next_id += 1
+        todo_list._next_id = max(next_id, data.get("next_task_id", 0))
+        for task in history:
+            todo_list.task_history.append(task)
+            if task.status == cls.DONE:
+                todo_list._completed_ids.add(task.task_id)
+        for task in active:
+            todo_list._index(task)
         return todo_list
 
 
@@ -530,7 +1013,7 @@ class AgentUtils:
     @staticmethod
     def read_file_content(file_path: str) -> str:
         """
-        读取本地文件内容 (目前只支持文本文件)。
+        读取本地文件内容，自动识别编码；大文件只读取开头一段，二进制文件返回说明文字。
         
         Args:
             file_path (str): 文件路径
@@ -539,9 +1022,7 @@ class AgentUtils:
             str: 文件内容，如果读取失败则返回空字符串
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                return content
+            return read_text(file_path)
         except Exception as e:
             logger.error(f"无法读取文件: {file_path}, 错误信息: {e}")
             return ""
@@ -612,54 +1093,39 @@ class SystemAccessManager:
             return {'error': str(e)}
             
     def browse_files(self, path: str = '/') -> List[Dict[str, Any]]:
-        """浏览文件系统"""
+        """浏览文件系统（目录未变化时直接从元数据索引返回）"""
         try:
-            items = []
-            for item in os.listdir(path):
-                full_path = os.path.join(path, item)
-                stat = os.stat(full_path)
-                items.append({
-                    'name': item,
-                    'path': full_path,
-                    'size': stat.st_size,
-                    'modified': stat.st_mtime,
-                    'type': 'directory' if os.path.isdir(full_path) else 'file'
-                })
-            return items
+            return get_metadata_index().list_directory(path)
         except Exception as e:
             logger.error(f"浏览文件系统失败: {e}")
             return []
             
-    def search_files(self, pattern: str, path: str = '/') -> List[str]:
-        """搜索文件"""
+    def search_files(self, pattern: str, path: str = '/', **options) -> List[str]:
+        """搜索文件名包含 pattern 的文件（并行遍历，跳过伪文件系统和被忽略的目录，结果数有上限）"""
         try:
-            result = []
-            for root, dirs, files in os.walk(path):
-                for name in files:
-                    if pattern in name:
-                        full_path = os.path.join(root, name)
-                        result.append(full_path)
-                        self.accessed_files.append({
-                            'path': full_path,
-                            'operation': 'search',
-                            'timestamp': AgentUtils.get_current_timestamp()
-                        })
+            result = [item['path'] for item in FileSearch(path, pattern, **options).iter_results()]
+            self.accessed_files.append({
+                'path': path,
+                'operation': 'search',
+                'pattern': pattern,
+                'matches': len(result),
+                'timestamp': AgentUtils.get_current_timestamp()
+            })
             return result
         except Exception as e:
             logger.error(f"搜索文件失败: {e}")
             return []
             
     def read_file(self, path: str) -> Optional[str]:
-        """读取文件内容"""
+        """读取文件内容（有长度上限，超出部分截断）"""
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                self.accessed_files.append({
-                    'path': path,
-                    'operation': 'read',
-                    'timestamp': AgentUtils.get_current_timestamp()
-                })
-                return content
+            content = read_text(path)
+            self.accessed_files.append({
+                'path': path,
+                'operation': 'read',
+                'timestamp': AgentUtils.get_current_timestamp()
+            })
+            return content
         except Exception as e:
             logger.error(f"读取文件失败: {e}")
             return None
@@ -697,12 +1163,19 @@ class SystemAccessManager:
 
 # 修改 WorkflowManager 类，添加系统访问管理器
 class WorkflowManager:
-    def __init__(self, initial_request: str):
+    # CEO 同一回合点名多个时可以并行执行的智能体（彼此不依赖对方的产出）
+    PARALLEL_AGENTS = ("writer", "programmer")
+
+    def __init__(self, initial_request: str, parallel_mode: bool = False, max_parallel_agents: int = 3,
+                 context_token_budget: int = DEFAULT_TOKEN_BUDGET):
         """
         初始化工作流管理器
         
         Args:
             initial_request (str): 用户的初始请求
+            parallel_mode (bool, optional): CEO 同时点名多个独立智能体时是否并行执行。默认为 False。
+            max_parallel_agents (int, optional): 并行执行的最大智能体数。默认为 3。
+            context_token_budget (int, optional): 每个智能体输入的 token 预算。
         """
         self.initial_request = initial_request
         self.agents = self._create_agents()
@@ -713,6 +1186,16 @@ class WorkflowManager:
         self.workflow_active = True
         self.project_folder_path = None
         self.local_file_paths = []
+        self.file_index: Optional[FileIndex] = None
+        self.parallel_mode = parallel_mode
+        self.max_parallel_agents = max(1, max_parallel_agents)
+        self.pending_parallel_agents: List[str] = []
+        self.parallel_handoff_agent = "ceo"
+        self.context = ConversationContext(token_budget=context_token_budget)
+        self.context.add_turn("user", initial_request)
+        # 状态日志（enable_journal 后启用），每个回合追加一条增量
+        self.journal: Optional[WorkflowJournal] = None
+        self._journaled_history_total = 0
         # 添加系统访问管理器
         self.system_access = SystemAccessManager()  # 添加系统访问管理器
         
@@ -728,6 +1211,8 @@ class WorkflowManager:
             
         local_file_path = input("\n请输入 CEO 可以访问的本地文件路径 (可以是文件或文件夹，多个路径请用逗号分隔，留空则不使用本地文件): ").strip()
         self.local_file_paths = [path.strip() for path in local_file_path.split(',') if path.strip()]
+        self.file_index = None
+        self.checkpoint()
         
         if self.local_file_paths:
             print("\n[提示] CEO 将会尝试访问以下本地文件/文件夹：")
@@ -735,44 +1220,196 @@ class WorkflowManager:
                 print(f"- {path}")
             print("\n请确保这些路径是您授权允许访问的，并且只包含您希望 CEO 了解的信息。\n")
     
-    def get_local_file_context(self) -> str:
+    def get_file_index(self) -> FileIndex:
+        """
+        获取本地文件的检索索引（按路径集合持久化，同一组路径在多次运行间复用）
+        
+        Returns:
+            FileIndex: 检索索引
+        """
+        if self.file_index is None:
+            index_path = None
+            if FILE_INDEX_DIR:
+                key = "\n".join(sorted(os.path.abspath(path) for path in self.local_file_paths))
+                index_path = os.path.join(FILE_INDEX_DIR, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json")
+            self.file_index = FileIndex(index_path)
+        return self.file_index
+    
+    @tracer.traced("get_local_file_context")
+    def get_local_file_context(self, query: Optional[str] = None) -> str:
         """
-        读取本地文件内容并格式化为上下文字符串
+        检索与当前回合最相关的本地文件片段，并格式化为上下文字符串
+        
+        Args:
+            query (Optional[str]): 检索查询，默认使用当前输入
         
         Returns:
-            str: 格式化的本地文件内容
+            str: 格式化的本地文件片段
         """
         if not self.local_file_paths:
             return ""
-            
-        local_file_context = ""
-        for path in self.local_file_paths:
-            if os.path.isfile(path):
-                file_content = AgentUtils.read_file_content(path)
-                if file_content:
-                    local_file_context += f"\n[文件内容] {path}:\n{file_content}\n--- 文件 {path} 内容结束 ---\n"
-            elif os.path.isdir(path):
-                logger.info(f"暂不支持直接读取文件夹: {path}")
-                print(f"\n[提示] 暂不支持直接读取文件夹: {path}，请指定文件夹内的具体文件。")
-            else:
-                logger.warning(f"指定路径无效: {path}")
-                print(f"\n[警告] 指定路径无效: {path}")
-                
-        return local_file_context
+        
+        file_index = self.get_file_index()
+        # 只重建 mtime/内容变化的文件
+        file_index.update(self.local_file_paths)
+        return file_index.build_context(query or self.user_input, FILE_CONTEXT_TOKENS)
+    
+    def add_user_input(self, user_input: str) -> None:
+        """
+        记录用户的新输入，作为下一回合的指令
+        
+        Args:
+            user_input (str): 用户输入
+        """
+        self.user_input = user_input
+        last_turn = self.context.turns[-1] if self.context.turns else None
+        if last_turn is None or last_turn.agent != "user" or last_turn.content != user_input:
+            self.context.add_turn("user", user_input)
+        self._record("input", {"user_input": user_input})
+    
+    def enable_journal(self, session_id: str, directory: Optional[str] = None) -> None:
+        """
+        开始记录状态日志（写入一个初始快照），之后可通过 WorkflowManager.resume 恢复
+        
+        Args:
+            session_id (str): 会话ID
+            directory (Optional[str]): 日志目录，默认使用 WORKFLOW_JOURNAL_DIR
+        """
+        directory = directory or WORKFLOW_JOURNAL_DIR
+        if not directory:
+            return
+        self.journal = WorkflowJournal(directory, session_id)
+        self.checkpoint()
     
+    def checkpoint(self) -> None:
+        """立即把完整状态写成快照"""
+        if self.journal is not None:
+            self.journal.write_snapshot(self.to_state())
+            self._journaled_history_total = self.todo_list.history_total
+    
+    def to_state(self) -> Dict[str, Any]:
+        """完整的工作流状态（可 JSON 序列化）"""
+        return {
+            "initial_request": self.initial_request,
+            "project_folder_path": self.project_folder_path,
+            "local_file_paths": self.local_file_paths,
+            "history": self.history,
+            "todo_list": self.todo_list.to_dict(),
+            "context": self.context.to_dict(),
+            **self._scalar_state()
+        }
+    
+    def _scalar_state(self) -> Dict[str, Any]:
+        """每个回合都可能变化的小字段"""
+        return {
+            "current_agent": self.current_agent,
+            "user_input": self.user_input,
+            "workflow_active": self.workflow_active,
+            "pending_parallel_agents": self.pending_parallel_agents,
+            "parallel_handoff_agent": self.parallel_handoff_agent
+        }
+    
+    def _load_scalar_state(self, state: Dict[str, Any]) -> None:
+        self.current_agent = state.get("current_agent", self.current_agent)
+        self.user_input = state.get("user_input", self.user_input)
+        self.workflow_active = state.get("workflow_active", self.workflow_active)
+        self.pending_parallel_agents = list(state.get("pending_parallel_agents", []))
+        self.parallel_handoff_agent = state.get("parallel_handoff_agent", self.parallel_handoff_agent)
+    
+    def _record(self, record_type: str, data: Dict[str, Any]) -> None:
+        """追加一条日志增量，累计到一定数量时压缩为快照"""
+        if self.journal is None:
+            return
+        self.journal.append(record_type, data)
+        if self.journal.should_compact:
+            self.checkpoint()
+    
+    def _record_turn(self, history_entry: Optional[str], context_turns: List[Tuple[str, str]]) -> None:
+        """记录一个回合的状态增量：新增的历史和对话、任务变化以及当前的小字段"""
+        if self.journal is None:
+            return
+        history_added = self.todo_list.history_since(self._journaled_history_total)
+        self._journaled_history_total = self.todo_list.history_total
+        self._record("turn", {
+            "history_entry": history_entry,
+            "context_turns": [list(turn) for turn in context_turns],
+            "todo_active": [task.to_dict() for task in self.todo_list.tasks],
+            "todo_history_added": [task.to_dict() for task in history_added],
+            "next_task_id": self.todo_list.to_dict()["next_task_id"],
+            **self._scalar_state()
+        })
+    
+    def _apply_record(self, record: Dict[str, Any]) -> None:
+        """重放一条日志增量"""
+        if record.get("type") == "input":
+            self.user_input = record["user_input"]
+            last_turn = self.context.turns[-1] if self.context.turns else None
+            if last_turn is None or last_turn.agent != "user" or last_turn.content != self.user_input:
+                self.context.add_turn("user", self.user_input)
+        elif record.get("type") == "turn":
+            if record.get("history_entry") is not None:
+                self.history.append(record["history_entry"])
+            for agent_id, content in record.get("context_turns", []):
+                self.context.add_turn(agent_id, content)
+            self.todo_list.apply_delta(record.get("todo_active", []), record.get("todo_history_added", []),
+                                       record.get("next_task_id", 1))
+            self._load_scalar_state(record)
+        else:
+            logger.warning(f"未知的日志记录类型: {record.get('type')}")
+    
+    @classmethod
+    def resume(cls, session_id: str, directory: Optional[str] = None, **kwargs) -> 'WorkflowManager':
+        """
+        从日志恢复工作流：读取最近的快照，再重放其后的增量
+        
+        Args:
+            session_id (str): 会话ID
+            directory (Optional[str]): 日志目录，默认使用 WORKFLOW_JOURNAL_DIR
+            **kwargs: 传给构造函数的其他参数
+        
+        Returns:
+            WorkflowManager: 恢复后的工作流管理器（继续写入同一个日志）
+        
+        Raises:
+            FileNotFoundError: 没有该会话的快照
+        """
+        journal = WorkflowJournal(directory or WORKFLOW_JOURNAL_DIR, session_id)
+        snapshot, deltas = journal.load()
+        if snapshot is None:
+            raise FileNotFoundError(f"没有找到会话 {session_id} 的检查点")
+        manager = cls(snapshot["initial_request"], **kwargs)
+        manager.project_folder_path = snapshot.get("project_folder_path")
+        manager.local_file_paths = list(snapshot.get("local_file_paths", []))
+        manager.history = list(snapshot.get("history", []))
+        manager.todo_list = TodoList.from_dict(snapshot.get("todo_list", {}))
+        manager.context.load_dict(snapshot.get("context", {}))
+        manager._load_scalar_state(snapshot)
+        for record in deltas:
+            manager._apply_record(record)
+        manager.journal = journal
+        manager._journaled_history_total = manager.todo_list.history_total
+        logger.info(f"已从检查点恢复会话 {session_id}（重放 {len(deltas)} 条增量）")
+        return manager
+    
+    def get_task_state(self) -> str:
+        """待办事项的简要文本，供组装上下文使用"""
+        return "\n".join(
+            f"任务 #{task.task_id} @{task.agent} [{task.status}] {task.description}"
+            for task in self.todo_list.tasks
+        )
+    
+    @tracer.traced("prepare_user_input")
     def prepare_user_input(self) -> str:
         """
-        准备发送给当前智能体的输入，包含本地文件上下文
+        准备发送给当前智能体的输入：在 token 预算内组合任务状态、对话摘要、最近对话、
+        本地文件上下文（仅 CEO）和当前指令
         
         Returns:
             str: 准备好的用户输入
         """
-        if self.current_agent == "ceo":
-            local_file_context = self.get_local_file_context()
-            if local_file_context:
-                return f"{self.user_input}\n\n[本地文件内容]\n{local_file_context}"
-        
-        return self.user_input
+        local_file_context = self.get_local_file_context() if self.current_agent == "ceo" else ""
+        return self.context.build_prompt(self.user_input, task_state=self.get_task_state(),
+                                         file_context=local_file_context)
     
     def handle_ceo_task_completion(self, response: str) -> bool:
         """
@@ -793,8 +1430,7 @@ class WorkflowManager:
             print("\n[警告] CEO 回复中包含 [TASK_DONE] 标记，但无法解析任务编号。请确保标记格式为 '[TASK_DONE] 任务 #任务编号 已完成'。")
             return False
             
-        task_index = task_number - 1
-        if not self.todo_list.complete_task(task_index):
+        if not self.todo_list.complete_task(task_number):
             logger.warning(f"CEO 尝试标记任务 #{task_number} 为完成，但任务编号无效")
             print(f"\n[警告] CEO 尝试标记任务 #{task_number} 为完成，但任务编号无效，操作忽略。")
             return False
@@ -816,22 +1452,32 @@ class WorkflowManager:
         if "[TASK_DONE]" not in response.upper() and "[DONE]" not in response.upper():
             return False
             
-        task_index = self.todo_list.find_task_for_agent(self.current_agent)
-        if task_index is not None:
-            self.todo_list.complete_task(task_index)
-            logger.info(f"@{self.current_agent} 标记 To-Do List 中 任务 #{task_index+1} 已完成")
-            print(f"\n[Agent 标记完成] @{self.current_agent} 标记 To-Do List 中 任务 #{task_index+1} 已完成。")
+        task_id = self.todo_list.find_task_for_agent(self.current_agent)
+        if task_id is not None:
+            self.todo_list.complete_task(task_id)
+            logger.info(f"@{self.current_agent} 标记 To-Do List 中 任务 #{task_id} 已完成")
+            print(f"\n[Agent 标记完成] @{self.current_agent} 标记 To-Do List 中 任务 #{task_id} 已完成。")
             return True
             
         return False
     
+    @tracer.traced("process_response")
     def process_response(self, response: str) -> None:
         """
-        处理智能体响应，更新任务状态，确定下一个智能体
+        处理智能体响应，更新任务状态，确定下一个智能体，并把本回合的状态增量写入日志
         
         Args:
             response (str): 智能体的回复
         """
+        agent_id = self.current_agent
+        self._apply_response(response)
+        if response == "[API_ERROR]":
+            self._record_turn(None, [])
+        else:
+            self._record_turn(response, [(agent_id, response)])
+    
+    def _apply_response(self, response: str) -> None:
+        """根据智能体的回复更新任务状态，确定下一个智能体"""
         if response == "[API_ERROR]":
             logger.error("API 调用失败，流程中断")
             print("\n[Workflow Error] API 调用失败，流程中断。")
@@ -839,12 +1485,25 @@ class WorkflowManager:
             return
             
         self.history.append(response)
+        self.context.add_turn(self.current_agent, response)
         
+        self.pending_parallel_agents = []
         if self.current_agent == "ceo":
             mentioned_agents = AgentUtils.parse_mentions(response)
+            # 审核任务依赖同一回合指派的其他任务
+            produced_task_ids = []
             for agent in mentioned_agents:
-                if agent and agent != "ceo":
-                    self.todo_list.add_task(agent, "请完成 CEO 指派的任务 (具体请查看完整对话记录)")
+                if agent and agent not in ("ceo", "reviewer"):
+                    task = self.todo_list.add_task(agent, "请完成 CEO 指派的任务 (具体请查看完整对话记录)")
+                    produced_task_ids.append(task.task_id)
+            if "reviewer" in mentioned_agents:
+                self.todo_list.add_task("reviewer", "请完成 CEO 指派的任务 (具体请查看完整对话记录)",
+                                        depends_on=produced_task_ids)
+
+            parallel_agents = [agent for agent in mentioned_agents if agent in self.PARALLEL_AGENTS]
+            if self.parallel_mode and len(parallel_agents) > 1:
+                self.pending_parallel_agents = parallel_agents
+                self.parallel_handoff_agent = "reviewer" if "reviewer" in mentioned_agents else "ceo"
                     
             self.handle_ceo_task_completion(response)
             completed_tasks = self.todo_list.remove_completed_tasks()
@@ -856,7 +1515,10 @@ class WorkflowManager:
             self.handle_agent_task_completion(response)
         
         next_agents = AgentUtils.parse_mentions(response)
-        if next_agents and next_agents[0] in self.agents:
+        if self.pending_parallel_agents:
+            self.current_agent = self.pending_parallel_agents[0]
+            logger.info(f"下一回合并行执行: {', '.join('@' + agent for agent in self.pending_parallel_agents)}")
+        elif next_agents and next_agents[0] in self.agents:
             self.current_agent = next_agents[0]
             logger.info(f"工作流转向 {self.agents[self.current_agent].name} (@{self.current_agent})")
         else:
@@ -864,23 +1526,95 @@ class WorkflowManager:
             print("\n[自动流转] 未指定下一步 Agent，自动转交 CEO...")
             self.current_agent = "ceo"
             self.user_input = "当前流程步骤未明确指定后续执行者，请CEO根据当前的工作进展，Review 上下文对话记录，并判断下一步应该由哪个 Agent 继续执行，或者由CEO发布新的指令。"
+            return
         
-        context = response[-1000:]
-        self.user_input = context
+        # 完整回复作为交接内容，由上下文管理器按 token 预算在句子边界处截断
+        self.user_input = response
     
+    def _complete_task_for(self, agent_id: str, response: str) -> None:
+        """并行回合中按智能体处理任务完成标记"""
+        if "[TASK_DONE]" not in response.upper() and "[DONE]" not in response.upper():
+            return
+        task_id = self.todo_list.find_task_for_agent(agent_id)
+        if task_id is not None:
+            self.todo_list.complete_task(task_id)
+            logger.info(f"@{agent_id} 标记 To-Do List 中 任务 #{task_id} 已完成")
+
+    @tracer.traced("parallel_turn")
+    def run_parallel_turn(self, on_agent_done: Optional[Callable[[str, str], None]] = None) -> str:
+        """
+        并行执行 CEO 同一回合点名的多个独立智能体，汇总结果后统一交给审核员或 CEO。
+
+        Args:
+            on_agent_done (Optional[Callable[[str, str], None]]): 每个智能体完成时的回调，参数为智能体ID和完整回复
+
+        Returns:
+            str: 汇总后的回复
+        """
+        agent_ids = self.pending_parallel_agents
+        self.pending_parallel_agents = []
+        prepared_input = self.prepare_user_input()
+        logger.info(f"并行执行 {len(agent_ids)} 个智能体: {', '.join('@' + agent for agent in agent_ids)}")
+
+        results: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel_agents, len(agent_ids))) as pool:
+            # 带上当前上下文，并行智能体的追踪记录仍关联到本工作流
+            futures = {
+                pool.submit(run_in_context(self.agents[agent_id].generate_response, prepared_input)): agent_id
+                for agent_id in agent_ids
+            }
+            for future in as_completed(futures):
+                agent_id = futures[future]
+                try:
+                    results[agent_id] = future.result()
+                except Exception as e:
+                    logger.error(f"@{agent_id} 并行执行失败: {e}")
+                    results[agent_id] = "[API_ERROR]"
+                if on_agent_done:
+                    on_agent_done(agent_id, results[agent_id])
+
+        if all(result == "[API_ERROR]" for result in results.values()):
+            logger.error("并行回合全部失败，流程中断")
+            print("\n[Workflow Error] API 调用失败，流程中断。")
+            self.workflow_active = False
+            self._record_turn(None, [])
+            return "[API_ERROR]"
+
+        sections = []
+        context_turns = []
+        for agent_id in agent_ids:
+            result = results[agent_id]
+            if result == "[API_ERROR]":
+                continue
+            self._complete_task_for(agent_id, result)
+            self.context.add_turn(agent_id, result)
+            context_turns.append((agent_id, result))
+            sections.append(f"## {self.agents[agent_id].name} (@{agent_id})\n\n{result}")
+        consolidated = "\n\n".join(sections)
+        self.history.append(consolidated)
+
+        self.current_agent = self.parallel_handoff_agent
+        logger.info(f"并行回合完成，汇总结果交给 {self.agents[self.current_agent].name} (@{self.current_agent})")
+        self.user_input = consolidated
+        self._record_turn(consolidated, context_turns)
+        return consolidated
+
     def handle_user_input_during_pause(self) -> None:
         """处理工作流暂停时的用户输入"""
         prompt_message = f"\n=== 请继续指示 {self.agents[self.current_agent].name} (@{self.current_agent}) ==="
         print(prompt_message, end='', flush=True)
         user_input = input()
         
+        self.pending_parallel_agents = []
         if user_input.startswith("@"):
             self.workflow_active = True
             current_agent_from_input = user_input[1:].split(" ")[0].lower()
             if current_agent_from_input in self.agents:
                 self.current_agent = current_agent_from_input
                 self.history = []
-                self.user_input = user_input
+                self.add_user_input(user_input)
+                # 历史被清空，增量无法表达，直接写快照
+                self.checkpoint()
                 logger.info(f"用户手动切换到智能体 @{current_agent_from_input}")
             else:
                 logger.warning(f"未识别到智能体 @{current_agent_from_input}")
@@ -889,7 +1623,8 @@ class WorkflowManager:
         else:
             self.workflow_active = True
             self.history.append(user_input)
-            self.user_input = user_input
+            self.add_user_input(user_input)
+            self._record_turn(user_input, [])
     
     def _create_agents(self) -> Dict[str, Agent]:
         """
@@ -898,7 +1633,7 @@ class WorkflowManager:
         Returns:
             Dict[str, Agent]: 智能体字典，键为智能体ID，值为Agent对象
         """
-        return {
+        agents = {
             "analyst": Agent("分析官", """您是需求分析专家，负责拆解用户需求并生成执行指南。请：
 1. 分析故事类型、主题和风格
 2. 设计主要角色设定
@@ -940,23 +1675,34 @@ class WorkflowManager:
 3. 用@ceo返回修改意见
 **您可以使用浏览器进行信息核对，访问项目文件夹中的文件，辅助您进行审核工作。**""")
         }
+        for agent_id, agent in agents.items():
+            agent.agent_id = agent_id
+        return agents
     
     def run(self) -> None:
         """运行工作流"""
         logger.info("开始运行多智能体工作流")
-        self.initialize_project()
-        
-        while True:
-            if self.workflow_active:
-                self.todo_list.display()
-                
-                print(f"\n=== {self.agents[self.current_agent].name} 工作中 ===")
-                prepared_input = self.prepare_user_input()
-                response = self.agents[self.current_agent].generate_response(prepared_input)
-                
-                self.process_response(response)
-            else:
-                self.handle_user_input_during_pause()
+        workflow_id = self.journal.session_id if self.journal else f"cli-{os.getpid()}"
+        with tracer.bind(workflow_id), tracer.span("workflow.run"):
+            self.initialize_project()
+            
+            while True:
+                if self.workflow_active:
+                    self.todo_list.display()
+                    
+                    if self.pending_parallel_agents:
+                        print(f"\n=== {', '.join(self.agents[agent].name for agent in self.pending_parallel_agents)} 并行工作中 ===")
+                        self.run_parallel_turn()
+                        continue
+
+                    print(f"\n=== {self.agents[self.current_agent].name} 工作中 ===")
+                    with tracer.span("turn", agent=self.current_agent):
+                        prepared_input = self.prepare_user_input()
+                        response = self.agents[self.current_agent].generate_response(prepared_input)
+                        
+                        self.process_response(response)
+                else:
+                    self.handle_user_input_during_pause()
 
 
 def main():
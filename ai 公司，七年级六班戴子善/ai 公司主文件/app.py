@@ -10,9 +10,22 @@ import shutil
 import threading
 import time
 import uuid  # 添加uuid模块
+import asyncio
+import re
 from datetime import datetime  # 添加datetime模块
 from concurrent.futures import ThreadPoolExecutor  # 添加ThreadPoolExecutor导入
 import ai_workflow_system
+from sse_broadcaster import SSEBroadcaster, encode_sse_frame
+from llm_client import AsyncLoopRunner
+from session_registry import WorkflowSession, WorkflowSessionRegistry
+from file_reader import read_range, DEFAULT_READ_BYTES
+from file_search import FileSearch, DEFAULT_MAX_RESULTS
+from directory_listing import DirectoryLister, DEFAULT_PAGE_SIZE
+from transcript_writer import TranscriptWriter
+from workflow_journal import list_sessions
+from turn_scheduler import TurnScheduler, SchedulerFull
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from tracing import tracer
 
 # 配置日志
 logging.basicConfig(
@@ -36,11 +49,17 @@ app.secret_key = os.urandom(24)  # 用于会话管理
 def serve_static(filename):
     return app.send_static_file(filename)
 
-# 全局变量存储当前工作流
-workflow_manager = None
-# 存储流式输出的响应内容
-# 添加在全局变量部分
-streaming_responses = {}
+# 会话注册表：每个浏览器会话拥有独立的工作流，互不干扰
+workflow_sessions = WorkflowSessionRegistry(
+    ai_workflow_system.WorkflowManager,
+    max_sessions=int(os.environ.get('AI_WORKFLOW_MAX_SESSIONS', '200')),
+    idle_timeout=float(os.environ.get('AI_WORKFLOW_SESSION_IDLE_TIMEOUT', '7200'))
+)
+# 存储流式输出的响应内容（每个响应ID一个发布/订阅通道），结束的通道按 TTL 和数量上限自动回收
+streaming_responses = SSEBroadcaster(
+    ttl=float(os.environ.get('AI_WORKFLOW_RESPONSE_TTL', '60')),
+    max_channels=int(os.environ.get('AI_WORKFLOW_MAX_RESPONSES', '1000'))
+)
 
 # 添加流式响应生成函数
 # 创建一个线程池来管理线程资源
@@ -85,18 +104,60 @@ class ThreadPoolManager:
 # 创建线程池管理器实例
 thread_pool_manager = ThreadPoolManager(max_workers=3)
 
+# 回合调度器：固定数量的工作线程，各会话轮流执行，等待队列满时拒绝新回合（HTTP 429）
+TURN_WAIT_SECONDS = REGISTRY.histogram("ai_workflow_turn_wait_seconds", "回合在调度队列中的等待时间")
+turn_scheduler = TurnScheduler(
+    workers=int(os.environ.get('AI_WORKFLOW_TURN_WORKERS', '3')),
+    max_queue=int(os.environ.get('AI_WORKFLOW_TURN_QUEUE', '50')),
+    wait_observer=lambda seconds: TURN_WAIT_SECONDS.observe(value=seconds)
+)
+# 调度器中还有回合（排队或执行中）的会话不能被淘汰，否则回合会落在已被丢弃的工作流上
+workflow_sessions.pending_turns = turn_scheduler.pending
+
+# SSE 连接指标
+SSE_CONNECTIONS = REGISTRY.gauge("ai_workflow_sse_connections", "当前打开的 SSE 连接数")
+SSE_CONNECTIONS_OPENED = REGISTRY.counter("ai_workflow_sse_connections_opened", "累计打开的 SSE 连接数")
+
+# 对话记录：增量写入项目文件夹，由后台线程批量落盘
+transcript_writer = TranscriptWriter()
+TRANSCRIPT_AGENTS = ('ceo', 'writer', 'programmer', 'reviewer')
+
+# 异步大模型客户端开关：开启后所有流式生成在同一个事件循环线程中调度，
+# 共享连接池，不再为每个流占用一个线程池线程
+USE_ASYNC_LLM = os.environ.get('AI_WORKFLOW_ASYNC_LLM', '0') == '1'
+llm_loop_runner = AsyncLoopRunner()
+
+# CEO 同一回合点名多个独立智能体时并行执行
+PARALLEL_AGENTS_ENABLED = os.environ.get('AI_WORKFLOW_PARALLEL_AGENTS', '1') == '1'
+
 # 修改 cleanup_resources 函数
 def cleanup_resources():
     """清理资源"""
     thread_pool_manager.shutdown()
+    shutdown_llm_loop()
+
+def scheduler_busy_response(error):
+    """回合队列已满时的 429 响应"""
+    response = jsonify({'status': 'error', 'message': str(error), 'retry_after': error.retry_after,
+                        'queue': turn_scheduler.snapshot()})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def shutdown_llm_loop():
+    """关闭异步客户端连接池和后台事件循环"""
+    try:
+        if ai_workflow_system._async_llm_client is not None:
+            llm_loop_runner.submit(ai_workflow_system._async_llm_client.close()).result(timeout=5)
+    except Exception as e:
+        logger.warning(f"关闭异步客户端失败: {e}")
+    llm_loop_runner.shutdown()
 
 # 修改使用线程池的地方，例如在 initialize_workflow 中：
 @app.route('/initialize', methods=['POST'])
 @app.route('/initialize_workflow', methods=['GET', 'POST'])
 def initialize_workflow():
     """初始化工作流"""
-    global workflow_manager
-    
     try:
         # 处理POST请求
         if request.method == 'POST':
@@ -108,152 +169,480 @@ def initialize_workflow():
             auto_start = request.args.get('auto_start', 'false').lower() == 'true'
             user_request = request.args.get('user_request', '默认初始化请求')
         
-        # 创建工作流管理器，提供用户请求参数
-        workflow_manager = ai_workflow_system.WorkflowManager(user_request)
+        # 为当前会话创建独立的工作流管理器
+        workflow_session = workflow_sessions.create(user_request)
+        workflow_session.manager.parallel_mode = PARALLEL_AGENTS_ENABLED
+        # 记录状态日志，进程重启后可按会话ID恢复
+        workflow_session.manager.enable_journal(workflow_session.session_id)
+        session['workflow_id'] = workflow_session.session_id
         
         # 如果设置了自动启动，则生成初始响应
         if auto_start:
             response_id = str(uuid.uuid4())
+            # 先创建通道，避免前端订阅时响应ID尚不存在
+            streaming_responses.create(response_id)
             
-            # 使用线程池管理器获取线程池实例
-            thread_pool_manager.get_pool().submit(
-                generate_streaming_response,
-                response_id, 
-                "analyst", 
-                "欢迎使用多智能体工作流系统！我是分析官，请告诉我您的需求。"
-            )
+            try:
+                turn_scheduler.submit(
+                    workflow_session.session_id,
+                    generate_streaming_response,
+                    response_id, 
+                    "analyst", 
+                    "欢迎使用多智能体工作流系统！我是分析官，请告诉我您的需求。"
+                )
+            except SchedulerFull as e:
+                streaming_responses.remove(response_id)
+                return scheduler_busy_response(e)
             
             return jsonify({
                 'status': 'success',
                 'message': '工作流已初始化',
                 'current_agent': 'analyst',
-                'response_id': response_id
+                'response_id': response_id,
+                'workflow_id': workflow_session.session_id
             })
         
         return jsonify({
             'status': 'success',
-            'message': '工作流已初始化'
+            'message': '工作流已初始化',
+            'workflow_id': workflow_session.session_id
         })
     except Exception as e:
         logger.error(f"初始化工作流失败: {e}", exc_info=True)
         return jsonify({'status': 'error', 'message': f'初始化失败: {str(e)}'})
 
-# 修改generate_agent_response函数，优化资源使用
-def generate_agent_response(agent_id, user_input, response_id):
-    """生成智能体响应（后台线程）"""
-    global workflow_manager, streaming_responses
+def get_workflow_session(data=None):
+    """
+    获取当前请求对应的工作流会话
     
+    优先使用请求中显式传入的 workflow_id，其次使用浏览器会话中保存的ID
+    """
+    workflow_id = None
+    if data:
+        workflow_id = data.get('workflow_id')
+    workflow_id = workflow_id or request.args.get('workflow_id') or session.get('workflow_id')
+    return workflow_sessions.get_or_load(workflow_id, resume_workflow_session)
+
+def resume_workflow_session(workflow_id):
+    """
+    从日志恢复不在内存中的会话（例如进程重启后），没有检查点时返回None
+
+    只通过 workflow_sessions.get_or_load 调用，保证同一会话只恢复出一个工作流
+    """
+    if not ai_workflow_system.WORKFLOW_JOURNAL_DIR:
+        return None
     try:
-        # 更新用户输入
-        workflow_manager.user_input = user_input
-        
-        # 准备输入（包含本地文件上下文）
-        prepared_input = workflow_manager.prepare_user_input()
-        
-        # 初始化响应数据
-        streaming_responses[response_id] = {
-            "complete": False, 
-            "text": "",
-            "chunks": []
-        }
-        
-        # 生成响应
-        full_response = workflow_manager.agents[agent_id].generate_response(prepared_input)
-        
-        # 流式输出 - 减少更新频率
-        total_length = len(full_response)
-        chunk_size = max(50, total_length // 20)  # 增大块大小，减少更新次数
-        
-        for i in range(0, total_length, chunk_size):
-            end_idx = min(i + chunk_size, total_length)
-            chunk = full_response[i:end_idx]
+        manager = ai_workflow_system.WorkflowManager.resume(workflow_id)
+    except (FileNotFoundError, ValueError):
+        return None
+    except Exception as e:
+        logger.error(f"恢复会话 {workflow_id} 失败: {e}", exc_info=True)
+        return None
+    manager.parallel_mode = PARALLEL_AGENTS_ENABLED
+    return WorkflowSession(workflow_id, manager)
+
+# 修改generate_agent_response函数，优化资源使用
+def generate_agent_response(workflow_session, user_input, response_id):
+    """生成智能体响应（后台线程），同一会话的回合串行执行"""
+    try:
+        with tracer.bind(workflow_session.session_id), workflow_session.turn(), \
+                tracer.span("turn", agent=workflow_session.manager.current_agent, response_id=response_id):
+            workflow_manager = workflow_session.manager
+            agent_id = workflow_manager.current_agent
+            
+            # 记录用户输入（为空时沿用上一个智能体的交接内容）
+            if user_input:
+                workflow_manager.add_user_input(user_input)
             
-            # 更新当前文本
-            streaming_responses[response_id]["text"] += chunk
-            streaming_responses[response_id]["chunks"].append(chunk)
+            # 获取响应通道（通常已由路由创建）
+            channel = streaming_responses.get(response_id) or streaming_responses.create(response_id)
             
-            # 实时保存为MD文件
-            if agent_id in ['ceo', 'writer', 'programmer', 'reviewer']:
-                save_response_to_md(agent_id, streaming_responses[response_id]["text"])
+            if workflow_manager.pending_parallel_agents:
+                # CEO 同时点名了多个独立智能体：并行执行，每完成一个就推送其结果
+                run_parallel_agents(workflow_session, channel)
+            else:
+                # 准备输入（包含本地文件上下文）
+                prepared_input = workflow_manager.prepare_user_input()
                 
-            time.sleep(0.2)  # 增加延迟，减少更新频率
-        
-        # 处理响应
-        workflow_manager.process_response(full_response)
-        
-        # 标记完成
-        streaming_responses[response_id]["complete"] = True
-        streaming_responses[response_id]["next_agent"] = workflow_manager.current_agent
-        streaming_responses[response_id]["next_agent_name"] = workflow_manager.agents[workflow_manager.current_agent].name
-        
-        # 获取待办事项列表
-        todo_items = [
-            {
-                'id': idx + 1,
-                'agent': task.agent,
-                'description': task.description,
-                'status': task.status
-            }
-            for idx, task in enumerate(workflow_manager.todo_list.tasks)
-        ]
-        streaming_responses[response_id]["todo_items"] = todo_items
-        
-        # 30秒后清理响应数据
-        time.sleep(30)
-        if response_id in streaming_responses:
-            del streaming_responses[response_id]
+                # 逐段转发上游增量，不再等待整段生成结束
+                agent = workflow_manager.agents[agent_id]
+                start_transcript(workflow_session, agent_id)
+                for chunk in agent.stream_response(prepared_input):
+                    channel.publish_text(chunk)
+                    
+                    # 实时追加到对话记录（只写新增的部分）
+                    save_transcript(workflow_session, agent_id, chunk)
+                
+                finish_agent_response(workflow_manager, channel, agent.last_response)
+        # 响应通道由 streaming_responses 的清理线程按 TTL 回收，不占用线程池线程等待
             
     except Exception as e:
         logger.error(f"生成智能体响应失败: {e}", exc_info=True)
-        if response_id in streaming_responses:
-            streaming_responses[response_id]["error"] = str(e)
-            streaming_responses[response_id]["complete"] = True
+        channel = streaming_responses.get(response_id)
+        if channel:
+            channel.publish_error(str(e))
+
+# 异步模式下调度器的工作线程提交协程后立即释放，用事件循环上的信号量限制同时执行的回合数
+_async_turn_slots = None
+
+def async_turn_slots():
+    """同时执行的异步回合数上限，与调度器的工作线程数相同（只在事件循环线程中调用）"""
+    global _async_turn_slots
+    loop = asyncio.get_running_loop()
+    # 信号量绑定在创建它的事件循环上，事件循环重建后需要新建
+    if _async_turn_slots is None or _async_turn_slots[0] is not loop:
+        _async_turn_slots = (loop, asyncio.Semaphore(turn_scheduler.workers))
+    return _async_turn_slots[1]
+
+async def agenerate_agent_response(workflow_session, user_input, response_id):
+    """生成智能体响应（在异步事件循环中运行），同一会话的回合串行执行"""
+    try:
+        async with async_turn_slots(), workflow_session.aturn():
+            await _agenerate_turn(workflow_session, user_input, response_id)
+    except Exception as e:
+        logger.error(f"生成智能体响应失败: {e}", exc_info=True)
+        channel = streaming_responses.get(response_id)
+        if channel:
+            channel.publish_error(str(e))
+
+async def _agenerate_turn(workflow_session, user_input, response_id):
+    """异步回合的主体（调用方持有会话的回合锁）"""
+    # 每个协程有独立的上下文，绑定只作用于本回合；to_thread 会带上当前上下文
+    with tracer.bind(workflow_session.session_id), \
+            tracer.span("turn", agent=workflow_session.manager.current_agent, response_id=response_id):
+        workflow_manager = workflow_session.manager
+        agent_id = workflow_manager.current_agent
+        if user_input:
+            workflow_manager.add_user_input(user_input)
+        channel = streaming_responses.get(response_id) or streaming_responses.create(response_id)
+        
+        if workflow_manager.pending_parallel_agents:
+            # 并行回合由工作流内部的线程池执行
+            await asyncio.to_thread(run_parallel_agents, workflow_session, channel)
+            return
+        
+        prepared_input = await asyncio.to_thread(workflow_manager.prepare_user_input)
+        agent = workflow_manager.agents[agent_id]
+        start_transcript(workflow_session, agent_id)
+        async for chunk in agent.astream_response(prepared_input):
+            channel.publish_text(chunk)
+            
+            # 实时追加到对话记录（只写新增的部分）
+            save_transcript(workflow_session, agent_id, chunk)
+        
+        await asyncio.to_thread(finish_agent_response, workflow_manager, channel, agent.last_response)
+
+def run_parallel_agents(workflow_session, channel):
+    """并行执行 CEO 点名的多个智能体，每个智能体完成后推送其完整结果"""
+    workflow_manager = workflow_session.manager
+    
+    def on_agent_done(agent_id, text):
+        if text == "[API_ERROR]":
+            return
+        section = f"\n\n## {workflow_manager.agents[agent_id].name} (@{agent_id})\n\n{text}"
+        channel.publish_text(section)
+        start_transcript(workflow_session, agent_id)
+        save_transcript(workflow_session, agent_id, text)
+    
+    workflow_manager.run_parallel_turn(on_agent_done=on_agent_done)
+    publish_turn_complete(workflow_manager, channel)
+
+def finish_agent_response(workflow_manager, channel, full_response):
+    """处理完整响应，推进工作流并发布完成事件"""
+    # 处理响应
+    workflow_manager.process_response(full_response)
+    publish_turn_complete(workflow_manager, channel)
+
+def publish_turn_complete(workflow_manager, channel):
+    """发布回合完成事件（下一个智能体和待办事项列表）"""
+    # 获取待办事项列表
+    todo_items = [
+        {
+            'id': task.task_id,
+            'agent': task.agent,
+            'description': task.description,
+            'status': task.status
+        }
+        for task in workflow_manager.todo_list.tasks
+    ]
+    
+    tracer.instant("handoff", to=workflow_manager.current_agent)
+    # 标记完成，唤醒所有订阅者
+    channel.publish_complete(
+        next_agent=workflow_manager.current_agent,
+        next_agent_name=workflow_manager.agents[workflow_manager.current_agent].name,
+        todo_items=todo_items
+    )
 
 # 修改stream_agent_response函数，使用线程池
 @app.route('/stream_agent_response', methods=['POST'])
 def stream_agent_response():
     """流式获取智能体响应"""
-    global workflow_manager
-    
-    if not workflow_manager:
+    data = request.json or {}
+    workflow_session = get_workflow_session(data)
+    if workflow_session is None:
         return jsonify({'status': 'error', 'message': '请先初始化工作流'})
+    workflow_manager = workflow_session.manager
     
-    data = request.json
     user_input = data.get('user_input', '')
     
     if not user_input and not workflow_manager.user_input:
         return jsonify({'status': 'error', 'message': '请输入内容'})
     
     try:
-        # 获取当前智能体
+        # 获取当前智能体（若本会话已有回合在执行，实际执行者以轮到本回合时为准）
         current_agent = workflow_manager.current_agent
         agent_name = workflow_manager.agents[current_agent].name
         
         # 创建响应ID
-        response_id = f"{current_agent}_{int(time.time())}"
+        response_id = f"{current_agent}_{uuid.uuid4().hex[:12]}"
+        streaming_responses.create(response_id)
         
-        # 使用线程池启动后台任务生成响应
-        # ... 其他代码保持不变 ...
-        
-        # 使用线程池管理器获取线程池实例
-        thread_pool_manager.get_pool().submit(
-            generate_agent_response,
-            current_agent, 
-            user_input, 
-            response_id
-        )
+        try:
+            if USE_ASYNC_LLM:
+                # 在共享事件循环中生成：调度器负责排队和公平性，提交后立即释放工作线程；
+                # 同时执行的回合数由 async_turn_slots 限制为同样的 workers
+                turn_scheduler.submit(
+                    workflow_session.session_id,
+                    lambda: llm_loop_runner.submit(agenerate_agent_response(workflow_session, user_input, response_id))
+                )
+            else:
+                turn_scheduler.submit(
+                    workflow_session.session_id,
+                    generate_agent_response,
+                    workflow_session, 
+                    user_input, 
+                    response_id
+                )
+        except SchedulerFull as e:
+            streaming_responses.remove(response_id)
+            return scheduler_busy_response(e)
         
         return jsonify({
             'status': 'success',
             'message': '开始生成响应',
             'response_id': response_id,
             'agent': current_agent,
-            'agent_name': agent_name
+            'agent_name': agent_name,
+            'workflow_id': workflow_session.session_id
         })
     except Exception as e:
         logger.error(f"启动流式响应失败: {e}", exc_info=True)
         return jsonify({'status': 'error', 'message': f'启动流式响应失败: {str(e)}'})
 
+@app.route('/resume_session', methods=['POST'])
+def resume_session():
+    """按会话ID恢复工作流（内存中没有时从日志恢复），并设为当前浏览器会话的工作流"""
+    data = request.json or {}
+    workflow_id = data.get('workflow_id')
+    if not workflow_id:
+        return jsonify({'status': 'error', 'message': '请提供 workflow_id'}), 400
+    workflow_session = workflow_sessions.get_or_load(workflow_id, resume_workflow_session)
+    if workflow_session is None:
+        return jsonify({'status': 'error', 'message': f'没有找到会话 {workflow_id}'}), 404
+    session['workflow_id'] = workflow_session.session_id
+    workflow_manager = workflow_session.manager
+    return jsonify({
+        'status': 'success',
+        'workflow_id': workflow_session.session_id,
+        'current_agent': workflow_manager.current_agent,
+        'current_agent_name': workflow_manager.agents[workflow_manager.current_agent].name,
+        'workflow_active': workflow_manager.workflow_active,
+        'history_length': len(workflow_manager.history),
+        'todo_items': [task.to_dict() for task in workflow_manager.todo_list.tasks]
+    })
+
+@app.route('/resumable_sessions', methods=['GET'])
+def resumable_sessions():
+    """列出有检查点、可以恢复的会话"""
+    if not ai_workflow_system.WORKFLOW_JOURNAL_DIR:
+        return jsonify({'status': 'success', 'sessions': []})
+    return jsonify({'status': 'success', 'sessions': list_sessions(ai_workflow_system.WORKFLOW_JOURNAL_DIR)})
+
+@app.route('/session_stats', methods=['GET'])
+def session_stats():
+    """查看会话数量和内存占用"""
+    usage = workflow_sessions.memory_usage()
+    usage['max_sessions'] = workflow_sessions.max_sessions
+    usage['idle_timeout'] = workflow_sessions.idle_timeout
+    usage['responses'] = streaming_responses.memory_usage()
+    usage['scheduler'] = turn_scheduler.snapshot()
+    return jsonify(usage)
+
+# 导出时读取的指标：调度队列、响应通道、会话、上游调用和缓存命中
+def collect_runtime_metrics():
+    """从各组件已有的统计中产出指标样本"""
+    queue = turn_scheduler.snapshot()
+    yield ('ai_workflow_turn_queue_depth', {}, queue['queued'])
+    yield ('ai_workflow_turns_running', {}, queue['running'])
+    yield ('ai_workflow_turn_oldest_wait_seconds', {}, queue['oldest_wait_seconds'])
+    for outcome in ('completed', 'failed', 'rejected'):
+        yield ('ai_workflow_turns_total', {'outcome': outcome}, queue[outcome])
+    
+    responses = streaming_responses.memory_usage()
+    yield ('ai_workflow_response_channels', {'state': 'live'}, responses['channels'] - responses['complete'])
+    yield ('ai_workflow_response_channels', {'state': 'complete'}, responses['complete'])
+    yield ('ai_workflow_response_chars', {}, responses['chars'])
+    yield ('ai_workflow_response_channels_reaped_total', {}, responses['reaped'])
+    yield ('ai_workflow_sessions', {}, len(workflow_sessions))
+    
+    if ai_workflow_system._llm_transport is not None:
+        transport = ai_workflow_system._llm_transport.stats.snapshot()
+        for outcome, count in transport['outcomes'].items():
+            yield ('ai_workflow_llm_attempts_total', {'outcome': outcome}, count)
+        yield ('ai_workflow_llm_retries_total', {}, transport['retries'])
+    if ai_workflow_system._response_cache is not None:
+        cache = ai_workflow_system._response_cache.get_stats()
+        for result, key in (('memory_hit', 'memory_hits'), ('disk_hit', 'disk_hits'), ('miss', 'misses')):
+            yield ('ai_workflow_response_cache_lookups_total', {'result': result}, cache[key])
+        yield ('ai_workflow_response_cache_hit_ratio', {}, cache['hit_rate'])
+
+REGISTRY.register_collector([
+    ('ai_workflow_turn_queue_depth', 'gauge', '调度队列中等待的回合数'),
+    ('ai_workflow_turns_running', 'gauge', '正在执行的回合数'),
+    ('ai_workflow_turn_oldest_wait_seconds', 'gauge', '队列中最久的回合已等待的时间'),
+    ('ai_workflow_turns_total', 'counter', '调度器处理的回合数（按结果）'),
+    ('ai_workflow_response_channels', 'gauge', '内存中的响应通道数（按状态）'),
+    ('ai_workflow_response_chars', 'gauge', '响应通道中保存的字符数'),
+    ('ai_workflow_response_channels_reaped_total', 'counter', '已回收的响应通道数'),
+    ('ai_workflow_sessions', 'gauge', '内存中的工作流会话数'),
+    ('ai_workflow_llm_attempts_total', 'counter', '传输层的每次上游请求尝试（按结果，含重试）'),
+    ('ai_workflow_llm_retries_total', 'counter', '传输层的重试次数'),
+    ('ai_workflow_response_cache_lookups_total', 'counter', '响应缓存查询次数（按结果）'),
+    ('ai_workflow_response_cache_hit_ratio', 'gauge', '响应缓存命中率'),
+], collect_runtime_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/debug/trace/<workflow_id>', methods=['GET'])
+def debug_trace(workflow_id):
+    """导出工作流的追踪记录（Chrome trace-event JSON，可在 Perfetto 中打开）"""
+    trace = tracer.export(workflow_id)
+    if len(trace['traceEvents']) <= 1:
+        return jsonify({'status': 'error', 'message': f'没有工作流 {workflow_id} 的追踪记录'}), 404
+    response = jsonify(trace)
+    response.headers['Content-Disposition'] = f'inline; filename="trace-{workflow_id}.json"'
+    return response
+
+@app.route('/scheduler_stats', methods=['GET'])
+def scheduler_stats():
+    """查看回合队列深度、等待时间和执行中的回合数"""
+    return jsonify(turn_scheduler.snapshot())
+
+@app.route('/read_file', methods=['GET'])
+def read_file():
+    """
+    分段读取本地文件
+    
+    查询参数：path 文件路径；mode 为 range（默认）、head 或 tail；offset 起始偏移；length 读取长度（字节）。
+    返回的 offset/end 为实际读取的范围，下一页从 end 开始，eof 表示已读到文件末尾。
+    """
+    path = request.args.get('path', '')
+    if not path:
+        return jsonify({'status': 'error', 'message': '请提供文件路径'}), 400
+    try:
+        offset = int(request.args.get('offset', 0))
+        length = int(request.args.get('length', DEFAULT_READ_BYTES))
+        result = read_range(path, offset=offset, length=length, mode=request.args.get('mode', 'range'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'参数无效: {e}'}), 400
+    except FileNotFoundError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except OSError as e:
+        logger.error(f"读取文件失败: {e}")
+        return jsonify({'status': 'error', 'message': f'读取文件失败: {e}'}), 500
+    
+    if result['binary']:
+        result['message'] = '二进制文件，无法以文本方式显示'
+    result['status'] = 'success'
+    return jsonify(result)
+
+directory_lister = DirectoryLister()
+
+@app.route('/browse_files', methods=['GET'])
+def browse_files():
+    """
+    分页列出目录内容
+    
+    查询参数：path 目录（默认为用户主目录）；cursor 上一页返回的 next_cursor；limit 每页条目数（0 表示全部）；
+    sort 为 name、size、modified 或 type；order 为 asc 或 desc；type 为 file 或 directory；
+    ext 扩展名（逗号分隔）；q 名称包含的文本；hidden=0 隐藏以 . 开头的条目。
+    响应以流的方式逐条输出 JSON，超大目录也不必先在内存中拼出完整的响应体。
+    """
+    args = request.args
+    try:
+        page = directory_lister.list_page(
+            args.get('path') or os.path.expanduser('~'),
+            cursor=args.get('cursor') or None,
+            limit=int(args.get('limit', DEFAULT_PAGE_SIZE)),
+            sort=args.get('sort', 'name'),
+            order=args.get('order', 'asc'),
+            dirs_first=args.get('dirs_first', '1') != '0',
+            include_hidden=args.get('hidden', '1') != '0',
+            item_type=args.get('type') or None,
+            extensions=[ext for ext in args.get('ext', '').split(',') if ext],
+            name_filter=args.get('q', '')
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'参数无效: {e}'}), 400
+    except FileNotFoundError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except PermissionError as e:
+        return jsonify({'status': 'error', 'message': f'没有权限读取目录: {e}'}), 403
+    
+    def generate():
+        yield f'{{"status": "success", "path": {json.dumps(page["path"])}, "total": {page["total"]}, ' \
+              f'"next_cursor": {json.dumps(page["next_cursor"])}, "files": ['
+        for index, item in enumerate(page['files']):
+            yield (',' if index else '') + json.dumps(item)
+        yield ']}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/search_files', methods=['GET'])
+def search_files():
+    """
+    搜索文件，以 SSE 逐条推送结果
+    
+    查询参数：path 起点目录；pattern 匹配模式；mode 为 substring（默认）、glob 或 regex；
+    ext 扩展名（逗号分隔）；ignore 额外忽略规则（逗号分隔）；max_depth 最大深度；max_results 结果上限；
+    hidden=1 包含隐藏文件。每条结果一帧，最后一帧 type 为 done；客户端断开时搜索随之取消。
+    """
+    args = request.args
+    try:
+        max_depth = args.get('max_depth')
+        search = FileSearch(
+            args.get('path', os.path.expanduser('~')),
+            args.get('pattern', ''),
+            mode=args.get('mode', 'substring'),
+            extensions=[ext for ext in args.get('ext', '').split(',') if ext],
+            ignore=[rule for rule in args.get('ignore', '').split(',') if rule],
+            include_hidden=args.get('hidden') == '1',
+            max_depth=int(max_depth) if max_depth else None,
+            max_results=min(int(args.get('max_results', DEFAULT_MAX_RESULTS)), 10 * DEFAULT_MAX_RESULTS)
+        )
+    except (ValueError, re.error) as e:
+        return jsonify({'status': 'error', 'message': f'参数无效: {e}'}), 400
+    if not os.path.isdir(search.root):
+        return jsonify({'status': 'error', 'message': f'目录不存在: {search.root}'}), 404
+    
+    def generate():
+        count = 0
+        try:
+            for item in search.iter_results():
+                count += 1
+                yield encode_sse_frame(dict(item, type='match'))
+            yield encode_sse_frame({'type': 'done', 'count': count, 'truncated': search.truncated})
+        except Exception as e:
+            logger.error(f"搜索文件失败: {e}", exc_info=True)
+            yield encode_sse_frame({'type': 'error', 'error': str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # 添加资源清理路由
 @app.route('/cleanup', methods=['POST'])
 def cleanup():
@@ -277,48 +666,48 @@ def shutdown_thread_pool(exception=None):
 @app.route('/stream_response/<response_id>', methods=['GET'])
 def stream_response(response_id):
     """流式返回智能体响应"""
-    if response_id not in streaming_responses:
+    channel = streaming_responses.get(response_id)
+    if channel is None:
         return jsonify({'error': '无效的响应ID'}), 404
+    workflow_id = request.args.get('workflow_id') or session.get('workflow_id')
         
     def generate():
-        last_text_length = 0
-        retry_count = 0
-        max_retries = 30  # 减少最大重试次数
-        
-        while retry_count < max_retries:
-            try:
-                response_data = streaming_responses.get(response_id, {})
-                current_text = response_data.get('text', '')
-                
-                if len(current_text) > last_text_length:
-                    new_text = current_text[last_text_length:]
-                    last_text_length = len(current_text)
-                    yield f"data: {json.dumps({'text': new_text})}\n\n"
-                
-                if response_data.get('complete', False):
-                    complete_data = {
-                        'complete': True,
-                        'next_agent': response_data.get('next_agent'),
-                        'next_agent_name': response_data.get('next_agent_name'),
-                        'todo_items': response_data.get('todo_items', [])
-                    }
-                    yield f"data: {json.dumps(complete_data)}\n\n"
-                    break
-                    
-                time.sleep(0.5)  # 增加轮询间隔
-                retry_count += 1
-            except Exception as e:
-                logger.error(f"流式响应生成失败: {e}", exc_info=True)
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                break
+        # 只在有新内容时被唤醒，空闲时发送保活注释，没有重试次数上限
+        SSE_CONNECTIONS.inc()
+        SSE_CONNECTIONS_OPENED.inc()
+        started = time.monotonic()
+        frames = 0
+        try:
+            for frame in channel.subscribe():
+                if frames == 0:
+                    tracer.instant("sse.first_frame", workflow_id=workflow_id, category="sse", response_id=response_id)
+                frames += 1
+                yield frame
+        except Exception as e:
+            logger.error(f"流式响应生成失败: {e}", exc_info=True)
+            yield encode_sse_frame({'error': str(e)})
+        finally:
+            SSE_CONNECTIONS.dec()
+            tracer.complete("sse.deliver", started, workflow_id=workflow_id, category="sse",
+                            response_id=response_id, frames=frames)
     
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
-# 添加保存响应到MD文件的功能
-def save_response_to_md(agent_id, content):
-    """保存响应到MD文件"""
-    filename = f"{agent_id}_response.md"
-    with open(filename, 'a', encoding='utf-8') as f:
-        f.write(content)
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+# 对话记录：每个会话的每个智能体一个 Markdown 文件，位于项目文件夹的 transcripts 目录下
+def transcript_directory(workflow_session):
+    """对话记录所在的目录（项目文件夹创建失败时退回到 ~/.ai_workflow）"""
+    return workflow_session.manager.project_folder_path or \
+        os.path.join(os.path.expanduser('~'), '.ai_workflow')
+
+def start_transcript(workflow_session, agent_id):
+    """在对话记录中开始新的回合"""
+    if agent_id in TRANSCRIPT_AGENTS:
+        transcript_writer.start_turn(transcript_directory(workflow_session), workflow_session.session_id, agent_id)
+
+def save_transcript(workflow_session, agent_id, delta):
+    """追加新增的响应文本（写入由后台线程批量完成）"""
+    if agent_id in TRANSCRIPT_AGENTS:
+        transcript_writer.append(transcript_directory(workflow_session), workflow_session.session_id, agent_id, delta)
 # 主应用路由
 
 @app.route('/', methods=['GET', 'POST'])
@@ -326,10 +715,6 @@ def index():
     """主页路由"""
     return render_template('index.html')
 
-if __name__ == '__main__': 
-    # 调试模式开关（True=开启，False=关闭）
-    app.run(debug=True, host='0.0.0.0', port=5001)  # 当前已生效的端口配置
-
 # 在应用程序关闭时关闭线程池
 @app.teardown_appcontext
 def shutdown_thread_pool(exception=None):
@@ -345,7 +730,11 @@ import atexit
 def shutdown_resources():
     """在应用程序退出时关闭资源"""
     logger.info("正在关闭线程池...")
+    turn_scheduler.shutdown()
     thread_pool_manager.shutdown()
+    shutdown_llm_loop()
+    streaming_responses.stop()
+    transcript_writer.close()
     logger.info("线程池已关闭")
 
 # 删除文件末尾的这些重复定义
@@ -367,31 +756,23 @@ def get_agent_name(agent_id):
 def generate_streaming_response(response_id, agent_id, content):
     """生成流式响应"""
     try:
-        streaming_responses[response_id] = {
-            'chunks': [],
-            'complete': False,
-            'next_agent': agent_id,
-            'next_agent_name': get_agent_name(agent_id),
-            'todo_items': [],
-            'text': ''
-        }
+        channel = streaming_responses.get(response_id) or streaming_responses.create(response_id)
         
         words = content.split()
         for i in range(0, len(words), 3):
             chunk = ' '.join(words[i:i+3])
             if chunk:
-                streaming_responses[response_id]['chunks'].append(chunk + ' ')
-                streaming_responses[response_id]['text'] += chunk + ' '
+                channel.publish_text(chunk + ' ')
                 time.sleep(0.1)  # 增加延迟时间
         
-        streaming_responses[response_id]['complete'] = True
-        
-        # 减少等待时间
-        time.sleep(5)
-        if response_id in streaming_responses:
-            del streaming_responses[response_id]
+        channel.publish_complete(next_agent=agent_id, next_agent_name=get_agent_name(agent_id))
     except Exception as e:
         logger.error(f"生成流式响应失败: {e}", exc_info=True)
-        if response_id in streaming_responses:
-            streaming_responses[response_id]['error'] = str(e)
-            streaming_responses[response_id]['complete'] = True
\ No newline at end of file
+        channel = streaming_responses.get(response_id)
+        if channel:
+            channel.publish_error(str(e))
+
+# 启动入口放在文件末尾，保证上面定义的函数都已加载
+if __name__ == '__main__': 
+    # 调试模式开关（True=开启，False=关闭）
+    app.run(debug=True, host='0.0.0.0', port=5001)  # 当前已生效的端口配置
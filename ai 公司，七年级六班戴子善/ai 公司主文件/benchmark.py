@@ -0,0 +1,395 @@
+# File: benchmark.py
+# 端到端压测：本地模拟大模型接口 + 独立进程中的 Flask 应用 + N 个并发的模拟浏览器会话
+# 每个会话依次调用 /initialize_workflow、/stream_agent_response、/stream_response/<id>，
+# 统计首字节时间、回合耗时的分位数、每秒完成会话数和应用进程的内存峰值，结果写入 JSON 便于前后对比
+
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from stub_llm_server import StubLLMConfig, StubLLMServer, WORKFLOW_MENTIONS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("AI-Workflow-Benchmark")
+
+# 与基线对比时检查的指标：(路径, 越大越好)
+COMPARED_METRICS = (
+    (("ttfb_seconds", "p50"), False),
+    (("ttfb_seconds", "p95"), False),
+    (("ttfb_seconds", "p99"), False),
+    (("turn_latency_seconds", "p50"), False),
+    (("turn_latency_seconds", "p95"), False),
+    (("turn_latency_seconds", "p99"), False),
+    (("sessions_per_second",), True),
+    (("peak_rss_bytes",), False),
+)
+# 429 时最多重试的次数
+MAX_REJECTED_RETRIES = 20
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """线性插值的分位数，p 取 0-100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    lower = math.floor(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """样本数、均值、p50/p95/p99 和最大值（秒）"""
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def peak_rss_bytes(pid: int) -> Optional[int]:
+    """进程的内存峰值（Linux 的 VmHWM），无法读取时返回None"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class BenchmarkStats:
+    """各会话线程共享的统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ttfb: List[float] = []
+        self.turn_latency: List[float] = []
+        self.session_duration: List[float] = []
+        self.sessions_completed = 0
+        self.sessions_failed = 0
+        self.turn_errors = 0
+        self.rejected = 0
+
+    def record_turn(self, ttfb: Optional[float], latency: float, error: bool) -> None:
+        with self._lock:
+            if ttfb is not None:
+                self.ttfb.append(ttfb)
+            self.turn_latency.append(latency)
+            if error:
+                self.turn_errors += 1
+
+    def count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, key, getattr(self, key) + amount)
+
+    def record_session(self, duration: float, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.sessions_completed += 1
+                self.session_duration.append(duration)
+            else:
+                self.sessions_failed += 1
+
+
+class AppProcess:
+    """在子进程中运行 app.py，与压测客户端和模拟接口分开，内存峰值只统计应用本身"""
+
+    def __init__(self, llm_url: str, work_dir: str, env: Optional[Dict[str, str]] = None):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.work_dir = work_dir
+        self.log_path = os.path.join(work_dir, "app.log")
+        self.env = dict(os.environ, **(env or {}))
+        # 日志、缓存、对话记录都放在临时目录，不污染用户目录
+        self.env.update({
+            "AI_WORKFLOW_API_URL": llm_url,
+            "HOME": work_dir,
+            "AI_WORKFLOW_JOURNAL_DIR": os.path.join(work_dir, "journals"),
+            "AI_WORKFLOW_CACHE_DB": "",
+            "PYTHONUNBUFFERED": "1",
+        })
+        self._process: Optional[subprocess.Popen] = None
+        self._log = None
+
+    def start(self, timeout: float = 30.0) -> "AppProcess":
+        """启动应用并等待可以访问"""
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve-app", str(self.port)],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=self.env,
+            stdout=subprocess.DEVNULL, stderr=self._log)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"应用启动失败，详见 {self.log_path}")
+            try:
+                requests.get(f"{self.url}/scheduler_stats", timeout=1)
+                return self
+            except requests.exceptions.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"应用在 {timeout} 秒内没有就绪，详见 {self.log_path}")
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process else None
+
+    def stop(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+def serve_app(port: int) -> None:
+    """子进程入口：用多线程 WSGI 服务器运行 app（不启用调试模式和重载器）"""
+    from werkzeug.serving import make_server
+    import app as workflow_app
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    make_server("127.0.0.1", port, workflow_app.app, threaded=True).serve_forever()
+
+
+def run_session(base_url: str, turns: int, stats: BenchmarkStats, timeout: float) -> None:
+    """
+    模拟一个浏览器会话：初始化工作流，然后依次执行 turns 个回合并读完每个回合的 SSE 流
+
+    Args:
+        base_url (str): 应用地址
+        turns (int): 回合数
+        stats (BenchmarkStats): 共享统计
+        timeout (float): 单个请求的读取超时（秒）
+    """
+    http = requests.Session()
+    started = time.monotonic()
+    try:
+        init = http.post(f"{base_url}/initialize_workflow", json={"user_request": "写一个关于压测的短篇故事"},
+                         timeout=timeout).json()
+        workflow_id = init["workflow_id"]
+        for turn in range(turns):
+            run_turn(http, base_url, workflow_id, "开始" if turn == 0 else "", stats, timeout)
+    except Exception as e:
+        logger.warning(f"会话失败: {e}")
+        stats.record_session(time.monotonic() - started, ok=False)
+        return
+    finally:
+        http.close()
+    stats.record_session(time.monotonic() - started, ok=True)
+
+
+def run_turn(http: requests.Session, base_url: str, workflow_id: str, user_input: str,
+             stats: BenchmarkStats, timeout: float) -> None:
+    """
+    执行一个回合：提交（429 时按 Retry-After 等待后重试），订阅 SSE 直到完成帧
+
+    首字节时间从提交回合开始计到收到第一段文本，回合耗时计到收到完成帧
+    """
+    started = time.monotonic()
+    for _ in range(MAX_REJECTED_RETRIES):
+        response = http.post(f"{base_url}/stream_agent_response",
+                             json={"workflow_id": workflow_id, "user_input": user_input}, timeout=timeout)
+        if response.status_code != 429:
+            break
+        stats.count("rejected")
+        time.sleep(float(response.headers.get("Retry-After", "1")))
+    body = response.json()
+    if body.get("status") != "success":
+        raise RuntimeError(f"提交回合失败: {body.get('message')}")
+
+    first_text_at = None
+    error = True
+    with http.get(f"{base_url}/stream_response/{body['response_id']}", params={"workflow_id": workflow_id},
+                  stream=True, timeout=timeout) as stream:
+        for line in stream.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            event = json.loads(line[5:])
+            if "text" in event and first_text_at is None:
+                first_text_at = time.monotonic()
+            if event.get("complete"):
+                error = bool(event.get("error"))
+                break
+    finished = time.monotonic()
+    stats.record_turn(first_text_at - started if first_text_at is not None else None, finished - started, error)
+
+
+def compare_with_baseline(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    与基线结果对比，打印各指标的变化
+
+    Args:
+        result (Dict[str, Any]): 本次结果
+        baseline (Dict[str, Any]): 基线结果
+        tolerance (float): 允许的相对退化比例
+
+    Returns:
+        List[str]: 退化超过容差的指标
+    """
+    regressions = []
+    for path, higher_is_better in COMPARED_METRICS:
+        current, previous = result, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        name = ".".join(path)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        print(f"  {name:<28} {previous:>14.4f} -> {current:>14.4f} ({change:+.1%}){'  退化' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """启动模拟接口和应用，运行并发会话，返回结果"""
+    config = StubLLMConfig(first_token_delay=args.ttft, tokens_per_second=args.tokens_per_second,
+                           chunk_size=args.chunk_size, reply_padding=args.reply_chars, error_rate=args.error_rate,
+                           mentions=WORKFLOW_MENTIONS, task_done_rate=args.task_done_rate)
+    llm = StubLLMServer(config).start()
+    app_process = None
+    try:
+        with tempfile.TemporaryDirectory(prefix="ai-workflow-bench-") as work_dir:
+            if args.url:
+                base_url = args.url.rstrip("/")
+                pid = args.app_pid
+            else:
+                env = {"AI_WORKFLOW_ASYNC_LLM": "1" if args.async_llm else "0"}
+                if args.workers:
+                    env["AI_WORKFLOW_TURN_WORKERS"] = str(args.workers)
+                app_process = AppProcess(llm.url, work_dir, env).start()
+                base_url, pid = app_process.url, app_process.pid
+            logger.info(f"模拟接口 {llm.url}，应用 {base_url}，{args.sessions} 个并发会话 x {args.turns} 个回合")
+
+            stats = BenchmarkStats()
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+                for _ in range(args.sessions):
+                    pool.submit(run_session, base_url, args.turns, stats, args.timeout)
+            wall = time.monotonic() - started
+
+            try:
+                scheduler = requests.get(f"{base_url}/scheduler_stats", timeout=5).json()
+            except (requests.exceptions.RequestException, ValueError):
+                scheduler = None
+            peak_rss = peak_rss_bytes(pid) if pid else None
+            if app_process is not None:
+                app_process.stop()
+    finally:
+        llm.stop()
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "serve_app")},
+        "sessions": {"started": args.sessions, "completed": stats.sessions_completed,
+                     "failed": stats.sessions_failed},
+        "turns": {"completed": len(stats.turn_latency), "errors": stats.turn_errors, "rejected_429": stats.rejected},
+        "wall_seconds": round(wall, 3),
+        "ttfb_seconds": summarize(stats.ttfb),
+        "turn_latency_seconds": summarize(stats.turn_latency),
+        "session_seconds": summarize(stats.session_duration),
+        "sessions_per_second": round(stats.sessions_completed / wall, 4) if wall else None,
+        "turns_per_second": round(len(stats.turn_latency) / wall, 4) if wall else None,
+        "peak_rss_bytes": peak_rss,
+        "llm_requests": config.requests_served,
+        "scheduler": scheduler,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多智能体工作流系统的端到端压测")
+    parser.add_argument("--sessions", type=int, default=10, help="并发的模拟浏览器会话数")
+    parser.add_argument("--turns", type=int, default=4, help="每个会话执行的回合数")
+    parser.add_argument("--ttft", type=float, default=0.2, help="模拟接口的首 token 时间（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="模拟接口的生成速度")
+    parser.add_argument("--chunk-size", type=int, default=4, help="每段（token）的字符数")
+    parser.add_argument("--reply-chars", type=int, default=200, help="回复中追加的填充字符数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟接口返回 503 的概率")
+    parser.add_argument("--task-done-rate", type=float, default=0.3, help="CEO 回复附带 [TASK_DONE] 的概率")
+    parser.add_argument("--workers", type=int, default=None, help="应用的回合工作线程数（AI_WORKFLOW_TURN_WORKERS）")
+    parser.add_argument("--async-llm", action="store_true", help="应用使用异步大模型客户端")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的读取超时（秒）")
+    parser.add_argument("--url", default=None, help="压测已运行的应用（须使用同一个模拟接口地址启动），不再启动子进程")
+    parser.add_argument("--app-pid", type=int, default=None, help="配合 --url 读取应用进程的内存峰值")
+    parser.add_argument("--output", default="benchmark_result.json", help="结果 JSON 文件")
+    parser.add_argument("--baseline", default=None, help="与之对比的历史结果 JSON 文件")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="允许的相对退化比例，超过时退出码为 1")
+    parser.add_argument("--serve-app", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_app:
+        serve_app(args.serve_app)
+        return
+
+    result = run_benchmark(args)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+
+    print(f"\n会话: {result['sessions']}，回合: {result['turns']}，耗时 {result['wall_seconds']} 秒")
+    for name in ("ttfb_seconds", "turn_latency_seconds"):
+        summary = result[name]
+        print(f"  {name:<22} p50={summary['p50']} p95={summary['p95']} p99={summary['p99']} max={summary['max']}")
+    print(f"  sessions_per_second    {result['sessions_per_second']}")
+    rss = result['peak_rss_bytes']
+    print(f"  peak_rss               {rss / 1024 / 1024:.1f} MiB" if rss else "  peak_rss               不可用")
+    print(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        print(f"\n与基线 {args.baseline}（{baseline.get('commit')}，{baseline.get('timestamp')}）对比:")
+        regressions = compare_with_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print(f"退化超过 {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
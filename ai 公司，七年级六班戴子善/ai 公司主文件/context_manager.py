@@ -0,0 +1,257 @@
+# File: context_manager.py
+# 按 token 预算组装智能体上下文
+# 记录每条对话的 token 数，最近的对话原文保留，较早的对话增量滚动摘要（结果缓存，只有新对话滑出窗口时才重新计算）
+
+import re
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("AI-Workflow-Context")
+
+DEFAULT_TOKEN_BUDGET = 8000
+
+# 中日韩字符大约一个字一个 token，其余文本大约四个字符一个 token
+_CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿豈-﫿＀-￯]')
+_MENTION_PATTERN = re.compile(r'@(ceo|analyst|writer|programmer|reviewer)\b', re.IGNORECASE)
+_SENTENCE_END = re.compile(r'(?<=[。！？!?.;；])\s*|\n')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数（不依赖分词器的近似值）
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _balance_code_fences(text: str, keep_tail: bool) -> str:
+    """截断后若留下未闭合的代码块，丢弃不完整的那一段"""
+    if text.count("```") % 2 == 0:
+        return text
+    if keep_tail:
+        # 保留结尾时，开头落在代码块中间：从第一个围栏之后开始
+        return text[text.index("```") + 3:].lstrip("\n")
+    # 保留开头时，结尾落在代码块中间：截到最后一个围栏之前
+    return text[:text.rindex("```")].rstrip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_tail: bool = True) -> str:
+    """
+    将文本截断到 token 上限内，尽量在段落或句子边界处截断，并避免截断半个代码块
+
+    Args:
+        text (str): 文本
+        max_tokens (int): token 上限
+        keep_tail (bool, optional): True 保留结尾（交接时结尾通常包含 @ 指令），False 保留开头
+
+    Returns:
+        str: 截断后的文本
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # 先按 token 估算粗切，再回退到最近的边界
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        piece = text[-mid:] if keep_tail else text[:mid]
+        if estimate_tokens(piece) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    piece = text[-low:] if keep_tail else text[:low]
+
+    boundaries = [m.end() for m in _SENTENCE_END.finditer(piece)]
+    if keep_tail:
+        cut = next((b for b in boundaries if b > 0), 0)
+        if cut and cut < len(piece) // 2:
+            piece = piece[cut:]
+    else:
+        cut = next((b for b in reversed(boundaries) if b < len(piece)), 0)
+        if cut > len(piece) // 2:
+            piece = piece[:cut]
+
+    piece = _balance_code_fences(piece.strip(), keep_tail)
+    return f"……{piece}" if keep_tail else f"{piece}……"
+
+
+class ContextTurn:
+    """一条对话记录"""
+    __slots__ = ("agent", "content", "tokens")
+
+    def __init__(self, agent: str, content: str):
+        self.agent = agent
+        self.content = content
+        self.tokens = estimate_tokens(content)
+
+
+def extractive_summarizer(previous_summary: str, turns: List[ContextTurn]) -> str:
+    """
+    默认的抽取式摘要：每条对话保留首句、标题、@ 指派和任务完成标记，不调用大模型
+
+    Args:
+        previous_summary (str): 已有的摘要
+        turns (List[ContextTurn]): 需要并入摘要的新对话
+
+    Returns:
+        str: 合并后的摘要
+    """
+    lines = [previous_summary] if previous_summary else []
+    for turn in turns:
+        content_lines = [line.strip() for line in turn.content.splitlines() if line.strip()]
+        if not content_lines:
+            continue
+        first = re.split(r'(?<=[。！？!?])', content_lines[0])[0][:120]
+        keys = []
+        for line in content_lines[1:]:
+            if line.startswith('#') or '[TASK_DONE]' in line.upper() or _MENTION_PATTERN.search(line):
+                keys.append(line[:80])
+            if len(keys) >= 3:
+                break
+        detail = "；".join([first] + keys)
+        lines.append(f"- @{turn.agent}: {detail}")
+    return "\n".join(lines)
+
+
+class ConversationContext:
+    """
+    工作流的对话上下文管理器。
+
+    在给定的 token 预算内为每个智能体组装输入：任务状态、较早对话的摘要、最近的对话原文、
+    本地文件内容和当前指令。摘要按增量方式生成并缓存，只有新对话滑出最近窗口时才更新。
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 summarizer: Optional[Callable[[str, List[ContextTurn]], str]] = None,
+                 max_raw_turns: int = 200):
+        """
+        初始化上下文管理器
+
+        Args:
+            token_budget (int, optional): 每次组装输入的 token 预算
+            summarizer (Optional[Callable]): 摘要函数，参数为已有摘要和新对话，默认使用抽取式摘要
+            max_raw_turns (int, optional): 最多保留的对话原文条数，更早的只保留在摘要中
+        """
+        self.token_budget = token_budget
+        self.summarizer = summarizer or extractive_summarizer
+        self.max_raw_turns = max_raw_turns
+        self.turns: List[ContextTurn] = []
+        self._summary = ""
+        self._summarized_upto = 0  # turns[:_summarized_upto] 已并入摘要
+
+    @property
+    def summary(self) -> str:
+        """当前缓存的摘要"""
+        return self._summary
+
+    def add_turn(self, agent: str, content: str) -> None:
+        """
+        记录一条对话
+
+        Args:
+            agent (str): 智能体ID（或 "user"）
+            content (str): 内容
+        """
+        if not content:
+            return
+        self.turns.append(ContextTurn(agent, content))
+        overflow = len(self.turns) - self.max_raw_turns
+        if overflow > 0:
+            self._update_summary(overflow)
+            del self.turns[:overflow]
+            self._summarized_upto -= overflow
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出对话原文和摘要（用于持久化）"""
+        return {
+            "turns": [[turn.agent, turn.content] for turn in self.turns],
+            "summary": self._summary,
+            "summarized_upto": self._summarized_upto
+        }
+
+    def load_dict(self, data: Dict[str, Any]) -> None:
+        """从 to_dict 的结果恢复（保留当前的预算和摘要函数）"""
+        self.turns = [ContextTurn(agent, content) for agent, content in data.get("turns", [])]
+        self._summary = data.get("summary", "")
+        self._summarized_upto = min(data.get("summarized_upto", 0), len(self.turns))
+
+    def reset(self) -> None:
+        """清空上下文"""
+        self.turns = []
+        self._summary = ""
+        self._summarized_upto = 0
+
+    def _update_summary(self, upto: int) -> None:
+        """将 turns[_summarized_upto:upto] 增量并入摘要"""
+        if upto <= self._summarized_upto:
+            return
+        try:
+            self._summary = self.summarizer(self._summary, self.turns[self._summarized_upto:upto])
+        except Exception as e:
+            logger.error(f"生成对话摘要失败，沿用旧摘要: {e}")
+        self._summarized_upto = upto
+
+    def build_prompt(self, instruction: str, task_state: str = "", file_context: str = "") -> str:
+        """
+        在 token 预算内组装智能体输入
+
+        Args:
+            instruction (str): 当前指令（用户输入或上一个智能体的交接内容）
+            task_state (str, optional): 待办事项状态
+            file_context (str, optional): 本地文件上下文
+
+        Returns:
+            str: 组装后的输入
+        """
+        budget = self.token_budget
+        raw_instruction = instruction
+        instruction = truncate_to_tokens(instruction, budget // 2)
+        budget -= estimate_tokens(instruction)
+        task_state = truncate_to_tokens(task_state, budget // 10, keep_tail=False)
+        budget -= estimate_tokens(task_state)
+        file_context = truncate_to_tokens(file_context, budget * 2 // 5, keep_tail=False)
+        budget -= estimate_tokens(file_context)
+
+        # 从最新往前选取能放进预算的对话原文（当前指令本身不重复放入）
+        summary_budget = budget // 4
+        recent_budget = budget - summary_budget
+        start = len(self.turns)
+        used = 0
+        for index in range(len(self.turns) - 1, -1, -1):
+            turn = self.turns[index]
+            if turn.content == raw_instruction:
+                start = index
+                continue
+            if used + turn.tokens > recent_budget:
+                break
+            used += turn.tokens
+            start = index
+
+        self._update_summary(start)
+        recent = [turn for turn in self.turns[max(start, self._summarized_upto):]
+                  if turn.content != raw_instruction]
+        summary = truncate_to_tokens(self._summary, summary_budget + (recent_budget - used))
+
+        sections = []
+        if task_state:
+            sections.append(f"[任务状态]\n{task_state}")
+        if summary:
+            sections.append(f"[此前对话摘要]\n{summary}")
+        if recent:
+            sections.append("[最近对话]\n" + "\n\n".join(f"@{turn.agent}:\n{turn.content}" for turn in recent))
+        if file_context:
+            sections.append(f"[本地文件内容]\n{file_context}")
+        if not sections:
+            return instruction
+        sections.append(f"[当前输入]\n{instruction}")
+        return "\n\n".join(sections)
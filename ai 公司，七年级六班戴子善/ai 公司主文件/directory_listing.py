@@ -0,0 +1,211 @@
+# File: directory_listing.py
+# 分页的目录列表
+# 用 os.scandir 读取目录（类型来自目录项自带的信息，每个条目只需一次 stat），
+# 服务端排序和过滤，基于游标分页；第一页总是重新读取目录，排好序的快照缓存起来供翻页复用
+
+import base64
+import json
+import os
+import threading
+import logging
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("AI-Workflow-Directory-Listing")
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+SORT_FIELDS = ("name", "size", "modified", "type")
+SNAPSHOT_CACHE_SIZE = 32
+
+
+def encode_cursor(key: Tuple) -> str:
+    """把排序键编码为不透明的游标字符串"""
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    """
+    解析游标
+
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii'))))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+
+
+class _Snapshot:
+    """某个目录按某种排序和过滤方式得到的有序快照（升序）"""
+    __slots__ = ("mtime", "items", "keys")
+
+    def __init__(self, mtime: float, items: List[Dict[str, Any]], keys: List[Tuple]):
+        self.mtime = mtime
+        self.items = items
+        self.keys = keys
+
+
+class DirectoryLister:
+    """
+    目录列表服务。
+
+    排序键为 (目录优先标记, 排序字段, 小写名称, 名称)，同一目录内唯一，
+    游标就是上一页最后一项的排序键，因此翻页期间目录内容变化也不会重复或跳过未变化的条目。
+    """
+
+    def __init__(self, cache_size: int = SNAPSHOT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._snapshots: "OrderedDict[tuple, _Snapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scan(path: str, include_hidden: bool, item_type: Optional[str],
+              extensions: Optional[set], name_filter: str) -> List[Dict[str, Any]]:
+        """读取目录并应用过滤条件"""
+        items = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = entry.name
+                if not include_hidden and name.startswith("."):
+                    continue
+                if name_filter and name_filter not in name.lower():
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if item_type and item_type != ('directory' if is_dir else 'file'):
+                    continue
+                if extensions and (is_dir or os.path.splitext(name)[1].lower() not in extensions):
+                    continue
+                try:
+                    stat = entry.stat()
+                    size, modified = stat.st_size, stat.st_mtime
+                except OSError:
+                    # 失效的符号链接等
+                    size, modified = 0, 0
+                items.append({
+                    'name': name,
+                    'path': entry.path,
+                    'size': size,
+                    'modified': modified,
+                    'type': 'directory' if is_dir else 'file'
+                })
+        return items
+
+    @staticmethod
+    def _sort_key(item: Dict[str, Any], sort: str, descending: bool, dirs_first: bool) -> Tuple:
+        is_dir = item['type'] == 'directory'
+        # 降序时整个列表反转，目录标记也相应反转，保证目录始终排在前面
+        rank = (0 if is_dir else 1) if not descending else (1 if is_dir else 0)
+        rank = rank if dirs_first else 0
+        lower = item['name'].lower()
+        if sort == "name":
+            primary = lower
+        elif sort == "type":
+            primary = os.path.splitext(lower)[1]
+        else:
+            primary = item[sort]
+        return (rank, primary, lower, item['name'])
+
+    def _snapshot(self, path: str, sort: str, descending: bool, dirs_first: bool, include_hidden: bool,
+                  item_type: Optional[str], extensions: Optional[set], name_filter: str,
+                  refresh: bool = False) -> _Snapshot:
+        """
+        获取有序快照。
+
+        refresh 为真（第一页）时总是重新读取目录：原地改写文件不会改变目录的 mtime，
+        缓存的 size 和 modified 可能已经过时。翻页时复用缓存，目录 mtime 变化（增删条目）才重新读取。
+        """
+        mtime = os.stat(path).st_mtime
+        cache_key = (path, sort, descending, dirs_first, include_hidden, item_type,
+                     tuple(sorted(extensions or ())), name_filter)
+        if not refresh:
+            with self._lock:
+                snapshot = self._snapshots.get(cache_key)
+                if snapshot is not None and snapshot.mtime == mtime:
+                    self._snapshots.move_to_end(cache_key)
+                    return snapshot
+
+        items = self._scan(path, include_hidden, item_type, extensions, name_filter)
+        keyed = sorted(((self._sort_key(item, sort, descending, dirs_first), item) for item in items),
+                       key=lambda pair: pair[0])
+        snapshot = _Snapshot(mtime, [item for _, item in keyed], [key for key, _ in keyed])
+        with self._lock:
+            self._snapshots[cache_key] = snapshot
+            self._snapshots.move_to_end(cache_key)
+            while len(self._snapshots) > self.cache_size:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def list_page(self, path: str, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                  sort: str = "name", order: str = "asc", dirs_first: bool = True,
+                  include_hidden: bool = True, item_type: Optional[str] = None,
+                  extensions: Optional[Iterable[str]] = None, name_filter: str = "") -> Dict[str, Any]:
+        """
+        列出目录的一页
+
+        Args:
+            path (str): 目录路径
+            cursor (Optional[str]): 上一页返回的 next_cursor，为None时从第一页开始
+            limit (int, optional): 每页条目数，不超过 MAX_PAGE_SIZE；为 0 时返回全部
+            sort (str, optional): 排序字段：name、size、modified 或 type（扩展名）
+            order (str, optional): asc 或 desc
+            dirs_first (bool, optional): 目录是否排在文件前面
+            include_hidden (bool, optional): 是否包含以 . 开头的条目
+            item_type (Optional[str]): 只保留 "file" 或 "directory"
+            extensions (Optional[Iterable[str]]): 只保留这些扩展名的文件
+            name_filter (str, optional): 名称中包含的文本（不区分大小写）
+
+        Returns:
+            Dict[str, Any]: path、total（过滤后的总数）、files（本页条目）和 next_cursor（没有下一页时为None）
+
+        Raises:
+            ValueError: 参数或游标无效
+            FileNotFoundError: 目录不存在
+            PermissionError: 无权读取目录
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"不支持的排序字段: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"不支持的排序方向: {order}")
+        if item_type not in (None, "file", "directory"):
+            raise ValueError(f"不支持的类型: {item_type}")
+        path = os.path.abspath(os.path.expanduser(path))
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"目录不存在: {path}")
+        descending = order == "desc"
+        exts = {ext.lower() if ext.startswith(".") else f".{ext.lower()}" for ext in (extensions or ()) if ext}
+
+        snapshot = self._snapshot(path, sort, descending, dirs_first, include_hidden,
+                                  item_type, exts or None, name_filter.lower(), refresh=cursor is None)
+        total = len(snapshot.items)
+        limit = total if limit <= 0 else min(limit, MAX_PAGE_SIZE)
+
+        cursor_key = decode_cursor(cursor) if cursor else None
+        try:
+            if not descending:
+                start = bisect_right(snapshot.keys, cursor_key) if cursor_key else 0
+                end = min(total, start + limit)
+                page = snapshot.items[start:end]
+                last_key = snapshot.keys[end - 1] if page else None
+                has_more = end < total
+            else:
+                end = bisect_left(snapshot.keys, cursor_key) if cursor_key else total
+                start = max(0, end - limit)
+                page = snapshot.items[start:end][::-1]
+                last_key = snapshot.keys[start] if page else None
+                has_more = start > 0
+        except TypeError as e:
+            # 游标来自另一种排序方式，排序键的类型不可比较
+            raise ValueError("游标与当前的排序方式不匹配") from e
+
+        return {
+            'path': path,
+            'total': total,
+            'files': page,
+            'next_cursor': encode_cursor(last_key) if has_more and last_key is not None else None
+        }
@@ -0,0 +1,382 @@
+# File: file_index.py
+# 本地文件检索索引
+# 遍历文件和文件夹、切分文本块、建立 BM25 词法索引并持久化到磁盘；
+# 按 mtime/大小判断变化、按内容哈希确认，只重建变化的文件；大文件夹的切分在多个进程中并行
+
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import threading
+import time
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from context_manager import estimate_tokens
+
+logger = logging.getLogger("AI-Workflow-File-Index")
+
+INDEX_VERSION = 1
+DEFAULT_CHUNK_CHARS = 1200
+DEFAULT_MAX_FILE_BYTES = 5 * 1024 * 1024
+# 变化的文件数超过该值才启用多进程（进程启动本身有开销）
+PARALLEL_THRESHOLD = 16
+
+_SKIP_DIRS = {".git", ".svn", ".hg", "__pycache__", "node_modules", ".venv", "venv", ".idea", ".vscode"}
+_WORD_PATTERN = re.compile(r'[a-z0-9_]+|[㐀-䶿一-鿿豈-﫿]+')
+_CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]')
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：英文和数字按单词切分并转小写，中文按单字和相邻二字切分
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        List[str]: 词项列表
+    """
+    tokens = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if _CJK_RUN.match(word):
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        elif len(word) > 1:
+            tokens.append(word)
+    return tokens
+
+
+def split_chunks(text: str, chunk_chars: int = DEFAULT_CHUNK_CHARS) -> List[Tuple[int, str]]:
+    """
+    按段落把文本切成不超过 chunk_chars 的文本块，过长的段落按行再切
+
+    Args:
+        text (str): 文本
+        chunk_chars (int, optional): 每块的最大字符数
+
+    Returns:
+        List[Tuple[int, str]]: (起始行号, 文本块) 列表，行号从 1 开始
+    """
+    chunks = []
+    current: List[str] = []
+    current_len = 0
+    start_line = 1
+    line_no = 1
+    for line in text.splitlines(keepends=True):
+        while len(line) > chunk_chars:
+            # 单行超长（例如压缩过的文件）时硬切
+            if current:
+                chunks.append((start_line, "".join(current)))
+                current, current_len = [], 0
+            chunks.append((line_no, line[:chunk_chars]))
+            line = line[chunk_chars:]
+        paragraph_end = not line.strip()
+        if current and (current_len + len(line) > chunk_chars or (paragraph_end and current_len > chunk_chars // 2)):
+            chunks.append((start_line, "".join(current)))
+            current, current_len = [], 0
+        if not current:
+            start_line = line_no
+        current.append(line)
+        current_len += len(line)
+        line_no += 1
+    if current and "".join(current).strip():
+        chunks.append((start_line, "".join(current)))
+    return [(line, chunk) for line, chunk in chunks if chunk.strip()]
+
+
+def _read_text(path: str, max_bytes: int) -> Optional[bytes]:
+    """读取文本文件的原始字节；二进制文件或超出大小上限时返回None"""
+    try:
+        if os.path.getsize(path) > max_bytes:
+            return None
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError as e:
+        logger.warning(f"无法读取文件: {path}, 错误信息: {e}")
+        return None
+    if b"\x00" in data[:4096]:
+        return None
+    return data
+
+
+def _index_file(path: str, chunk_chars: int, max_bytes: int) -> Optional[Dict[str, Any]]:
+    """
+    读取并切分单个文件，计算每个文本块的词频（在工作进程中执行）
+
+    Returns:
+        Optional[Dict[str, Any]]: 文件记录，无法读取时返回None；二进制或超大文件记录为没有文本块，
+        以免每次同步都重新检查
+    """
+    data = _read_text(path, max_bytes)
+    if data is None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return {"mtime": stat.st_mtime, "size": stat.st_size, "sha1": "", "chunks": []}
+    text = data.decode('utf-8', errors='replace')
+    chunks = []
+    for line, chunk in split_chunks(text, chunk_chars):
+        tf = Counter(tokenize(chunk))
+        if tf:
+            chunks.append({"line": line, "text": chunk, "tf": dict(tf), "length": sum(tf.values())})
+    stat = os.stat(path)
+    return {"mtime": stat.st_mtime, "size": stat.st_size,
+            "sha1": hashlib.sha1(data).hexdigest(), "chunks": chunks}
+
+
+def _index_file_args(args: Tuple[str, int, int]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    path = args[0]
+    return path, _index_file(*args)
+
+
+def iter_files(paths: Iterable[str]) -> Iterator[str]:
+    """
+    遍历文件和文件夹，产出所有文件的绝对路径（跳过隐藏目录和常见的依赖、缓存目录）
+
+    Args:
+        paths (Iterable[str]): 文件或文件夹路径
+
+    Yields:
+        str: 文件路径
+    """
+    for path in paths:
+        path = os.path.abspath(os.path.expanduser(path))
+        if os.path.isfile(path):
+            yield path
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = [d for d in dirs if d not in _SKIP_DIRS and not d.startswith('.')]
+                for name in files:
+                    yield os.path.join(root, name)
+        else:
+            logger.warning(f"指定路径无效: {path}")
+
+
+class SearchResult:
+    """一条检索结果"""
+    __slots__ = ("path", "line", "text", "score")
+
+    def __init__(self, path: str, line: int, text: str, score: float):
+        self.path = path
+        self.line = line
+        self.text = text
+        self.score = score
+
+
+class FileIndex:
+    """
+    本地文件的 BM25 检索索引。
+
+    ``update`` 增量同步索引：mtime 和大小都没变的文件直接跳过；变了的文件先比较内容哈希，
+    内容相同只更新元数据，内容不同才重新切分。索引以 JSON 形式保存在 ``index_path``。
+    ``search`` 只返回与查询最相关的 top-k 文本块，``build_context`` 在 token 预算内拼接结果。
+    """
+
+    def __init__(self, index_path: Optional[str] = None, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                 max_file_bytes: int = DEFAULT_MAX_FILE_BYTES, max_workers: Optional[int] = None):
+        """
+        初始化索引
+
+        Args:
+            index_path (Optional[str]): 索引文件路径，为None时只保存在内存中
+            chunk_chars (int, optional): 每个文本块的最大字符数
+            max_file_bytes (int, optional): 超过该大小的文件不建索引
+            max_workers (Optional[int]): 并行切分的进程数，默认为 CPU 核数
+        """
+        self.index_path = index_path
+        self.chunk_chars = chunk_chars
+        self.max_file_bytes = max_file_bytes
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._chunk_refs: List[Tuple[str, int]] = []
+        self._avg_length = 0.0
+        if index_path:
+            self._load()
+        self._rebuild_postings()
+
+    def _load(self) -> None:
+        """从磁盘加载索引"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"索引文件损坏，将重新建立: {self.index_path}, 错误信息: {e}")
+            return
+        if data.get("version") != INDEX_VERSION or data.get("chunk_chars") != self.chunk_chars:
+            logger.info("索引格式或切分参数已变化，将重新建立")
+            return
+        self.files = data.get("files", {})
+
+    def _save(self) -> None:
+        """原子地把索引写回磁盘"""
+        if not self.index_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({"version": INDEX_VERSION, "chunk_chars": self.chunk_chars, "files": self.files},
+                          file, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.error(f"保存索引失败: {self.index_path}, 错误信息: {e}")
+
+    def _rebuild_postings(self) -> None:
+        """根据文件记录重建倒排表和平均块长度"""
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        refs: List[Tuple[str, int]] = []
+        total_length = 0
+        for path, record in self.files.items():
+            for chunk_no, chunk in enumerate(record["chunks"]):
+                chunk_id = len(refs)
+                refs.append((path, chunk_no))
+                total_length += chunk["length"]
+                for term, freq in chunk["tf"].items():
+                    postings[term].append((chunk_id, freq))
+        self._postings = dict(postings)
+        self._chunk_refs = refs
+        self._avg_length = total_length / len(refs) if refs else 0.0
+
+    def update(self, paths: Iterable[str]) -> Dict[str, int]:
+        """
+        增量同步索引，使其与给定的文件和文件夹一致
+
+        Args:
+            paths (Iterable[str]): 文件或文件夹路径
+
+        Returns:
+            Dict[str, int]: 本次新增/更新、未变化、删除的文件数
+        """
+        started = time.time()
+        with self._lock:
+            seen = set()
+            changed: List[str] = []
+            touched = 0
+            for path in iter_files(paths):
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                record = self.files.get(path)
+                if record and record["mtime"] == stat.st_mtime and record["size"] == stat.st_size:
+                    continue
+                if record and record["size"] == stat.st_size:
+                    # mtime 变了但内容可能没变（例如被 touch 或重新检出），用哈希确认
+                    data = _read_text(path, self.max_file_bytes)
+                    if data is not None and hashlib.sha1(data).hexdigest() == record["sha1"]:
+                        record["mtime"] = stat.st_mtime
+                        touched += 1
+                        continue
+                changed.append(path)
+
+            removed = [path for path in self.files if path not in seen]
+            for path in removed:
+                del self.files[path]
+
+            for path, record in self._index_files(changed):
+                if record is None:
+                    self.files.pop(path, None)
+                else:
+                    self.files[path] = record
+
+            if changed or removed or touched:
+                self._rebuild_postings()
+                self._save()
+        stats = {"indexed": len(changed), "unchanged": len(seen) - len(changed), "removed": len(removed)}
+        if changed or removed:
+            logger.info(f"文件索引已更新: {stats}，耗时 {time.time() - started:.2f}s")
+        return stats
+
+    def _index_files(self, paths: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """切分变化的文件；文件较多时在多个进程中并行"""
+        jobs = [(path, self.chunk_chars, self.max_file_bytes) for path in paths]
+        if len(jobs) < PARALLEL_THRESHOLD or self.max_workers <= 1:
+            return [_index_file_args(job) for job in jobs]
+        try:
+            # 用 spawn 启动子进程：索引在 Flask 和工作流的多线程进程里运行，fork 会把其他线程持有的锁原样复制进子进程
+            with ProcessPoolExecutor(max_workers=self.max_workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                return list(executor.map(_index_file_args, jobs, chunksize=8))
+        except (OSError, RuntimeError) as e:
+            # 某些环境（如受限的容器）无法创建子进程，退回线程池
+            logger.warning(f"无法启动多进程建索引，改用线程池: {e}")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                return list(executor.map(_index_file_args, jobs))
+
+    def search(self, query: str, top_k: int = 5) -> List[SearchResult]:
+        """
+        用 BM25 检索与查询最相关的文本块
+
+        Args:
+            query (str): 查询文本
+            top_k (int, optional): 返回的结果数
+
+        Returns:
+            List[SearchResult]: 按相关度从高到低排列的结果
+        """
+        with self._lock:
+            total = len(self._chunk_refs)
+            if not total:
+                return []
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, freq in postings:
+                    path, chunk_no = self._chunk_refs[chunk_id]
+                    length = self.files[path]["chunks"][chunk_no]["length"]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self._avg_length or 1))
+                    scores[chunk_id] += idf * freq * (BM25_K1 + 1) / (freq + norm)
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            results = []
+            for chunk_id, score in best:
+                path, chunk_no = self._chunk_refs[chunk_id]
+                chunk = self.files[path]["chunks"][chunk_no]
+                results.append(SearchResult(path, chunk["line"], chunk["text"], score))
+            return results
+
+    def build_context(self, query: str, token_budget: int, top_k: int = 8) -> str:
+        """
+        检索相关文本块并在 token 预算内拼接成上下文
+
+        Args:
+            query (str): 查询文本
+            token_budget (int): token 预算
+            top_k (int, optional): 最多检索的结果数
+
+        Returns:
+            str: 格式化的文件上下文，无结果时返回空字符串
+        """
+        sections = []
+        used = 0
+        for result in self.search(query, top_k):
+            section = f"[文件片段] {result.path} (第 {result.line} 行起):\n{result.text.strip()}\n"
+            tokens = estimate_tokens(section)
+            if used + tokens > token_budget:
+                continue
+            sections.append(section)
+            used += tokens
+        return "\n".join(sections)
+
+    def stats(self) -> Dict[str, Any]:
+        """索引规模统计"""
+        with self._lock:
+            return {"files": len(self.files), "chunks": len(self._chunk_refs), "terms": len(self._postings)}
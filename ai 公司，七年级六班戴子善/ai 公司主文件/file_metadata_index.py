@@ -0,0 +1,319 @@
+# File: file_metadata_index.py
+# 持久化的文件元数据索引
+# 用 SQLite（WAL）记录路径、大小、修改时间、类型和扩展名；按目录 mtime 增量刷新，
+# 只重新列出发生过增删改名的目录；文件名建立三元组索引，文件名搜索和目录列表不必重新遍历
+
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from file_search import PSEUDO_FILESYSTEMS
+
+logger = logging.getLogger("AI-Workflow-Metadata-Index")
+
+_COLUMNS = "path, name, ext, type, size, mtime"
+
+
+def name_trigrams(name: str) -> Set[str]:
+    """文件名（小写）的所有三元组"""
+    name = name.lower()
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+
+def _subtree_range(path: str) -> tuple:
+    """path 下所有后代路径的字典序范围（'0' 是 '/' 之后的下一个字符）"""
+    prefix = path.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def _row_to_item(row: tuple) -> Dict[str, Any]:
+    path, name, ext, item_type, size, mtime = row
+    return {'name': name, 'path': path, 'ext': ext, 'type': item_type, 'size': size, 'modified': mtime}
+
+
+class FileMetadataIndex:
+    """
+    文件元数据索引。
+
+    目录的 mtime 只在其中的条目增删或改名时变化，因此 ``refresh`` 对 mtime 未变的目录
+    直接沿用库中的子目录列表继续向下检查，只有变化的目录才重新 scandir。
+    注意：文件内容被改写不会改变所在目录的 mtime，需要精确的大小和修改时间时可用
+    ``refresh(..., full=True)`` 强制重新读取；``list_directory`` 只涉及一个目录，每次都重新读取。
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        初始化索引
+
+        Args:
+            db_path (Optional[str]): SQLite 文件路径，为None时使用内存数据库
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                parent TEXT NOT NULL,
+                name TEXT NOT NULL,
+                name_lower TEXT NOT NULL,
+                ext TEXT NOT NULL,
+                type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_parent ON files(parent);
+            CREATE INDEX IF NOT EXISTS idx_files_name ON files(name_lower);
+            CREATE INDEX IF NOT EXISTS idx_files_ext ON files(ext);
+            CREATE INDEX IF NOT EXISTS idx_files_size ON files(size);
+            CREATE INDEX IF NOT EXISTS idx_files_mtime ON files(mtime);
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                scanned_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS name_grams (
+                gram TEXT NOT NULL,
+                path TEXT NOT NULL,
+                PRIMARY KEY (gram, path)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_name_grams_path ON name_grams(path);
+        """)
+        self._conn.commit()
+
+    # ---- 刷新 ----
+
+    def refresh(self, root: str, max_depth: Optional[int] = None, full: bool = False) -> Dict[str, int]:
+        """
+        增量刷新 root 下的索引
+
+        Args:
+            root (str): 起点目录
+            max_depth (Optional[int]): 最大深度，root 本身深度为 0
+            full (bool, optional): 为True时忽略目录 mtime，重新读取所有目录
+
+        Returns:
+            Dict[str, int]: 重新读取的目录数、跳过的目录数和删除的条目数
+        """
+        root = os.path.abspath(os.path.expanduser(root))
+        stats = {"scanned": 0, "skipped": 0, "removed": 0}
+        started = time.time()
+        with self._lock:
+            stack = [(root, 0)]
+            while stack:
+                directory, depth = stack.pop()
+                subdirs = self._refresh_dir(directory, full, stats)
+                if max_depth is None or depth < max_depth:
+                    stack.extend((subdir, depth + 1) for subdir in subdirs
+                                 if subdir not in PSEUDO_FILESYSTEMS)
+            self._conn.commit()
+        if stats["scanned"]:
+            logger.info(f"元数据索引已刷新 {root}: {stats}，耗时 {time.time() - started:.2f}s")
+        return stats
+
+    def _refresh_dir(self, directory: str, full: bool, stats: Dict[str, int]) -> List[str]:
+        """检查单个目录，必要时重新列出；返回其子目录（调用方持有锁）"""
+        try:
+            dir_mtime = os.stat(directory).st_mtime
+        except OSError:
+            stats["removed"] += self._remove_subtree(directory)
+            return []
+        row = self._conn.execute("SELECT mtime FROM dirs WHERE path = ?", (directory,)).fetchone()
+        if not full and row is not None and row[0] == dir_mtime:
+            stats["skipped"] += 1
+            return [r[0] for r in self._conn.execute(
+                "SELECT path FROM files WHERE parent = ? AND type = 'directory'", (directory,))]
+
+        stats["scanned"] += 1
+        existing = {r[0] for r in self._conn.execute("SELECT path FROM files WHERE parent = ?", (directory,))}
+        rows, grams, subdirs = [], [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    ext = "" if is_dir else os.path.splitext(entry.name)[1].lower()
+                    rows.append((entry.path, directory, entry.name, entry.name.lower(), ext,
+                                 'directory' if is_dir else 'file', stat.st_size, stat.st_mtime))
+                    if entry.path not in existing:
+                        grams.extend((gram, entry.path) for gram in name_trigrams(entry.name))
+                    else:
+                        existing.discard(entry.path)
+                    if is_dir:
+                        subdirs.append(entry.path)
+        except OSError as e:
+            logger.debug(f"无法读取目录 {directory}: {e}")
+            return []
+
+        for path in existing:
+            stats["removed"] += self._remove_subtree(path, include_self=True)
+        self._conn.executemany("INSERT OR REPLACE INTO files (path, parent, name, name_lower, ext, type, size, mtime) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._conn.executemany("INSERT OR IGNORE INTO name_grams (gram, path) VALUES (?, ?)", grams)
+        self._conn.execute("INSERT OR REPLACE INTO dirs (path, mtime, scanned_at) VALUES (?, ?, ?)",
+                           (directory, dir_mtime, time.time()))
+        return subdirs
+
+    def _remove_subtree(self, path: str, include_self: bool = True) -> int:
+        """删除 path（及其所有后代）的记录，返回删除的条目数（调用方持有锁）"""
+        low, high = _subtree_range(path)
+        removed = 0
+        for table in ("files", "name_grams", "dirs"):
+            cursor = self._conn.execute(f"DELETE FROM {table} WHERE path >= ? AND path < ?", (low, high))
+            if table == "files":
+                removed += cursor.rowcount
+            if include_self:
+                cursor = self._conn.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+                if table == "files":
+                    removed += cursor.rowcount
+        return removed
+
+    # ---- 查询 ----
+
+    def list_directory(self, path: str, refresh: bool = True) -> List[Dict[str, Any]]:
+        """
+        列出目录内容（目录在前，按名称排序）
+
+        Args:
+            path (str): 目录路径
+            refresh (bool, optional): 是否先重新读取该目录（一次 scandir），保证大小和修改时间是最新的；
+                为 False 时直接返回库中的记录
+
+        Returns:
+            List[Dict[str, Any]]: 条目列表（name、path、ext、type、size、modified）
+
+        Raises:
+            FileNotFoundError: 目录不存在
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"目录不存在: {path}")
+        with self._lock:
+            if refresh:
+                # 原地改写文件不会改变目录 mtime，单个目录直接重新读取
+                self._refresh_dir(path, True, {"scanned": 0, "skipped": 0, "removed": 0})
+                self._conn.commit()
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM files WHERE parent = ? "
+                f"ORDER BY type = 'file', name_lower", (path,)
+            ).fetchall()
+        return [_row_to_item(row) for row in rows]
+
+    def search_names(self, query: str, root: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+        """
+        按文件名子串搜索（不区分大小写）；三个字符以上的查询走三元组索引
+
+        Args:
+            query (str): 文件名中包含的文本
+            root (Optional[str]): 只搜索该目录下的条目
+            limit (int, optional): 最多返回的条目数
+
+        Returns:
+            List[Dict[str, Any]]: 匹配的条目
+        """
+        needle = query.lower()
+        if not needle:
+            return []
+        conditions, params = ["instr(name_lower, ?) > 0"], [needle]
+        grams = sorted(name_trigrams(needle))
+        if grams:
+            placeholders = ", ".join("?" * len(grams))
+            conditions.append(
+                f"path IN (SELECT path FROM name_grams WHERE gram IN ({placeholders}) "
+                f"GROUP BY path HAVING COUNT(*) = ?)"
+            )
+            params.extend(grams)
+            params.append(len(grams))
+        if root:
+            low, high = _subtree_range(os.path.abspath(os.path.expanduser(root)))
+            conditions.append("path >= ? AND path < ?")
+            params.extend([low, high])
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM files WHERE {' AND '.join(conditions)} "
+                f"ORDER BY length(name), name_lower LIMIT ?", params
+            ).fetchall()
+        return [_row_to_item(row) for row in rows]
+
+    def query(self, root: Optional[str] = None, extensions: Optional[Iterable[str]] = None,
+              min_size: Optional[int] = None, max_size: Optional[int] = None,
+              older_than: Optional[float] = None, newer_than: Optional[float] = None,
+              item_type: Optional[str] = "file", order_by: str = "size", descending: bool = True,
+              limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        按大小、修改时间和扩展名查询条目（供文件整理员使用，例如“找出超过 100MB 的视频”）
+
+        Args:
+            root (Optional[str]): 只查询该目录下的条目
+            extensions (Optional[Iterable[str]]): 扩展名（如 ".mp4"、"pdf"）
+            min_size (Optional[int]): 最小字节数
+            max_size (Optional[int]): 最大字节数
+            older_than (Optional[float]): 只保留最后修改距今超过该秒数的条目
+            newer_than (Optional[float]): 只保留最后修改距今不超过该秒数的条目
+            item_type (Optional[str]): "file"、"directory"，为None时不限
+            order_by (str, optional): 排序字段：size、mtime 或 name
+            descending (bool, optional): 是否降序
+            limit (int, optional): 最多返回的条目数
+
+        Returns:
+            List[Dict[str, Any]]: 匹配的条目
+        """
+        order_column = {"size": "size", "mtime": "mtime", "name": "name_lower"}.get(order_by)
+        if order_column is None:
+            raise ValueError(f"不支持的排序字段: {order_by}")
+        conditions, params = [], []
+        if root:
+            low, high = _subtree_range(os.path.abspath(os.path.expanduser(root)))
+            conditions.append("path >= ? AND path < ?")
+            params.extend([low, high])
+        exts = [ext.lower() if ext.startswith(".") else f".{ext.lower()}" for ext in (extensions or ()) if ext]
+        if exts:
+            conditions.append(f"ext IN ({', '.join('?' * len(exts))})")
+            params.extend(exts)
+        if min_size is not None:
+            conditions.append("size >= ?")
+            params.append(min_size)
+        if max_size is not None:
+            conditions.append("size <= ?")
+            params.append(max_size)
+        now = time.time()
+        if older_than is not None:
+            conditions.append("mtime <= ?")
+            params.append(now - older_than)
+        if newer_than is not None:
+            conditions.append("mtime >= ?")
+            params.append(now - newer_than)
+        if item_type:
+            conditions.append("type = ?")
+            params.append(item_type)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM files {where} "
+                f"ORDER BY {order_column} {'DESC' if descending else 'ASC'} LIMIT ?", params
+            ).fetchall()
+        return [_row_to_item(row) for row in rows]
+
+    def get_stats(self) -> Dict[str, int]:
+        """索引规模统计"""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            dirs = self._conn.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+        return {"entries": files, "scanned_dirs": dirs}
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
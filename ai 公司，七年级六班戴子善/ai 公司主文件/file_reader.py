@@ -0,0 +1,199 @@
+# File: file_reader.py
+# 有上限的本地文件读取
+# 按偏移/长度、开头或结尾分段读取，大文件通过 mmap 访问，不把整个文件读入内存；
+# 自动识别编码，并识别二进制文件
+
+import codecs
+import mmap
+import os
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger("AI-Workflow-File-Reader")
+
+# 单次读取的默认长度和上限（字节）
+DEFAULT_READ_BYTES = 256 * 1024
+MAX_READ_BYTES = 4 * 1024 * 1024
+# 超过该大小的文件使用 mmap，小文件直接读取
+MMAP_THRESHOLD = 1024 * 1024
+# 用于识别编码和二进制文件的采样长度
+SNIFF_BYTES = 8192
+
+READ_MODES = ("range", "head", "tail")
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+
+def is_binary(sample: bytes) -> bool:
+    """
+    判断采样数据是否来自二进制文件：含有 NUL 字节，或不可打印控制字符占比过高
+
+    Args:
+        sample (bytes): 文件开头的采样数据
+
+    Returns:
+        bool: 是否为二进制文件
+    """
+    if not sample or sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return False
+    if b"\x00" in sample:
+        return True
+    control = sum(1 for byte in sample if byte < 32 and byte not in (9, 10, 12, 13, 27))
+    return control / len(sample) > 0.1
+
+
+def sniff_encoding(sample: bytes) -> str:
+    """
+    识别文本编码：先看 BOM，再依次尝试 UTF-8、GB18030，最后退回 latin-1
+
+    Args:
+        sample (bytes): 文件开头的采样数据
+
+    Returns:
+        str: 编码名称
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    for encoding in ("utf-8", "gb18030"):
+        try:
+            # 采样可能截断在多字节字符中间，只检查完整的部分
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def _align_utf8(data: bytes, at_start: bool, at_end: bool) -> Tuple[int, int]:
+    """返回去掉首尾不完整 UTF-8 字符后的切片范围"""
+    start, end = 0, len(data)
+    if not at_start:
+        # 跳过开头的续字节（10xxxxxx）
+        while start < end and start < 3 and 0x80 <= data[start] < 0xC0:
+            start += 1
+    if not at_end:
+        # 结尾若是未写完的多字节字符，退回到它的首字节之前
+        for back in range(1, min(4, end - start) + 1):
+            byte = data[end - back]
+            if byte < 0x80:
+                break
+            if byte >= 0xC0:
+                needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+                if needed > back:
+                    end -= back
+                break
+    return start, end
+
+
+def _slice(path: str, size: int, start: int, end: int) -> bytes:
+    """读取 [start, end) 范围的字节，大文件通过 mmap 访问"""
+    with open(path, 'rb') as file:
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[start:end]
+        file.seek(start)
+        return file.read(end - start)
+
+
+def read_range(path: str, offset: int = 0, length: int = DEFAULT_READ_BYTES, mode: str = "range",
+               encoding: Optional[str] = None) -> Dict[str, Any]:
+    """
+    分段读取文件
+
+    Args:
+        path (str): 文件路径
+        offset (int, optional): range 模式下的起始偏移（字节）
+        length (int, optional): 读取长度（字节），不超过 MAX_READ_BYTES
+        mode (str, optional): range 按偏移读取，head 读取开头，tail 读取结尾
+        encoding (Optional[str]): 文本编码，默认自动识别
+
+    Returns:
+        Dict[str, Any]: 读取结果，包含 content、编码、实际范围（offset/end）、文件大小、
+        是否到达文件末尾（eof）和是否为二进制文件（binary，此时 content 为None）
+
+    Raises:
+        ValueError: 参数无效
+        OSError: 文件不存在或无法读取
+    """
+    if mode not in READ_MODES:
+        raise ValueError(f"不支持的读取模式: {mode}")
+    if offset < 0 or length <= 0:
+        raise ValueError("offset 不能为负数，length 必须为正数")
+    length = min(length, MAX_READ_BYTES)
+
+    path = os.path.abspath(os.path.expanduser(path))
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"文件不存在: {path}")
+    size = os.path.getsize(path)
+
+    if mode == "head":
+        start = 0
+    elif mode == "tail":
+        start = max(0, size - length)
+    else:
+        start = min(offset, size)
+    end = min(size, start + length)
+
+    with open(path, 'rb') as file:
+        sample = file.read(SNIFF_BYTES)
+    result = {
+        "path": path,
+        "size": size,
+        "offset": start,
+        "end": end,
+        "eof": end >= size,
+        "binary": is_binary(sample),
+        "encoding": None,
+        "content": None
+    }
+    if result["binary"]:
+        return result
+
+    encoding = encoding or sniff_encoding(sample)
+    data = _slice(path, size, start, end) if end > start else b""
+    if encoding.startswith("utf-8"):
+        if start == 0 and encoding == "utf-8-sig":
+            data = data[len(codecs.BOM_UTF8):]
+            start += len(codecs.BOM_UTF8)
+        cut_start, cut_end = _align_utf8(data, start == 0, end >= size)
+        data = data[cut_start:cut_end]
+        result["offset"] = start + cut_start
+        result["end"] = start + cut_start + len(data)
+    if mode == "tail" and start > 0:
+        # 结尾模式从第一个完整行开始
+        newline = data.find(b"\n", 0, 4096)
+        if newline != -1:
+            data = data[newline + 1:]
+            result["offset"] = result["end"] - len(data)
+
+    result["encoding"] = encoding
+    result["content"] = data.decode(encoding.replace("-sig", ""), errors='replace')
+    return result
+
+
+def read_text(path: str, max_bytes: int = DEFAULT_READ_BYTES) -> str:
+    """
+    读取文本文件的开头，超出 max_bytes 的部分截断并附加说明
+
+    Args:
+        path (str): 文件路径
+        max_bytes (int, optional): 最多读取的字节数
+
+    Returns:
+        str: 文件内容；二进制文件返回说明文字
+
+    Raises:
+        OSError: 文件不存在或无法读取
+    """
+    result = read_range(path, length=max_bytes, mode="head")
+    if result["binary"]:
+        return f"[二进制文件，未读取内容，大小 {result['size']} 字节]"
+    content = result["content"]
+    if not result["eof"]:
+        content += f"\n…… [文件共 {result['size']} 字节，仅读取了前 {result['end']} 字节]"
+    return content
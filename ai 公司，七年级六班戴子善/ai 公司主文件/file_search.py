@@ -0,0 +1,289 @@
+# File: file_search.py
+# 并行的文件搜索
+# 多个工作线程用 os.scandir 并行遍历目录，支持子串/通配符/正则匹配、扩展名过滤、
+# .gitignore 风格的忽略规则、深度和结果数限制、取消，并在遍历过程中逐条产出结果
+
+import fnmatch
+import os
+import queue
+import re
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("AI-Workflow-File-Search")
+
+DEFAULT_MAX_RESULTS = 1000
+DEFAULT_WORKERS = 8
+RESULT_BATCH_SIZE = 64
+MATCH_MODES = ("substring", "glob", "regex")
+
+# 伪文件系统和常见的依赖、缓存目录，默认不进入
+PSEUDO_FILESYSTEMS = ("/proc", "/sys", "/dev", "/run", "/private/var/vm", "/System/Volumes")
+DEFAULT_IGNORES = (".git/", ".svn/", ".hg/", "__pycache__/", "node_modules/", ".venv/", ".Trash/")
+
+_DONE = object()
+
+
+class IgnoreRules:
+    """
+    .gitignore 风格的忽略规则（不支持 ! 取反）：
+
+    - ``name`` 或 ``*.log`` 匹配任意层级的文件或目录名
+    - 以 ``/`` 结尾的规则只匹配目录
+    - 含 ``/`` 的规则相对于规则所在目录匹配路径
+    """
+
+    def __init__(self, patterns: Iterable[str] = (), base: str = ""):
+        self.rules: List[Tuple[str, str, bool, bool]] = []
+        self.extend(patterns, base)
+
+    def extend(self, patterns: Iterable[str], base: str = "") -> "IgnoreRules":
+        """添加规则，base 为规则所在的目录"""
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith(("#", "!")):
+                continue
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            self.rules.append((base, pattern.lstrip("/"), dir_only, anchored))
+        return self
+
+    def child(self, directory: str) -> "IgnoreRules":
+        """进入目录时读取其中的 .gitignore，返回子树使用的规则（没有 .gitignore 时返回自身）"""
+        try:
+            with open(os.path.join(directory, ".gitignore"), 'r', encoding='utf-8', errors='replace') as file:
+                patterns = file.read().splitlines()
+        except OSError:
+            return self
+        rules = IgnoreRules()
+        rules.rules = list(self.rules)
+        return rules.extend(patterns, directory)
+
+    def ignored(self, path: str, name: str, is_dir: bool) -> bool:
+        """判断路径是否被忽略"""
+        for base, pattern, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if anchored:
+                if base and path.startswith(base + os.sep):
+                    relative = path[len(base) + 1:]
+                else:
+                    relative = path.lstrip(os.sep)
+                if fnmatch.fnmatchcase(relative, pattern):
+                    return True
+            elif fnmatch.fnmatchcase(name, pattern):
+                return True
+        return False
+
+
+class FileSearch:
+    """
+    一次文件搜索。
+
+    用法::
+
+        search = FileSearch("/home/user", "*.py", mode="glob", max_results=100)
+        for item in search.iter_results():
+            print(item["path"])
+        # 在其他线程中可调用 search.cancel() 提前结束
+
+    目录由工作线程池并行遍历，匹配结果通过队列逐条交给调用方。
+    """
+
+    def __init__(self, root: str, pattern: str = "", mode: str = "substring",
+                 extensions: Optional[Iterable[str]] = None, ignore: Optional[Iterable[str]] = None,
+                 use_gitignore: bool = True, include_hidden: bool = False,
+                 include_dirs: bool = False, max_depth: Optional[int] = None,
+                 max_results: int = DEFAULT_MAX_RESULTS, workers: int = DEFAULT_WORKERS,
+                 case_sensitive: bool = False):
+        """
+        初始化搜索
+
+        Args:
+            root (str): 搜索起点目录
+            pattern (str, optional): 文件名匹配模式，为空时匹配所有文件
+            mode (str, optional): substring 子串、glob 通配符、regex 正则
+            extensions (Optional[Iterable[str]]): 只保留这些扩展名（如 ".py"、"md"）
+            ignore (Optional[Iterable[str]]): 额外的忽略规则（.gitignore 语法）
+            use_gitignore (bool, optional): 是否读取遍历到的 .gitignore
+            include_hidden (bool, optional): 是否包含以 . 开头的文件和目录
+            include_dirs (bool, optional): 目录名匹配时是否也作为结果返回
+            max_depth (Optional[int]): 最大遍历深度，root 下的直接子项深度为 1
+            max_results (int, optional): 最多返回的结果数
+            workers (int, optional): 并行遍历的线程数
+            case_sensitive (bool, optional): 是否区分大小写
+
+        Raises:
+            ValueError: 匹配模式无效
+        """
+        if mode not in MATCH_MODES:
+            raise ValueError(f"不支持的匹配模式: {mode}")
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.max_depth = max_depth
+        self.max_results = max_results
+        self.workers = max(1, workers)
+        self.include_hidden = include_hidden
+        self.include_dirs = include_dirs
+        self.use_gitignore = use_gitignore
+        self.extensions = {ext.lower() if ext.startswith(".") else f".{ext.lower()}"
+                           for ext in (extensions or ()) if ext}
+        # 调用方的规则相对于搜索根目录，与根目录下 .gitignore 中的同一行效果相同
+        self.ignore_rules = IgnoreRules(DEFAULT_IGNORES).extend(ignore or (), self.root)
+        self._matcher = self._compile(pattern, mode, case_sensitive)
+
+        self._cancelled = threading.Event()
+        self._closed = threading.Event()  # 调用方已停止读取结果
+        self._results: "queue.Queue" = queue.Queue(maxsize=256)
+        self._dirs: "queue.Queue" = queue.Queue()
+        self._count = 0
+        self._count_lock = threading.Lock()
+        self.truncated = False
+        self.errors = 0
+
+    @staticmethod
+    def _compile(pattern: str, mode: str, case_sensitive: bool):
+        """把匹配模式编译成 name -> bool 的函数"""
+        if not pattern:
+            return lambda name: True
+        flags = 0 if case_sensitive else re.IGNORECASE
+        if mode == "regex":
+            regex = re.compile(pattern, flags)
+        elif mode == "glob":
+            regex = re.compile(fnmatch.translate(pattern), flags)
+            return lambda name: regex.match(name) is not None
+        else:
+            regex = re.compile(re.escape(pattern), flags)
+        return lambda name: regex.search(name) is not None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """取消搜索，工作线程会在处理完当前目录后退出"""
+        self._cancelled.set()
+
+    def _is_pseudo(self, path: str) -> bool:
+        return path != self.root and path in PSEUDO_FILESYSTEMS
+
+    def _emit(self, batch: List[Dict[str, Any]]) -> bool:
+        """把一批结果交给调用方，达到上限时截断并取消搜索；返回是否应继续"""
+        with self._count_lock:
+            remaining = self.max_results - self._count
+            if len(batch) >= remaining:
+                # 恰好用完额度时无法确定后面是否还有结果，也按截断处理
+                self.truncated = True
+                self._cancelled.set()
+                batch = batch[:remaining]
+            self._count += len(batch)
+        return bool(batch) and self._put(batch) and not self._cancelled.is_set()
+
+    def _put(self, item: Any) -> bool:
+        """放入结果队列；调用方已停止读取时放弃"""
+        while not self._closed.is_set():
+            try:
+                self._results.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _matches(self, entry: os.DirEntry, is_dir: bool) -> bool:
+        if is_dir and not self.include_dirs:
+            return False
+        if self.extensions and not is_dir and os.path.splitext(entry.name)[1].lower() not in self.extensions:
+            return False
+        return self._matcher(entry.name)
+
+    def _scan(self, directory: str, depth: int, rules: IgnoreRules) -> None:
+        """遍历一个目录：子目录放回队列，匹配的文件按批产出（减少队列交接的开销）"""
+        if self.use_gitignore:
+            rules = rules.child(directory)
+        batch: List[Dict[str, Any]] = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if self._cancelled.is_set():
+                        return
+                    if not self.include_hidden and entry.name.startswith("."):
+                        continue
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if rules.ignored(entry.path, entry.name, is_dir):
+                        continue
+                    if self._matches(entry, is_dir):
+                        try:
+                            stat = entry.stat(follow_symlinks=False)
+                            size, modified = stat.st_size, stat.st_mtime
+                        except OSError:
+                            size, modified = 0, 0
+                        batch.append({
+                            'name': entry.name,
+                            'path': entry.path,
+                            'size': size,
+                            'modified': modified,
+                            'type': 'directory' if is_dir else 'file'
+                        })
+                        if len(batch) >= RESULT_BATCH_SIZE:
+                            if not self._emit(batch):
+                                return
+                            batch = []
+                    if is_dir and not self._is_pseudo(entry.path) and \
+                            (self.max_depth is None or depth < self.max_depth):
+                        self._dirs.put((entry.path, depth + 1, rules))
+        except OSError as e:
+            self.errors += 1
+            logger.debug(f"无法读取目录 {directory}: {e}")
+        if batch:
+            self._emit(batch)
+
+    def _worker(self) -> None:
+        while True:
+            task = self._dirs.get()
+            try:
+                if task is _DONE:
+                    return
+                if not self._cancelled.is_set():
+                    self._scan(*task)
+            finally:
+                self._dirs.task_done()
+
+    def _run(self) -> None:
+        """启动工作线程，遍历结束后通知调用方"""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="file-search") as executor:
+            for _ in range(self.workers):
+                executor.submit(self._worker)
+            self._dirs.put((self.root, 1, self.ignore_rules))
+            self._dirs.join()
+            for _ in range(self.workers):
+                self._dirs.put(_DONE)
+        self._put(_DONE)
+
+    def iter_results(self) -> Iterator[Dict[str, Any]]:
+        """
+        开始搜索并逐条产出结果；调用方提前停止迭代时搜索会被取消
+
+        Yields:
+            Dict[str, Any]: 匹配项（name、path、size、modified、type）
+        """
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(f"目录不存在: {self.root}")
+        threading.Thread(target=self._run, name="file-search-main", daemon=True).start()
+        try:
+            while True:
+                batch = self._results.get()
+                if batch is _DONE:
+                    return
+                yield from batch
+        finally:
+            self._closed.set()
+            self.cancel()
+
+    def run(self) -> List[Dict[str, Any]]:
+        """执行搜索并返回全部结果"""
+        return list(self.iter_results())
@@ -0,0 +1,254 @@
+# File: llm_client.py
+# 大模型 HTTP 客户端
+# 提供复用连接的同步会话，以及基于 asyncio 的连接池客户端
+
+import asyncio
+import json
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Coroutine, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp 为可选依赖，只有异步路径需要
+    aiohttp = None
+
+logger = logging.getLogger("AI-Workflow-LLM-Client")
+
+# 连接池配置
+DEFAULT_POOL_SIZE = 100
+DEFAULT_KEEPALIVE_TIMEOUT = 30
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    获取进程内共享的 requests 会话，复用 keep-alive 连接，避免每次请求重新握手。
+
+    Returns:
+        requests.Session: 共享会话
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=DEFAULT_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def parse_stream_chunk(line: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    解析流式接口返回的一行 SSE 数据，提取增量内容和用量统计。
+
+    Args:
+        line (str): 已解码的一行数据
+
+    Returns:
+        Tuple[Optional[str], Optional[Dict[str, Any]]]: 增量文本和 usage（prompt_tokens/completion_tokens），
+        没有时对应位置为None
+    """
+    line = line.strip()
+    if not line.startswith('data:'):
+        return None, None
+    json_str = line[5:].strip()
+    if json_str == "[DONE]":
+        return None, None
+    try:
+        json_data = json.loads(json_str)
+    except json.JSONDecodeError as e:
+        logger.error(f"解析 JSON 失败: {e}")
+        return None, None
+    content = None
+    if 'choices' in json_data and json_data['choices']:
+        content = json_data['choices'][0].get('delta', {}).get('content') or None
+    return content, json_data.get('usage') or None
+
+
+def parse_stream_line(line: str) -> Optional[str]:
+    """
+    解析流式接口返回的一行 SSE 数据，提取增量内容。
+
+    Args:
+        line (str): 已解码的一行数据
+
+    Returns:
+        Optional[str]: 增量文本；非数据行、结束标记或无内容时返回None
+    """
+    return parse_stream_chunk(line)[0]
+
+
+class AsyncLLMClient:
+    """
+    基于 aiohttp 的异步大模型客户端。
+
+    所有请求共享一个有上限的连接池并复用 keep-alive 连接，
+    一个事件循环即可同时驱动数百个流式生成。
+    传入 ``transport``（LLMTransport）时，请求经由它的重试策略、熔断器和统计发送，与同步路径一致。
+    """
+
+    def __init__(self, api_url: str, api_key: str, pool_size: int = DEFAULT_POOL_SIZE,
+                 keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT, transport: Optional[Any] = None):
+        """
+        初始化异步客户端
+
+        Args:
+            api_url (str): 接口地址
+            api_key (str): 接口密钥
+            pool_size (int, optional): 连接池最大连接数
+            keepalive_timeout (float, optional): 空闲连接保留时间（秒）
+            connect_timeout (float, optional): 建立连接的超时（秒）
+            read_timeout (float, optional): 两次读取之间的超时（秒）
+            transport (Optional[LLMTransport]): 容错传输层，为None时直接发送、出错即抛出
+        """
+        if aiohttp is None:
+            raise RuntimeError("异步客户端需要安装 aiohttp：pip install aiohttp")
+        self.api_url = api_url
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.transport = transport
+        self._session = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """在当前事件循环中懒加载会话"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout,
+                                              sock_read=self.read_timeout),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                }
+            )
+        return self._session
+
+    async def request(self, payload: Dict[str, Any]) -> "aiohttp.ClientResponse":
+        """
+        发送一次请求并返回响应（不检查状态码，调用方负责 release）
+
+        Args:
+            payload (Dict[str, Any]): 请求体
+
+        Returns:
+            aiohttp.ClientResponse: 已收到响应头的响应
+        """
+        return await self._get_session().post(self.api_url, json=payload)
+
+    async def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        发送非流式请求
+
+        Args:
+            payload (Dict[str, Any]): 请求体
+
+        Returns:
+            Dict[str, Any]: 解析后的 JSON 响应
+        """
+        if self.transport is not None:
+            return await self.transport.apost_json(payload, self)
+        async with await self.request(payload) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def _raw_lines(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """不经传输层直接读取数据流的各行"""
+        async with await self.request(payload) as response:
+            response.raise_for_status()
+            async for raw_line in response.content:
+                yield raw_line.decode('utf-8', errors='replace')
+
+    async def stream_chat(self, payload: Dict[str, Any],
+                          usage: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        发送流式请求，逐段产出增量文本
+
+        Args:
+            payload (Dict[str, Any]): 请求体（会强制设置 stream=True）
+            usage (Optional[Dict[str, Any]]): 传入时用上游返回的用量统计更新该字典
+
+        Yields:
+            str: 增量文本
+        """
+        payload = dict(payload, stream=True)
+        if self.transport is not None:
+            lines = self.transport.astream_lines(payload, self)
+        else:
+            lines = self._raw_lines(payload)
+        async for line in lines:
+            content, line_usage = parse_stream_chunk(line)
+            if line_usage and usage is not None:
+                usage.update(line_usage)
+            if content:
+                yield content
+
+    async def close(self) -> None:
+        """关闭会话和连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class AsyncLoopRunner:
+    """
+    在后台线程中运行一个常驻事件循环，供同步代码（如 Flask 路由）提交协程。
+
+    所有异步生成都在这一个线程里调度，不需要为每个流占用一个线程池线程。
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """获取（必要时启动）后台事件循环"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name="llm-event-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        提交协程到后台事件循环
+
+        Args:
+            coro (Coroutine): 协程对象
+
+        Returns:
+            Future: 可在其他线程中等待的结果
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def shutdown(self) -> None:
+        """停止后台事件循环"""
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                if self._thread is not None:
+                    self._thread.join(timeout=5)
+                self._loop.close()
+            self._loop = None
+            self._thread = None
@@ -0,0 +1,547 @@
+# File: llm_transport.py
+# 大模型请求的容错传输层
+# 提供连接/读取/首字节超时、带抖动的指数退避重试（遵循 Retry-After）、熔断器以及调用统计，
+# 同步（requests）和异步（aiohttp）请求共用同一套重试策略、熔断器和统计
+
+import asyncio
+import random
+import threading
+import time
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from llm_client import aiohttp, get_http_session
+
+logger = logging.getLogger("AI-Workflow-Transport")
+
+# 默认超时配置（秒）
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_FIRST_BYTE_TIMEOUT = 30.0
+
+# 可重试的上游状态码
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+# 异步路径上视为传输失败的 aiohttp 异常（aiohttp 为可选依赖）
+_AIOHTTP_ERRORS = (aiohttp.ClientError,) if aiohttp is not None else ()
+
+
+class TransportError(requests.exceptions.RequestException):
+    """传输层错误（继承 RequestException，原有的异常处理逻辑无需修改）"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(TransportError):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+
+class FirstByteTimeout(TransportError):
+    """在首字节超时时间内没有收到任何数据"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 响应头
+
+    Args:
+        value (Optional[str]): 响应头的值，可以是秒数或 HTTP 日期
+
+    Returns:
+        Optional[float]: 需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试策略"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 retry_statuses=RETRYABLE_STATUS_CODES):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts (int, optional): 最多尝试次数（包含第一次）
+            base_delay (float, optional): 首次退避的基准时长（秒）
+            max_delay (float, optional): 单次退避的上限（秒）
+            retry_statuses (optional): 允许重试的状态码集合
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def is_retryable(self, error: TransportError) -> bool:
+        """判断错误是否值得重试"""
+        if isinstance(error, CircuitOpenError):
+            return False
+        if error.status_code is None:
+            return True  # 超时、连接错误
+        return error.status_code in self.retry_statuses
+
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        计算第 attempt 次失败后的等待时长（full jitter），服务端给出 Retry-After 时以其为准
+
+        Args:
+            attempt (int): 已失败的次数，从1开始
+            retry_after (Optional[float]): 服务端要求的等待秒数
+
+        Returns:
+            float: 等待秒数
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，冷却期内直接拒绝请求；
+    冷却结束后进入半开状态，只放行一个探测请求。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        """
+        初始化熔断器
+
+        Args:
+            failure_threshold (int, optional): 连续失败多少次后打开
+            recovery_timeout (float, optional): 打开后多久允许探测（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """当前状态"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """判断是否放行本次请求"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        """记录一次成功，关闭熔断器"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """记录一次失败，必要时打开熔断器"""
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"上游连续失败 {self._failures} 次，熔断器打开 {self.recovery_timeout} 秒")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class TransportStats:
+    """按调用结果统计次数和耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outcomes: Dict[str, int] = {}
+        self.retries = 0
+        self.calls = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, outcome: str, latency: float) -> None:
+        """
+        记录一次调用
+
+        Args:
+            outcome (str): 结果，例如 "success"、"http_429"、"timeout"
+            latency (float): 耗时（秒）
+        """
+        with self._lock:
+            self.calls += 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def record_retry(self) -> None:
+        """记录一次重试"""
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回统计快照"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "outcomes": dict(self.outcomes),
+                "latency_avg": self.latency_total / self.calls if self.calls else 0.0,
+                "latency_max": self.latency_max
+            }
+
+
+def _is_read_timeout(error: Exception) -> bool:
+    """判断异常是否由套接字读取超时引起（requests 在流式读取时会将其包装为 ConnectionError）"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return True
+    return any(isinstance(arg, ReadTimeoutError) for arg in getattr(error, 'args', ()))
+
+
+def _classify(error: Exception) -> str:
+    """将异常归类为统计用的结果名"""
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, TransportError) and error.status_code is not None:
+        return f"http_{error.status_code}"
+    if isinstance(error, FirstByteTimeout) or _is_read_timeout(error):
+        return "timeout"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection_error"
+    return "error"
+
+
+class LLMTransport:
+    """
+    大模型接口的共享传输层，供 Agent 和 ProjectUtils 使用。
+
+    - 连接超时、读取超时和首字节超时
+    - 可重试错误按带抖动的指数退避重试，遵循 Retry-After
+    - 熔断器在上游故障期间快速失败
+    - 按调用结果统计次数和耗时
+    - apost_json / astream_lines 经由 AsyncLLMClient 的连接池发送，共用上述策略
+    """
+
+    def __init__(self, api_url: str, api_key: str,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 first_byte_timeout: float = DEFAULT_FIRST_BYTE_TIMEOUT,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 session: Optional[requests.Session] = None):
+        """
+        初始化传输层
+
+        Args:
+            api_url (str): 接口地址
+            api_key (str): 接口密钥
+            connect_timeout (float, optional): 建立连接的超时（秒）
+            read_timeout (float, optional): 两次读取之间的超时（秒）
+            first_byte_timeout (float, optional): 发出请求到收到第一段数据的超时（秒）
+            retry_policy (Optional[RetryPolicy]): 重试策略
+            circuit_breaker (Optional[CircuitBreaker]): 熔断器
+            session (Optional[requests.Session]): HTTP 会话，默认使用共享会话
+        """
+        self.api_url = api_url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.session = session
+        self.stats = TransportStats()
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _send(self, payload: Dict[str, Any], stream: bool) -> requests.Response:
+        """发送一次请求，非 2xx 状态码转换为 TransportError"""
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("上游熔断中，请求被拒绝")
+        session = self.session or get_http_session()
+        try:
+            response = session.post(self.api_url, headers=self.headers, json=payload, stream=stream,
+                                    timeout=(self.connect_timeout, min(self.read_timeout, self.first_byte_timeout)))
+        except requests.exceptions.Timeout as e:
+            raise FirstByteTimeout(f"等待上游响应超时: {e}") from e
+        if response.status_code >= 400:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            response.close()
+            raise TransportError(f"上游返回错误状态码 {response.status_code}",
+                                 status_code=response.status_code, retry_after=retry_after)
+        return response
+
+    def _with_retries(self, attempt_fn):
+        """按重试策略执行 attempt_fn，并维护熔断器和统计"""
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            try:
+                result = attempt_fn()
+            except requests.exceptions.RequestException as e:
+                time.sleep(self._retry_delay(e, attempt, started))
+                continue
+            self.circuit_breaker.record_success()
+            self.stats.record("success", time.monotonic() - started)
+            return result
+
+    async def _awith_retries(self, attempt_fn):
+        """_with_retries 的异步版本，attempt_fn 返回协程；重试策略、熔断器和统计与同步路径共用"""
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            try:
+                result = await attempt_fn()
+            except requests.exceptions.RequestException as e:
+                await asyncio.sleep(self._retry_delay(e, attempt, started))
+                continue
+            self.circuit_breaker.record_success()
+            self.stats.record("success", time.monotonic() - started)
+            return result
+
+    def _retry_delay(self, e: requests.exceptions.RequestException, attempt: int, started: float) -> float:
+        """
+        记录一次失败的尝试并返回重试前的等待时长（在 except 块中调用）
+
+        Raises:
+            TransportError: 重试次数用完或错误不可重试
+        """
+        error = e if isinstance(e, TransportError) else TransportError(str(e))
+        if self._counts_as_upstream_failure(error):
+            self.circuit_breaker.record_failure()
+        elif not isinstance(error, CircuitOpenError):
+            # 客户端错误说明上游可达：同样结束半开探测，否则熔断器永远停在半开状态
+            self.circuit_breaker.record_success()
+        self.stats.record(_classify(e), time.monotonic() - started)
+        if attempt >= self.retry_policy.max_attempts or not self.retry_policy.is_retryable(error):
+            raise error from e
+        delay = self.retry_policy.compute_delay(attempt, error.retry_after)
+        logger.warning(f"大模型请求失败（第 {attempt} 次）: {e}，{delay:.2f} 秒后重试")
+        self.stats.record_retry()
+        return delay
+
+    @staticmethod
+    def _counts_as_upstream_failure(error: TransportError) -> bool:
+        """只有超时、连接错误、429 和 5xx 才计入熔断器，客户端错误不算上游故障"""
+        if isinstance(error, CircuitOpenError):
+            return False
+        return error.status_code is None or error.status_code == 429 or error.status_code >= 500
+
+    def post_json(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        发送非流式请求并返回 JSON
+
+        Args:
+            payload (Dict[str, Any]): 请求体
+
+        Returns:
+            Dict[str, Any]: 解析后的响应
+
+        Raises:
+            TransportError: 重试耗尽、熔断或不可重试的错误
+        """
+        def attempt():
+            response = self._send(payload, stream=False)
+            try:
+                return response.json()
+            except ValueError as e:
+                raise TransportError(f"响应不是合法的 JSON: {e}", status_code=response.status_code) from e
+
+        return self._with_retries(attempt)
+
+    def stream_lines(self, payload: Dict[str, Any]) -> Iterator[str]:
+        """
+        发送流式请求，逐行产出已解码的数据。
+
+        只有在还没有产出任何数据时才会重试；一旦开始输出，中途失败直接抛出。
+
+        Args:
+            payload (Dict[str, Any]): 请求体
+
+        Yields:
+            str: 解码后的一行数据
+
+        Raises:
+            TransportError: 重试耗尽、熔断、首字节超时或读取中断
+        """
+        def attempt():
+            response = self._send(payload, stream=True)
+            lines = response.iter_lines()
+            # 首字节看门狗：超时未收到数据则关闭连接，迫使读取立即结束
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                response.close()
+
+            watchdog = threading.Timer(self.first_byte_timeout, on_timeout)
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                first = next(lines, None)
+            except Exception as e:
+                response.close()
+                if timed_out.is_set() or _is_read_timeout(e):
+                    raise FirstByteTimeout(f"{self.first_byte_timeout} 秒内未收到首字节") from e
+                raise TransportError(f"读取首字节失败: {e}") from e
+            finally:
+                watchdog.cancel()
+            if timed_out.is_set():
+                response.close()
+                raise FirstByteTimeout(f"{self.first_byte_timeout} 秒内未收到首字节")
+            self._set_read_timeout(response)
+            return response, first, lines
+
+        response, first, lines = self._with_retries(attempt)
+        started = time.monotonic()
+        try:
+            if first:
+                yield first.decode('utf-8')
+            for line in lines:
+                if line:
+                    yield line.decode('utf-8')
+        except requests.exceptions.RequestException as e:
+            self.circuit_breaker.record_failure()
+            self.stats.record("stream_interrupted", time.monotonic() - started)
+            raise TransportError(f"读取数据流中断: {e}") from e
+        finally:
+            response.close()
+
+    async def _asend(self, client: Any, payload: Dict[str, Any]):
+        """通过异步客户端发送一次请求，非 2xx 状态码转换为 TransportError"""
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("上游熔断中，请求被拒绝")
+        try:
+            response = await client.request(payload)
+        except asyncio.TimeoutError as e:
+            raise FirstByteTimeout(f"等待上游响应超时: {e}") from e
+        except _AIOHTTP_ERRORS as e:
+            raise TransportError(f"请求上游失败: {e}") from e
+        if response.status >= 400:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            response.release()
+            raise TransportError(f"上游返回错误状态码 {response.status}",
+                                 status_code=response.status, retry_after=retry_after)
+        return response
+
+    async def apost_json(self, payload: Dict[str, Any], client: Any) -> Dict[str, Any]:
+        """
+        post_json 的异步版本
+
+        Args:
+            payload (Dict[str, Any]): 请求体
+            client (AsyncLLMClient): 提供连接池的异步客户端
+
+        Returns:
+            Dict[str, Any]: 解析后的响应
+
+        Raises:
+            TransportError: 重试耗尽、熔断或不可重试的错误
+        """
+        async def attempt():
+            try:
+                response = await asyncio.wait_for(self._asend(client, payload), self.first_byte_timeout)
+            except asyncio.TimeoutError as e:
+                raise FirstByteTimeout(f"{self.first_byte_timeout} 秒内未收到响应") from e
+            try:
+                return await response.json(content_type=None)
+            except (ValueError, *_AIOHTTP_ERRORS) as e:
+                raise TransportError(f"读取响应失败: {e}", status_code=response.status) from e
+            finally:
+                response.release()
+
+        return await self._awith_retries(attempt)
+
+    async def astream_lines(self, payload: Dict[str, Any], client: Any) -> AsyncIterator[str]:
+        """
+        stream_lines 的异步版本，只有在还没有产出任何数据时才会重试
+
+        Args:
+            payload (Dict[str, Any]): 请求体
+            client (AsyncLLMClient): 提供连接池的异步客户端
+
+        Yields:
+            str: 解码后的一行数据
+
+        Raises:
+            TransportError: 重试耗尽、熔断、首字节超时或读取中断
+        """
+        async def first_line():
+            response = await self._asend(client, payload)
+            try:
+                return response, await response.content.readline()
+            except BaseException:
+                response.release()
+                raise
+
+        async def attempt():
+            try:
+                return await asyncio.wait_for(first_line(), self.first_byte_timeout)
+            except asyncio.TimeoutError as e:
+                raise FirstByteTimeout(f"{self.first_byte_timeout} 秒内未收到首字节") from e
+            except _AIOHTTP_ERRORS as e:
+                raise TransportError(f"读取首字节失败: {e}") from e
+
+        response, first = await self._awith_retries(attempt)
+        started = time.monotonic()
+        try:
+            if first.strip():
+                yield first.decode('utf-8')
+            async for line in response.content:
+                if line.strip():
+                    yield line.decode('utf-8')
+        except (asyncio.TimeoutError, *_AIOHTTP_ERRORS) as e:
+            self.circuit_breaker.record_failure()
+            self.stats.record("stream_interrupted", time.monotonic() - started)
+            raise TransportError(f"读取数据流中断: {e}") from e
+        finally:
+            response.release()
+
+    def _set_read_timeout(self, response: requests.Response) -> None:
+        """首字节到达后，将套接字超时放宽为读取超时"""
+        try:
+            sock = response.raw.connection.sock
+            if sock is not None:
+                sock.settimeout(self.read_timeout)
+        except AttributeError:
+            pass
@@ -0,0 +1,230 @@
+# File: metrics.py
+# 进程内的指标注册表
+# 计数器、仪表和直方图按标签分组，/metrics 以 Prometheus 文本格式导出；
+# 队列深度、缓存命中等已有统计通过采集回调在导出时读取，不在热路径上重复计数
+
+import bisect
+import math
+import threading
+import logging
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger("AI-Workflow-Metrics")
+
+# 延迟类直方图的默认分桶（秒）
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 采集回调产出的样本：(指标名, 标签, 值)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Metric:
+    """带标签的指标基类，每组标签值对应一个子序列"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames and self.kind in ("counter", "gauge"):
+            # 无标签的计数器和仪表从 0 开始导出
+            self._series[()] = 0.0
+
+    def _key(self, labelvalues: Tuple[str, ...]) -> Tuple[str, ...]:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际传入 {labelvalues}")
+        return tuple(str(value) for value in labelvalues)
+
+    def _labels_dict(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        key = self._key(labelvalues)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._series.items())
+        return [(self.name + "_total", self._labels_dict(key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+    kind = "gauge"
+
+    def set(self, *labelvalues: str, value: float) -> None:
+        key = self._key(labelvalues)
+        with self._lock:
+            self._series[key] = value
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        key = self._key(labelvalues)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._series.items())
+        return [(self.name, self._labels_dict(key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    累积分桶直方图。
+
+    observe 只做一次二分查找和两次加法；导出时才把各桶计数累加成 Prometheus 要求的累积形式。
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labelvalues: str, value: float) -> None:
+        key = self._key(labelvalues)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # 每个桶的计数（最后一个是 +Inf）、总和
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        samples = []
+        for key, counts, total in items:
+            labels = self._labels_dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    指标注册表。
+
+    用法::
+
+        registry = MetricsRegistry()
+        requests_total = registry.counter("ai_workflow_llm_requests", "大模型请求数", ["agent", "status"])
+        requests_total.inc("writer", "200")
+        registry.register_collector([("ai_workflow_queue_depth", "gauge", "等待中的回合数")],
+                                    lambda: [("ai_workflow_queue_depth", {}, scheduler.snapshot()['queued'])])
+        text = registry.render()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Tuple[List[Tuple[str, str, str]], Callable[[], Iterable[Sample]]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # 模块被重复导入时返回已有的指标，避免计数分裂
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"指标 {metric.name} 已以不同的类型或标签注册")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, families: Sequence[Tuple[str, str, str]],
+                           collect: Callable[[], Iterable[Sample]]) -> None:
+        """
+        注册导出时调用的采集回调
+
+        Args:
+            families (Sequence[Tuple[str, str, str]]): 回调产出的指标族 (名称, 类型, 说明)，用于输出 HELP/TYPE
+            collect (Callable[[], Iterable[Sample]]): 返回 (指标名, 标签, 值) 样本的回调
+        """
+        with self._lock:
+            self._collectors.append((list(families), collect))
+
+    def render(self) -> str:
+        """
+        以 Prometheus 文本格式导出所有指标
+
+        Returns:
+            str: 导出文本
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            # 计数器的样本名带 _total 后缀，HELP/TYPE 须使用相同的名称，否则 0.0.4 格式下会被当作无类型指标
+            family = metric.name + "_total" if metric.kind == "counter" else metric.name
+            lines.append(f"# HELP {family} {metric.documentation}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for families, collect in collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                # 单个采集回调失败不影响其余指标
+                logger.warning(f"采集指标失败 {[family[0] for family in families]}: {e}")
+                continue
+            for name, kind, documentation in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for sample_name, labels, value in samples:
+                    if sample_name == name or sample_name in (name + "_bucket", name + "_sum", name + "_count"):
+                        lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# 进程内共享的注册表
+REGISTRY = MetricsRegistry()
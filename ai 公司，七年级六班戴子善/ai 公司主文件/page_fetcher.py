@@ -0,0 +1,348 @@
+# File: page_fetcher.py
+# 搜索结果页面的并发抓取和流式正文提取
+# 按主机限制并发连接数，限制下载字节数并设置超时；HTML 边下载边交给增量解析器提取正文，不缓存整页；
+# 提取出的正文连同 ETag/Last-Modified 保存在磁盘缓存中，再次抓取时用条件请求验证，未变化则不重新下载
+
+import codecs
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("AI-Workflow-Page-Fetcher")
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 2
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+DEFAULT_MAX_CHARS = 20000
+DEFAULT_TIMEOUT = (3.05, 10.0)
+# 缓存的正文在该时间内直接使用，不发请求；超过后用 ETag/Last-Modified 做条件请求
+DEFAULT_FRESH_SECONDS = 600
+READ_CHUNK = 16 * 1024
+USER_AGENT = "Mozilla/5.0 (compatible; AI-Workflow-Fetcher/1.0)"
+
+# 内容不属于正文的标签
+_SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "nav", "header",
+              "footer", "aside", "form", "button", "select", "head"}
+# 块级标签：遇到时结束当前段落
+_BLOCK_TAGS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "table", "tr", "td", "th",
+               "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "br", "hr", "dd", "dt", "figcaption"}
+_VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "area", "base", "col", "embed", "source", "wbr"}
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+# 太短的段落多为菜单、按钮等零散文字
+MIN_BLOCK_CHARS = 20
+
+
+class TextExtractor(HTMLParser):
+    """
+    增量的正文提取器：每次 feed 一段 HTML，按块级标签切分段落，跳过脚本、导航、页眉页脚等；
+    页面有 <article> 或 <main> 时只保留其中的段落。
+    """
+
+    def __init__(self, max_chars: int = DEFAULT_MAX_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title = ""
+        self._in_title = False
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._current: List[str] = []
+        self._current_in_main = False
+        self._blocks: List[Tuple[str, bool]] = []
+        self._chars = 0
+        self._main_chars = 0
+
+    @property
+    def full(self) -> bool:
+        """已收集到足够的正文，可以停止下载"""
+        return (self._main_chars or self._chars) >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID_TAGS:
+            if tag in _BLOCK_TAGS:
+                self._flush()
+            return
+        if tag == "title":
+            self._in_title = True
+        elif tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in ("article", "main"):
+            self._flush()
+            self._main_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in ("article", "main"):
+            self._flush()
+            self._main_depth = max(0, self._main_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+            return
+        if self._skip_depth or not data.strip():
+            return
+        if not self._current:
+            self._current_in_main = self._main_depth > 0
+        self._current.append(data)
+
+    def _flush(self) -> None:
+        if not self._current:
+            return
+        text = " ".join("".join(self._current).split())
+        self._current = []
+        if len(text) < MIN_BLOCK_CHARS:
+            return
+        self._blocks.append((text, self._current_in_main))
+        self._chars += len(text)
+        if self._current_in_main:
+            self._main_chars += len(text)
+
+    def text(self) -> str:
+        """结束解析并返回正文"""
+        self._flush()
+        blocks = [text for text, in_main in self._blocks if in_main] if self._main_chars else \
+            [text for text, _ in self._blocks]
+        return "\n".join(blocks)[:self.max_chars]
+
+
+class PageCache:
+    """
+    抓取结果的磁盘缓存：每个 URL 一个 JSON 文件，保存正文和 ETag/Last-Modified，
+    条件请求返回 304 时直接使用缓存的正文。
+    """
+
+    def __init__(self, cache_dir: Optional[str]):
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> str:
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir:
+            with self._lock:
+                return self._memory.get(url)
+        try:
+            with open(self._path(url), 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def set(self, url: str, entry: Dict[str, Any]) -> None:
+        if not self.cache_dir:
+            with self._lock:
+                self._memory[url] = entry
+            return
+        path = self._path(url)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as file:
+                json.dump(entry, file, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"写入页面缓存失败 {url}: {str(e)}")
+
+
+class PageFetcher:
+    """
+    并发页面抓取器。
+
+    用法::
+
+        fetcher = PageFetcher(cache_dir="~/.ai_workflow/page_cache")
+        for page in fetcher.fetch_many(urls):
+            print(page["url"], page["title"], page["text"][:200])
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: int = DEFAULT_WORKERS,
+                 per_host: int = DEFAULT_PER_HOST, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_chars: int = DEFAULT_MAX_CHARS, timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+                 fresh_seconds: float = DEFAULT_FRESH_SECONDS):
+        """
+        初始化抓取器
+
+        Args:
+            cache_dir (Optional[str]): 磁盘缓存目录，为None时只缓存在内存中
+            max_workers (int, optional): 同时抓取的页面数上限
+            per_host (int, optional): 每个主机同时打开的连接数上限
+            max_bytes (int, optional): 每个页面最多下载的字节数
+            max_chars (int, optional): 每个页面最多保留的正文字符数
+            timeout (Tuple[float, float], optional): (连接超时, 读取超时)，秒
+            fresh_seconds (float, optional): 缓存在该时间内不重新验证
+        """
+        self.cache = PageCache(os.path.expanduser(cache_dir) if cache_dir else None)
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.timeout = timeout
+        self.fresh_seconds = fresh_seconds
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_lock = threading.Lock()
+        self.stats = {"fetched": 0, "not_modified": 0, "fresh_hits": 0, "errors": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._host_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    @staticmethod
+    def _charset(response: requests.Response, head: bytes) -> str:
+        """优先使用响应头中的编码，其次是页面开头的 <meta charset>，默认 UTF-8"""
+        content_type = response.headers.get('Content-Type', '')
+        match = re.search(r"charset=([\w-]+)", content_type, re.IGNORECASE)
+        if not match:
+            match = _META_CHARSET.search(head)
+            charset = match.group(1).decode('ascii', 'ignore') if match else "utf-8"
+        else:
+            charset = match.group(1)
+        try:
+            codecs.lookup(charset)
+        except LookupError:
+            charset = "utf-8"
+        return charset
+
+    def _download(self, response: requests.Response) -> Tuple[str, str, bool, int]:
+        """边下载边提取正文，返回 (标题, 正文, 是否被截断, 下载字节数)"""
+        content_type = response.headers.get('Content-Type', '').lower()
+        is_html = "html" in content_type or not content_type
+        if not is_html and not content_type.startswith("text/"):
+            raise ValueError(f"不支持的内容类型: {content_type}")
+        extractor = TextExtractor(self.max_chars) if is_html else None
+        plain: List[str] = []
+        decoder = None
+        received, truncated = 0, False
+        for chunk in response.iter_content(READ_CHUNK):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(self._charset(response, chunk[:4096]))(errors='replace')
+            received += len(chunk)
+            text = decoder.decode(chunk)
+            if extractor is not None:
+                extractor.feed(text)
+                done = extractor.full
+            else:
+                plain.append(text)
+                done = sum(map(len, plain)) >= self.max_chars
+            if received >= self.max_bytes or done:
+                truncated = True
+                break
+        tail = decoder.decode(b"", final=True) if decoder is not None else ""
+        if extractor is not None:
+            extractor.feed(tail)
+            extractor.close()
+            return " ".join(extractor.title.split()), extractor.text(), truncated, received
+        return "", ("".join(plain) + tail)[:self.max_chars], truncated, received
+
+    def fetch(self, url: str) -> Dict[str, Any]:
+        """
+        抓取一个页面（先查缓存，过期后做条件请求）
+
+        Args:
+            url (str): 页面地址
+
+        Returns:
+            Dict[str, Any]: url、status、title、text、truncated、from_cache 和 error（成功时为None）
+        """
+        cached = self.cache.get(url)
+        if cached and time.time() - cached.get('fetched_at', 0) < self.fresh_seconds:
+            self._count("fresh_hits")
+            return dict(cached, from_cache=True, error=None)
+
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        try:
+            with self._slot(url):
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 304 and cached:
+                        self._count("not_modified")
+                        entry = dict(cached, fetched_at=time.time())
+                        self.cache.set(url, entry)
+                        return dict(entry, from_cache=True, error=None)
+                    response.raise_for_status()
+                    title, text, truncated, received = self._download(response)
+                    entry = {
+                        'url': url,
+                        'status': response.status_code,
+                        'title': title,
+                        'text': text,
+                        'truncated': truncated,
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'fetched_at': time.time()
+                    }
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._count("errors")
+            logger.warning(f"抓取页面失败 {url}: {str(e)}")
+            if cached:
+                # 网络出错时退回到旧的缓存内容
+                return dict(cached, from_cache=True, error=str(e))
+            return {'url': url, 'status': None, 'title': "", 'text': "", 'truncated': False,
+                    'from_cache': False, 'error': str(e)}
+        self._count("fetched")
+        self._count("bytes", received)
+        if entry['etag'] or entry['last_modified'] or self.fresh_seconds > 0:
+            self.cache.set(url, entry)
+        return dict(entry, from_cache=False, error=None)
+
+    def fetch_many(self, urls: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        并发抓取多个页面，按完成顺序逐个产出；重复的 URL 只抓取一次
+
+        Args:
+            urls (Iterable[str]): 页面地址
+
+        Yields:
+            Dict[str, Any]: 抓取结果（同 fetch）
+        """
+        unique = list(dict.fromkeys(url for url in urls if url))
+        if not unique:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique)),
+                                thread_name_prefix="page-fetch") as executor:
+            futures = [executor.submit(self.fetch, url) for url in unique]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,213 @@
+# File: response_cache.py
+# 大模型调用结果的两级缓存
+# 内存 LRU 为第一级，SQLite 持久化为第二级，支持 TTL、容量淘汰和命中统计
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("AI-Workflow-Cache")
+
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_DISK_ENTRIES = 10000
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def make_cache_key(model: str, messages: List[Dict[str, Any]], temperature: Optional[float] = None,
+                   max_tokens: Optional[int] = None) -> str:
+    """
+    根据请求参数生成规范化的缓存键
+
+    Args:
+        model (str): 模型名称
+        messages (List[Dict[str, Any]]): 消息列表
+        temperature (Optional[float]): 采样温度
+        max_tokens (Optional[int]): 最大生成长度
+
+    Returns:
+        str: SHA-256 十六进制摘要
+    """
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':')
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def cache_key_for_payload(payload: Dict[str, Any]) -> str:
+    """根据请求体生成缓存键"""
+    return make_cache_key(payload.get("model", ""), payload.get("messages", []),
+                          payload.get("temperature"), payload.get("max_tokens"))
+
+
+class ResponseCache:
+    """
+    两级响应缓存。
+
+    先查内存 LRU，未命中再查 SQLite；SQLite 命中的条目会回填到内存。
+    两级都按 TTL 过期，并分别按条目数上限淘汰最久未使用的条目。
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 max_disk_entries: int = DEFAULT_DISK_ENTRIES, ttl: float = DEFAULT_TTL):
+        """
+        初始化缓存
+
+        Args:
+            db_path (Optional[str]): SQLite 文件路径，为None时只使用内存缓存
+            max_memory_entries (int, optional): 内存中最多保留的条目数
+            max_disk_entries (int, optional): SQLite 中最多保留的条目数
+            ttl (float, optional): 默认过期时间（秒）
+        """
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str) -> None:
+        """打开（必要时创建）SQLite 缓存库"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"无法打开缓存数据库 {db_path}，仅使用内存缓存: {e}")
+            self._conn = None
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        查询缓存
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            Optional[Any]: 缓存的值，未命中或已过期返回None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        if row[1] > now:
+                            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                            self._conn.commit()
+                            value = json.loads(row[0])
+                            self._put_memory(key, value, row[1])
+                            self.stats["disk_hits"] += 1
+                            return value
+                        self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                        self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"读取缓存数据库失败: {e}")
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        写入缓存
+
+        Args:
+            key (str): 缓存键
+            value (Any): 可 JSON 序列化的值
+            ttl (Optional[float]): 过期时间（秒），默认使用构造时的 ttl
+        """
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+            self.stats["sets"] += 1
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False), expires_at, now)
+                    )
+                    self._evict_disk(now)
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"写入缓存数据库失败: {e}")
+
+    def _put_memory(self, key: str, value: Any, expires_at: float) -> None:
+        """写入内存层并按容量淘汰（调用方持有锁）"""
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _evict_disk(self, now: float) -> None:
+        """删除过期条目，并按容量淘汰最久未使用的条目（调用方持有锁）"""
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)", (overflow,)
+            )
+            self.stats["evictions"] += overflow
+
+    def clear(self) -> None:
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取命中统计
+
+        Returns:
+            Dict[str, Any]: 各级命中次数、未命中次数、命中率和当前内存条目数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,328 @@
+# File: session_registry.py
+# 按会话隔离的工作流注册表
+# 每个会话拥有独立的 WorkflowManager，支持 LRU 容量上限、空闲超时淘汰、会话级锁和内存统计
+
+import asyncio
+import sys
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("AI-Workflow-Sessions")
+
+DEFAULT_MAX_SESSIONS = 200
+DEFAULT_IDLE_TIMEOUT = 2 * 3600
+# 异步回合等待会话锁时的轮询间隔（秒），从最小值开始倍增到最大值
+ASYNC_LOCK_POLL_MIN = 0.005
+ASYNC_LOCK_POLL_MAX = 0.1
+
+
+def estimate_workflow_bytes(manager: Any) -> int:
+    """
+    估算一个工作流占用的内存（只统计随对话增长的部分：历史记录、对话上下文及其摘要、最近回复和任务）
+
+    Args:
+        manager (Any): WorkflowManager 实例
+
+    Returns:
+        int: 估算的字节数
+    """
+    total = sys.getsizeof(manager.user_input or "") + sys.getsizeof(manager.initial_request or "")
+    for item in manager.history:
+        total += sys.getsizeof(item)
+    context = getattr(manager, "context", None)
+    if context is not None:
+        for turn in context.turns:
+            total += sys.getsizeof(turn.content)
+        total += sys.getsizeof(context.summary)
+    for agent in manager.agents.values():
+        total += sys.getsizeof(getattr(agent, "last_response", "") or "")
+    for task in manager.todo_list.tasks:
+        total += sys.getsizeof(task.description)
+    for task in manager.todo_list.task_history:
+        total += sys.getsizeof(task.description)
+    return total
+
+
+class WorkflowSession:
+    """
+    一个用户会话，持有独立的 WorkflowManager。
+
+    同一会话的多个回合通过 ``lock`` 串行执行，不同会话互不影响。
+    使用普通 Lock 而非 RLock，以便异步路径可以在不同线程中获取和释放。
+    """
+
+    def __init__(self, session_id: str, manager: Any):
+        self.session_id = session_id
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self._active_turns = 0
+        self._state_lock = threading.Lock()
+
+    def touch(self) -> None:
+        """更新最近访问时间"""
+        self.last_access = time.time()
+
+    @property
+    def busy(self) -> bool:
+        """是否有回合正在执行或等待会话锁（在调度器中排队的回合由注册表的 pending_turns 判断）"""
+        return self._active_turns > 0
+
+    def turn(self) -> "_TurnContext":
+        """
+        获取会话锁，串行执行一个回合::
+
+            with session.turn():
+                ...
+        """
+        return _TurnContext(self)
+
+    def aturn(self) -> "_AsyncTurnContext":
+        """
+        turn() 的异步版本，在线程中等待会话锁，不阻塞事件循环::
+
+            async with session.aturn():
+                ...
+        """
+        return _AsyncTurnContext(self)
+
+    def memory_bytes(self) -> int:
+        """估算会话占用的内存"""
+        return estimate_workflow_bytes(self.manager)
+
+
+class _TurnContext:
+    """会话回合的上下文管理器，维护活跃回合计数并持有会话锁"""
+
+    def __init__(self, session: WorkflowSession):
+        self.session = session
+
+    def __enter__(self) -> WorkflowSession:
+        with self.session._state_lock:
+            self.session._active_turns += 1
+        self.session.lock.acquire()
+        self.session.touch()
+        return self.session
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.session.touch()
+        self.session.lock.release()
+        with self.session._state_lock:
+            self.session._active_turns -= 1
+
+
+class _AsyncTurnContext(_TurnContext):
+    """异步版本的会话回合上下文管理器"""
+
+    async def __aenter__(self) -> WorkflowSession:
+        with self.session._state_lock:
+            self.session._active_turns += 1
+        # 在事件循环中轮询非阻塞获取：不借助线程，任务被取消时不会有线程在取消后替它拿到锁
+        delay = ASYNC_LOCK_POLL_MIN
+        try:
+            while not self.session.lock.acquire(blocking=False):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, ASYNC_LOCK_POLL_MAX)
+        except BaseException:
+            with self.session._state_lock:
+                self.session._active_turns -= 1
+            raise
+        self.session.touch()
+        return self.session
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.__exit__(exc_type, exc, tb)
+
+
+class WorkflowSessionRegistry:
+    """
+    会话注册表，按会话ID管理 WorkflowSession。
+
+    - 超过 ``max_sessions`` 时淘汰最久未访问的空闲会话
+    - 空闲超过 ``idle_timeout`` 的会话在下次访问注册表时被清理
+    - 正在执行回合或在调度器中有排队回合的会话不会被淘汰
+    """
+
+    def __init__(self, manager_factory: Callable[[str], Any], max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 pending_turns: Optional[Callable[[str], int]] = None):
+        """
+        初始化注册表
+
+        Args:
+            manager_factory (Callable[[str], Any]): 根据初始请求创建 WorkflowManager 的函数
+            max_sessions (int, optional): 最多同时保留的会话数
+            idle_timeout (float, optional): 会话空闲多久后被淘汰（秒）
+            pending_turns (Optional[Callable[[str], int]]): 返回会话在调度器中排队和执行中的回合数，
+                例如 TurnScheduler.pending；这些回合结束前会话不会被淘汰
+        """
+        self.manager_factory = manager_factory
+        self.pending_turns = pending_turns
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[str, WorkflowSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 正在从检查点恢复的会话ID -> 恢复锁，同一会话只恢复一次
+        self._loading: Dict[str, threading.Lock] = {}
+        self.evicted_count = 0
+
+    def create(self, initial_request: str, session_id: Optional[str] = None) -> WorkflowSession:
+        """
+        创建新会话；若会话ID已存在则替换其工作流
+
+        Args:
+            initial_request (str): 用户的初始请求
+            session_id (Optional[str]): 会话ID，默认自动生成
+
+        Returns:
+            WorkflowSession: 新会话
+        """
+        session_id = session_id or uuid.uuid4().hex
+        session = WorkflowSession(session_id, self.manager_factory(initial_request))
+        with self._lock:
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._evict_locked()
+        logger.info(f"已创建工作流会话 {session_id}，当前会话数 {len(self._sessions)}")
+        return session
+
+    def add(self, session: WorkflowSession) -> WorkflowSession:
+        """
+        注册一个已构造好的会话（例如从检查点恢复的会话）
+
+        Args:
+            session (WorkflowSession): 会话
+
+        Returns:
+            WorkflowSession: 注册表中的会话；同一ID已有会话时返回已有的会话，不会覆盖
+        """
+        with self._lock:
+            existing = self._sessions.get(session.session_id)
+            if existing is not None:
+                self._sessions.move_to_end(session.session_id)
+                existing.touch()
+                return existing
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            self._evict_locked()
+        return session
+
+    def get_or_load(self, session_id: Optional[str],
+                    loader: Callable[[str], Optional[WorkflowSession]]) -> Optional[WorkflowSession]:
+        """
+        获取会话，不在内存中时用 loader 恢复并注册。
+
+        同一会话ID的并发调用只会执行一次 loader，其余调用得到同一个会话，
+        避免两个工作流同时写入同一个日志。
+
+        Args:
+            session_id (Optional[str]): 会话ID
+            loader (Callable[[str], Optional[WorkflowSession]]): 恢复会话的函数，无法恢复时返回None
+
+        Returns:
+            Optional[WorkflowSession]: 会话，不存在且无法恢复时返回None
+        """
+        session = self.get(session_id)
+        if session is not None or not session_id:
+            return session
+        with self._lock:
+            load_lock = self._loading.setdefault(session_id, threading.Lock())
+        try:
+            with load_lock:
+                session = self.get(session_id)
+                if session is not None:
+                    return session
+                session = loader(session_id)
+                return self.add(session) if session is not None else None
+        finally:
+            with self._lock:
+                if self._loading.get(session_id) is load_lock:
+                    del self._loading[session_id]
+
+    def get(self, session_id: Optional[str]) -> Optional[WorkflowSession]:
+        """
+        获取会话并刷新其访问时间
+
+        Args:
+            session_id (Optional[str]): 会话ID
+
+        Returns:
+            Optional[WorkflowSession]: 会话，不存在或已过期返回None
+        """
+        if not session_id:
+            return None
+        with self._lock:
+            self._evict_locked()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            session.touch()
+            return session
+
+    def remove(self, session_id: str) -> None:
+        """移除会话"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _in_use(self, session: WorkflowSession) -> bool:
+        """会话是否有执行中或排队中的回合"""
+        if session.busy:
+            return True
+        return self.pending_turns is not None and self.pending_turns(session.session_id) > 0
+
+    def _evict_locked(self) -> None:
+        """淘汰空闲超时的会话，以及超出容量的最久未访问会话（调用方持有锁）"""
+        now = time.time()
+        for session_id, session in list(self._sessions.items()):
+            if not self._in_use(session) and now - session.last_access > self.idle_timeout:
+                del self._sessions[session_id]
+                self.evicted_count += 1
+                logger.info(f"会话 {session_id} 空闲超时，已淘汰")
+
+        overflow = len(self._sessions) - self.max_sessions
+        if overflow <= 0:
+            return
+        for session_id, session in list(self._sessions.items()):
+            if overflow <= 0:
+                break
+            if self._in_use(session):
+                continue
+            del self._sessions[session_id]
+            self.evicted_count += 1
+            overflow -= 1
+            logger.info(f"会话数超过上限 {self.max_sessions}，已淘汰最久未访问的会话 {session_id}")
+
+    def evict_idle(self) -> None:
+        """主动触发一次淘汰"""
+        with self._lock:
+            self._evict_locked()
+
+    def sessions(self) -> List[WorkflowSession]:
+        """当前所有会话（按最近访问排序，最新的在最后）"""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """
+        统计所有会话的内存占用
+
+        Returns:
+            Dict[str, Any]: 总字节数、会话数和各会话的字节数
+        """
+        per_session = {session.session_id: session.memory_bytes() for session in self.sessions()}
+        return {
+            "session_count": len(per_session),
+            "total_bytes": sum(per_session.values()),
+            "evicted_count": self.evicted_count,
+            "sessions": per_session
+        }
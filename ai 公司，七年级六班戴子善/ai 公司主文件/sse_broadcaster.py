@@ -0,0 +1,342 @@
+# File: sse_broadcaster.py
+# 基于条件变量的 SSE 发布/订阅通道
+# 每个响应ID对应一个通道，有新内容时才唤醒订阅者，支持同一响应的多个并发订阅者；
+# 已结束的通道由注册表的一个后台清理线程按 TTL 和数量上限回收，生成线程结束后不必等待
+
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("AI-Workflow-SSE")
+
+# 空闲多久发送一次保活注释（秒）
+DEFAULT_KEEPALIVE_INTERVAL = 15.0
+
+KEEPALIVE_FRAME = ": keepalive\n\n"
+
+# 已结束的通道保留多久（秒），供晚到或重连的订阅者读取
+DEFAULT_RESPONSE_TTL = 60.0
+# 最多保留的通道数，超过时淘汰最久未访问的已结束通道
+DEFAULT_MAX_CHANNELS = 1000
+# 未结束的通道超过该时间视为生成线程已丢失，也会被回收（秒）
+DEFAULT_MAX_CHANNEL_AGE = 3600.0
+REAP_INTERVAL = 5.0
+
+
+def encode_sse_frame(payload: Dict[str, Any]) -> str:
+    """
+    将数据编码为一条 SSE 帧。
+
+    Args:
+        payload (Dict[str, Any]): 要发送的数据
+
+    Returns:
+        str: 形如 "data: {...}\\n\\n" 的 SSE 帧
+    """
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def _frame_text(frame: str) -> str:
+    """取出 encode_sse_frame({'text': ...}) 帧中的文本"""
+    return json.loads(frame[len("data: "):])['text']
+
+
+class ResponseChannel:
+    """
+    单个响应的发布/订阅通道。
+
+    响应只保存一份列表：每段增量在发布时编码一次 SSE 帧，订阅者按自己的偏移读取同一份帧，
+    在条件变量上等待，只有新内容到达或通道关闭时才会被唤醒；完整文本在结束后按需解码拼接一次。
+    """
+
+    def __init__(self, response_id: str, keepalive_interval: float = DEFAULT_KEEPALIVE_INTERVAL):
+        """
+        初始化响应通道
+
+        Args:
+            response_id (str): 响应ID
+            keepalive_interval (float, optional): 空闲时发送保活注释的间隔（秒）
+        """
+        self.response_id = response_id
+        self.keepalive_interval = keepalive_interval
+        # 已编码的增量帧，所有订阅者共用
+        self._frames: List[str] = []
+        self.complete = False
+        self.error: Optional[str] = None
+        self.next_agent: Optional[str] = None
+        self.next_agent_name: Optional[str] = None
+        self.todo_items: List[Dict[str, Any]] = []
+        self.created_at = time.time()
+        self.completed_at: Optional[float] = None
+        # 已缓存帧的总字符数
+        self.size = 0
+        self._final_frame: Optional[str] = None
+        self._text: Optional[str] = None
+        self._cond = threading.Condition()
+        self._subscribers = 0
+
+    @property
+    def text(self) -> str:
+        """当前已发布的完整文本（结束后只拼接一次）"""
+        with self._cond:
+            if self._text is not None:
+                return self._text
+            frames, complete = list(self._frames), self.complete
+        text = "".join(_frame_text(frame) for frame in frames)
+        if complete:
+            self._text = text
+        return text
+
+    def read(self, offset: int = 0) -> Tuple[List[str], bool]:
+        """
+        读取从第 offset 段开始的增量文本
+
+        Args:
+            offset (int, optional): 起始段号
+
+        Returns:
+            Tuple[List[str], bool]: 增量文本列表和通道是否已结束
+        """
+        with self._cond:
+            frames, complete = self._frames[offset:], self.complete
+        return [_frame_text(frame) for frame in frames], complete
+
+    @property
+    def subscriber_count(self) -> int:
+        """当前订阅者数量"""
+        return self._subscribers
+
+    def publish_text(self, chunk: str) -> None:
+        """
+        发布一段增量文本
+
+        Args:
+            chunk (str): 增量文本
+        """
+        if not chunk:
+            return
+        frame = encode_sse_frame({'text': chunk})
+        with self._cond:
+            if self.complete:
+                logger.warning(f"响应 {self.response_id} 已结束，忽略新的文本")
+                return
+            self._frames.append(frame)
+            self.size += len(frame)
+            self._cond.notify_all()
+
+    def publish_complete(self, next_agent: Optional[str] = None, next_agent_name: Optional[str] = None,
+                         todo_items: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        发布完成事件并关闭通道
+
+        Args:
+            next_agent (Optional[str]): 下一个智能体ID
+            next_agent_name (Optional[str]): 下一个智能体名称
+            todo_items (Optional[List[Dict[str, Any]]]): 待办事项列表
+        """
+        with self._cond:
+            if self.complete:
+                return
+            self.next_agent = next_agent
+            self.next_agent_name = next_agent_name
+            self.todo_items = todo_items or []
+            self._final_frame = encode_sse_frame({
+                'complete': True,
+                'next_agent': self.next_agent,
+                'next_agent_name': self.next_agent_name,
+                'todo_items': self.todo_items
+            })
+            self.complete = True
+            self.completed_at = time.time()
+            self._cond.notify_all()
+
+    def publish_error(self, message: str) -> None:
+        """
+        发布错误事件并关闭通道
+
+        Args:
+            message (str): 错误信息
+        """
+        with self._cond:
+            if self.complete:
+                return
+            self.error = message
+            self._final_frame = encode_sse_frame({'error': message, 'complete': True})
+            self.complete = True
+            self.completed_at = time.time()
+            self._cond.notify_all()
+
+    def subscribe(self) -> Iterator[str]:
+        """
+        订阅通道，从头开始依次产出已编码的 SSE 帧。
+
+        没有新内容时阻塞在条件变量上，超过保活间隔则产出一条保活注释；
+        通道关闭且所有内容都已发送后产出完成（或错误）帧并结束。
+
+        Yields:
+            str: SSE 帧
+        """
+        position = 0
+        with self._cond:
+            self._subscribers += 1
+        try:
+            while True:
+                with self._cond:
+                    if position >= len(self._frames) and not self.complete:
+                        self._cond.wait(self.keepalive_interval)
+                    frames = self._frames[position:]
+                    position += len(frames)
+                    final_frame = self._final_frame if self.complete else None
+
+                yield from frames
+                if final_frame is not None:
+                    yield final_frame
+                    break
+                if not frames:
+                    yield KEEPALIVE_FRAME
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+
+class SSEBroadcaster:
+    """
+    响应通道注册表，按响应ID管理 ResponseChannel。
+
+    为兼容原先的 ``streaming_responses`` 字典用法，支持 ``in``、``[]`` 和 ``del``。
+    一个后台清理线程回收结束超过 ``ttl`` 的通道，并在数量超过 ``max_channels`` 时
+    淘汰最久未访问的已结束通道；正在生成的通道只有超过 ``max_age`` 才会被回收。
+    """
+
+    def __init__(self, keepalive_interval: float = DEFAULT_KEEPALIVE_INTERVAL, ttl: float = DEFAULT_RESPONSE_TTL,
+                 max_channels: int = DEFAULT_MAX_CHANNELS, max_age: float = DEFAULT_MAX_CHANNEL_AGE,
+                 reap_interval: float = REAP_INTERVAL):
+        """
+        初始化注册表
+
+        Args:
+            keepalive_interval (float, optional): 空闲时发送保活注释的间隔（秒）
+            ttl (float, optional): 已结束的通道保留多久（秒）
+            max_channels (int, optional): 最多保留的通道数
+            max_age (float, optional): 未结束的通道最长保留多久（秒）
+            reap_interval (float, optional): 清理线程的运行间隔（秒）
+        """
+        self.keepalive_interval = keepalive_interval
+        self.ttl = ttl
+        self.max_channels = max_channels
+        self.max_age = max_age
+        self.reap_interval = reap_interval
+        self._channels: "OrderedDict[str, ResponseChannel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.reaped_count = 0
+
+    def _ensure_reaper(self) -> None:
+        """首次创建通道时启动清理线程（调用方持有锁）"""
+        if self._reaper is None or not self._reaper.is_alive():
+            self._stopped.clear()
+            self._reaper = threading.Thread(target=self._reap_loop, name="sse-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while not self._stopped.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"清理响应通道失败: {e}")
+
+    def reap(self, now: Optional[float] = None) -> int:
+        """
+        回收过期的通道，并按数量上限淘汰最久未访问的已结束通道
+
+        Returns:
+            int: 回收的通道数
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            for response_id, channel in list(self._channels.items()):
+                if channel.complete:
+                    expired = now - channel.completed_at >= self.ttl
+                else:
+                    expired = now - channel.created_at >= self.max_age
+                if expired:
+                    del self._channels[response_id]
+                    removed += 1
+            overflow = len(self._channels) - self.max_channels
+            for response_id, channel in list(self._channels.items()):
+                if overflow <= 0:
+                    break
+                if channel.complete:
+                    del self._channels[response_id]
+                    removed += 1
+                    overflow -= 1
+            self.reaped_count += removed
+        if removed:
+            logger.debug(f"已回收 {removed} 个响应通道")
+        return removed
+
+    def stop(self) -> None:
+        """停止清理线程"""
+        self._stopped.set()
+
+    def create(self, response_id: str) -> ResponseChannel:
+        """
+        创建（或替换）一个响应通道
+
+        Args:
+            response_id (str): 响应ID
+
+        Returns:
+            ResponseChannel: 新建的通道
+        """
+        channel = ResponseChannel(response_id, keepalive_interval=self.keepalive_interval)
+        with self._lock:
+            self._channels[response_id] = channel
+            self._channels.move_to_end(response_id)
+            self._ensure_reaper()
+        return channel
+
+    def get(self, response_id: str) -> Optional[ResponseChannel]:
+        """获取响应通道并刷新其访问顺序，不存在则返回None"""
+        with self._lock:
+            channel = self._channels.get(response_id)
+            if channel is not None:
+                self._channels.move_to_end(response_id)
+            return channel
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """通道数、其中已结束的数量和缓存的帧总字符数"""
+        with self._lock:
+            channels = list(self._channels.values())
+        return {
+            'channels': len(channels),
+            'complete': sum(1 for channel in channels if channel.complete),
+            'chars': sum(channel.size for channel in channels),
+            'reaped': self.reaped_count
+        }
+
+    def remove(self, response_id: str) -> None:
+        """移除响应通道"""
+        with self._lock:
+            self._channels.pop(response_id, None)
+
+    def __contains__(self, response_id: str) -> bool:
+        with self._lock:
+            return response_id in self._channels
+
+    def __getitem__(self, response_id: str) -> ResponseChannel:
+        with self._lock:
+            return self._channels[response_id]
+
+    def __delitem__(self, response_id: str) -> None:
+        with self._lock:
+            del self._channels[response_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._channels)
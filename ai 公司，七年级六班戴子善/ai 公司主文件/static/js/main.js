@@ -430,10 +430,28 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     };
     
+    // 获取目录的全部条目（/browse_files 按页返回，沿 next_cursor 取完所有页）
+    function fetchDirectory(path, cursor = null, files = []) {
+        const params = new URLSearchParams();
+        if (path) params.set('path', path);
+        if (cursor) params.set('cursor', cursor);
+        return fetch(`/browse_files?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status !== 'success') {
+                    return data;
+                }
+                const allFiles = files.concat(data.files);
+                if (data.next_cursor) {
+                    return fetchDirectory(path, data.next_cursor, allFiles);
+                }
+                return { ...data, files: allFiles };
+            });
+    }
+    
     // 浏览文件
     function browseFiles() {
-        fetch('/browse_files')
-            .then(response => response.json())
+        fetchDirectory()
             .then(data => {
                 if (data.status === 'success') {
                     showFileBrowser(data.files);
@@ -482,8 +500,7 @@ document.addEventListener('DOMContentLoaded', function() {
             fileItem.addEventListener('click', () => {
                 if (file.type === 'directory') {
                     // 浏览目录
-                    fetch(`/browse_files?path=${encodeURIComponent(file.path)}`)
-                        .then(response => response.json())
+                    fetchDirectory(file.path)
                         .then(data => {
                             if (data.status === 'success') {
                                 // 更新文件列表
@@ -505,8 +522,13 @@ document.addEventListener('DOMContentLoaded', function() {
                     fetch(`/read_file?path=${encodeURIComponent(file.path)}`)
                         .then(response => response.json())
                         .then(data => {
-                            if (data.status === 'success') {
+                            if (data.status === 'success' && data.binary) {
+                                showNotification(data.message || '二进制文件，无法显示', 'error');
+                            } else if (data.status === 'success') {
                                 addFileContentToChat(file.name, file.path, data.content);
+                                if (!data.eof) {
+                                    showNotification(`文件较大，仅显示前 ${data.end} 字节（共 ${data.size} 字节）`, 'info');
+                                }
                             } else {
                                 showNotification(data.message || '读取文件失败', 'error');
                             }
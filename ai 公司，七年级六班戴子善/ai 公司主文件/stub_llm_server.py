@@ -0,0 +1,284 @@
+# File: stub_llm_server.py
+# 本地模拟的 SiliconFlow /v1/chat/completions 接口
+# 用于离线验证传输层和压测：可注入延迟、卡顿和错误状态码，控制首 token 时间和生成速度，
+# 并按系统提示识别智能体角色，在回复中附带 @提及 和 [TASK_DONE] 标记以驱动完整的多智能体流程
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("AI-Workflow-Stub-LLM")
+
+DEFAULT_REPLY = "这是模拟的大模型回复。"
+
+# 按系统提示中的关键词识别智能体角色
+ROLE_KEYWORDS = (
+    ("需求分析", "analyst"),
+    ("项目总负责人", "ceo"),
+    ("小说作家", "writer"),
+    ("技术专家", "programmer"),
+    ("质量控制", "reviewer"),
+)
+# 完整流程的默认交接：分析官 -> CEO -> 小说家 -> 审核员 -> CEO ...
+WORKFLOW_MENTIONS = {
+    "analyst": "ceo",
+    "ceo": "writer",
+    "writer": "reviewer",
+    "programmer": "reviewer",
+    "reviewer": "ceo",
+}
+_TASK_NUMBER = re.compile(r"任务 #(\d+)")
+
+
+def detect_role(payload: Dict[str, Any]) -> Optional[str]:
+    """根据请求中的系统提示判断是哪个智能体，无法识别时返回None"""
+    for message in payload.get("messages", []):
+        if message.get("role") == "system":
+            for keyword, role in ROLE_KEYWORDS:
+                if keyword in message.get("content", ""):
+                    return role
+    return None
+
+
+class StubLLMConfig:
+    """模拟服务器的行为配置，运行中修改立即生效"""
+
+    def __init__(self, reply: str = DEFAULT_REPLY, chunk_size: int = 4,
+                 first_token_delay: float = 0.0, token_interval: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503,
+                 retry_after: Optional[float] = None, stall_seconds: float = 0.0,
+                 fail_statuses: Optional[List[int]] = None, tokens_per_second: Optional[float] = None,
+                 reply_padding: int = 0, mentions: Optional[Dict[str, str]] = None,
+                 task_done_rate: float = 0.0, include_usage: bool = True):
+        """
+        初始化配置
+
+        Args:
+            reply (str, optional): 回复内容
+            chunk_size (int, optional): 流式输出时每段的字符数
+            first_token_delay (float, optional): 首个增量前的延迟（秒）
+            token_interval (float, optional): 相邻增量之间的间隔（秒）
+            error_rate (float, optional): 随机返回错误状态码的概率
+            error_status (int, optional): 随机错误使用的状态码
+            retry_after (Optional[float]): 错误响应中附带的 Retry-After（秒）
+            stall_seconds (float, optional): 发送响应头后卡住多久再输出数据（秒）
+            fail_statuses (Optional[List[int]]): 依次返回的错误状态码队列，用完后恢复正常
+            tokens_per_second (Optional[float]): 生成速度（每段视为一个 token），设置后代替 token_interval
+            reply_padding (int, optional): 在回复后追加的填充字符数，用于模拟长回复
+            mentions (Optional[Dict[str, str]]): 角色到下一个 @提及 的映射，例如 WORKFLOW_MENTIONS
+            task_done_rate (float, optional): CEO 回复中附带 [TASK_DONE] 标记的概率（完成提示中出现的第一个任务）
+            include_usage (bool, optional): 是否在最后一段数据中附带 usage 用量统计
+        """
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.first_token_delay = first_token_delay
+        self.token_interval = token_interval
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.stall_seconds = stall_seconds
+        self.fail_statuses = list(fail_statuses or [])
+        self.tokens_per_second = tokens_per_second
+        self.reply_padding = reply_padding
+        self.mentions = dict(mentions or {})
+        self.task_done_rate = task_done_rate
+        self.include_usage = include_usage
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self) -> float:
+        """相邻两段之间的间隔（秒）"""
+        if self.tokens_per_second:
+            return 1.0 / self.tokens_per_second
+        return self.token_interval
+
+    def compose_reply(self, payload: Dict[str, Any]) -> str:
+        """
+        根据请求生成回复：基础回复 + 填充 + [TASK_DONE] 标记 + @提及
+
+        Args:
+            payload (Dict[str, Any]): 请求体
+
+        Returns:
+            str: 回复文本
+        """
+        reply = self.reply + "模" * self.reply_padding
+        role = detect_role(payload)
+        if role == "ceo" and self.task_done_rate and random.random() < self.task_done_rate:
+            prompt = "".join(message.get("content", "") for message in payload.get("messages", [])
+                             if message.get("role") == "user")
+            match = _TASK_NUMBER.search(prompt)
+            if match:
+                reply += f"\n[TASK_DONE] 任务 #{match.group(1)} 已完成"
+        target = self.mentions.get(role) if role else None
+        if target:
+            reply += f"\n@{target}"
+        return reply
+
+    def next_failure(self) -> Optional[int]:
+        """决定本次请求是否返回错误，返回状态码或None"""
+        with self._lock:
+            self.requests_served += 1
+            if self.fail_statuses:
+                return self.fail_statuses.pop(0)
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_status
+        return None
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    @property
+    def config(self) -> StubLLMConfig:
+        return self.server.config
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+
+        status = self.config.next_failure()
+        if status is not None:
+            extra = {}
+            if self.config.retry_after is not None:
+                extra["Retry-After"] = str(self.config.retry_after)
+            self._send_json(status, {"error": f"injected {status}"}, extra)
+            return
+
+        reply = self.config.compose_reply(payload)
+        if payload.get("stream"):
+            self._stream(reply, payload)
+        else:
+            time.sleep(self.config.first_token_delay + self.config.stall_seconds)
+            self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": reply}}]})
+
+    def _send_json(self, status: int, body: dict, extra_headers: Optional[dict] = None) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream(self, reply: str, payload: Dict[str, Any]) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.wfile.flush()
+
+        time.sleep(self.config.stall_seconds + self.config.first_token_delay)
+        size = max(1, self.config.chunk_size)
+        interval = self.config.interval
+        try:
+            for i in range(0, len(reply), size):
+                if i and interval:
+                    time.sleep(interval)
+                event = {"choices": [{"delta": {"content": reply[i:i + size]}}]}
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            if self.config.include_usage:
+                # 与 OpenAI 兼容接口一致：最后一段不含增量，只有用量统计
+                prompt_chars = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+                usage = {"prompt_tokens": prompt_chars // 2, "completion_tokens": -(-len(reply) // size)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("客户端提前断开连接")
+
+
+class StubLLMServer:
+    """
+    在后台线程中运行的模拟大模型服务器。
+
+    用法::
+
+        server = StubLLMServer(StubLLMConfig(fail_statuses=[429, 503]))
+        server.start()
+        transport = LLMTransport(server.url, "test-key")
+        ...
+        server.stop()
+    """
+
+    def __init__(self, config: Optional[StubLLMConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubLLMConfig()
+        self._httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.config = self.config
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """/v1/chat/completions 的完整地址"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self) -> "StubLLMServer":
+        """启动服务器"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """停止服务器"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的大模型接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--token-interval", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--stall", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--padding", type=int, default=0, help="回复后追加的填充字符数")
+    parser.add_argument("--workflow", action="store_true", help="按角色附带 @提及，驱动完整的多智能体流程")
+    parser.add_argument("--task-done-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubLLMConfig(first_token_delay=args.first_token_delay, token_interval=args.token_interval,
+                           error_rate=args.error_rate, error_status=args.error_status,
+                           retry_after=args.retry_after, stall_seconds=args.stall,
+                           tokens_per_second=args.tokens_per_second, reply_padding=args.padding,
+                           mentions=WORKFLOW_MENTIONS if args.workflow else None,
+                           task_done_rate=args.task_done_rate)
+    server = StubLLMServer(config, host=args.host, port=args.port)
+    print(f"模拟大模型接口已启动: {server.url}")
+    print(f"设置环境变量 AI_WORKFLOW_API_URL={server.url} 后启动 app.py 即可使用")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
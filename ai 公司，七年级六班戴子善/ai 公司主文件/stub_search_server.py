@@ -0,0 +1,201 @@
+# File: stub_search_server.py
+# 本地模拟的搜索接口（DuckDuckGo Instant Answer 格式）和结果页面
+# 用于离线验证搜索流水线和页面抓取：结果由查询确定性生成，不同查询之间有重复的 URL；
+# /page/ 下的页面带 ETag 和 Last-Modified，支持条件请求；可注入延迟和错误状态码
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+import logging
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+logger = logging.getLogger("AI-Workflow-Stub-Search")
+
+
+class StubSearchConfig:
+    """模拟服务器的行为配置，运行中修改立即生效"""
+
+    def __init__(self, results_per_query: int = 5, shared_results: int = 1, delay: float = 0.0,
+                 fail_statuses: Optional[List[int]] = None, page_paragraphs: int = 20):
+        """
+        初始化配置
+
+        Args:
+            results_per_query (int, optional): 每条查询返回的结果数
+            shared_results (int, optional): 其中所有查询共有的结果数（用于验证去重）
+            delay (float, optional): 每个请求的响应延迟（秒）
+            fail_statuses (Optional[List[int]]): 依次返回的错误状态码队列，用完后恢复正常
+            page_paragraphs (int, optional): 每个页面的正文段落数
+        """
+        self.results_per_query = results_per_query
+        self.shared_results = shared_results
+        self.delay = delay
+        self.fail_statuses = list(fail_statuses or [])
+        self.page_paragraphs = page_paragraphs
+        # 页面版本号，修改后 ETag 随之变化
+        self.page_version = 1
+        self.requests_served = 0
+        self.pages_served = 0
+        self.not_modified = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def begin(self) -> Optional[int]:
+        """登记一个请求，返回需要注入的错误状态码或None"""
+        with self._lock:
+            self.requests_served += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            if self.fail_statuses:
+                return self.fail_statuses.pop(0)
+        return None
+
+    def end(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    @property
+    def config(self) -> StubSearchConfig:
+        return self.server.config
+
+    def do_GET(self):
+        status = self.config.begin()
+        try:
+            time.sleep(self.config.delay)
+            if status is not None:
+                self._send_json(status, {"error": f"injected {status}"})
+                return
+            parts = urlsplit(self.path)
+            if parts.path.startswith("/page/"):
+                self._page(unquote(parts.path[len("/page/"):]))
+                return
+            query = parse_qs(parts.query).get("q", [""])[0]
+            self._send_json(200, self._results(query))
+        finally:
+            self.config.end()
+
+    def _results(self, query: str) -> dict:
+        host, port = self.server.server_address[:2]
+        base = f"http://{host}:{port}/page"
+        topics = []
+        for i in range(self.config.results_per_query):
+            if i < self.config.shared_results:
+                # 所有查询共有的结果，附带跟踪参数，验证规范化去重
+                url = f"{base}/shared-{i}?utm_source={quote(query)}"
+                text = f"共同结果 {i} - 与查询无关的页面"
+            else:
+                url = f"{base}/{quote(query)}-{i}"
+                text = f"{query} 结果 {i} - 关于 {query} 的页面"
+            topics.append({"Text": text, "FirstURL": url})
+        # 模拟 RelatedTopics 中的分组结构
+        return {"Heading": query, "AbstractText": "", "AbstractURL": "",
+                "RelatedTopics": topics[:1] + [{"Name": "分组", "Topics": topics[1:]}]}
+
+    def _page(self, name: str) -> None:
+        """返回一个带导航、脚本和正文的 HTML 页面"""
+        etag = '"%s"' % hashlib.sha1(f"{name}:{self.config.page_version}".encode('utf-8')).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            with self.config._lock:
+                self.config.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        paragraphs = "".join(f"<p>{name} 的正文第 {i} 段，这里是页面中真正有用的内容。</p>\n"
+                             for i in range(self.config.page_paragraphs))
+        body = (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{name}</title>"
+                f"<style>p {{ color: #333; }}</style><script>var tracking = 1;</script></head><body>"
+                f"<nav><a href=\"/\">首页</a> <a href=\"/about\">关于我们的网站导航链接</a></nav>"
+                f"<main><h1>{name}</h1>\n{paragraphs}</main>"
+                f"<footer>版权所有 © 模拟网站，保留所有权利。</footer></body></html>").encode('utf-8')
+        with self.config._lock:
+            self.config.pages_served += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(usegmt=True))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubSearchServer:
+    """
+    在后台线程中运行的模拟搜索服务器。
+
+    用法::
+
+        server = StubSearchServer(StubSearchConfig(delay=0.2)).start()
+        pipeline = WebSearchPipeline(DuckDuckGoBackend(server.url))
+        ...
+        server.stop()
+    """
+
+    def __init__(self, config: Optional[StubSearchConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubSearchConfig()
+        self._httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.config = self.config
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """搜索接口地址"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "StubSearchServer":
+        """启动服务器"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-search", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """停止服务器"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的搜索接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--results", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubSearchServer(StubSearchConfig(results_per_query=args.results, delay=args.delay),
+                              host=args.host, port=args.port)
+    print(f"模拟搜索接口已启动: {server.url}")
+    print(f"设置环境变量 AI_WORKFLOW_SEARCH_URL={server.url} 后启动 app.py 即可使用")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
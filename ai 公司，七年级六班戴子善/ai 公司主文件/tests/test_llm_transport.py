@@ -0,0 +1,69 @@
+# File: tests/test_llm_transport.py
+# 传输层的回归测试：半开探测收到 4xx 后熔断器必须恢复；异步客户端经由传输层重试
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_transport import CircuitBreaker, LLMTransport, RetryPolicy, TransportError  # noqa: E402
+from stub_llm_server import StubLLMConfig, StubLLMServer  # noqa: E402
+
+
+@pytest.fixture
+def stub_server():
+    server = StubLLMServer(StubLLMConfig()).start()
+    yield server
+    server.stop()
+
+
+def test_half_open_probe_with_client_error_closes_breaker(stub_server):
+    stub_server.config.fail_statuses = [503, 400]
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.0)
+    transport = LLMTransport(stub_server.url, "test-key", retry_policy=RetryPolicy(max_attempts=1),
+                             circuit_breaker=breaker)
+    payload = {"model": "test", "messages": [{"role": "user", "content": "hi"}]}
+
+    # 503 打开熔断器
+    with pytest.raises(TransportError):
+        transport.post_json(payload)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # 半开探测收到 400：不是上游故障，探测结束
+    with pytest.raises(TransportError) as excinfo:
+        transport.post_json(payload)
+    assert excinfo.value.status_code == 400
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    # 之后的请求正常放行
+    assert transport.post_json(payload)["choices"]
+    assert transport.post_json(payload)["choices"]
+
+
+def test_async_client_retries_through_transport(stub_server):
+    pytest.importorskip("aiohttp")
+    from llm_client import AsyncLLMClient
+
+    stub_server.config.fail_statuses = [503]
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.0)
+    transport = LLMTransport(stub_server.url, "test-key",
+                             retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01),
+                             circuit_breaker=breaker)
+    payload = {"model": "test", "messages": [{"role": "user", "content": "hi"}]}
+
+    async def run():
+        client = AsyncLLMClient(stub_server.url, "test-key", transport=transport)
+        try:
+            return "".join([chunk async for chunk in client.stream_chat(payload)])
+        finally:
+            await client.close()
+
+    # 503 重试后成功；异步路径的失败同样计入熔断器和统计
+    assert asyncio.run(run())
+    stats = transport.stats.snapshot()
+    assert stats["retries"] == 1
+    assert stats["outcomes"] == {"http_503": 1, "success": 1}
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,201 @@
+# File: tracing.py
+# 轻量的工作流追踪
+# 各处记录的时间段（span）和瞬时事件按工作流ID关联，写入固定容量的环形缓冲区；
+# 可按工作流导出为 Chrome trace-event JSON，在 Perfetto 或 chrome://tracing 中查看
+
+import contextvars
+import functools
+import os
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("AI-Workflow-Tracing")
+
+# 追踪开关和缓冲区容量（所有工作流共用，写满后覆盖最旧的记录）
+TRACING_ENABLED = os.environ.get("AI_WORKFLOW_TRACE", "1") == "1"
+DEFAULT_BUFFER_SIZE = int(os.environ.get("AI_WORKFLOW_TRACE_BUFFER", "50000"))
+
+# 当前线程/协程所属的工作流ID
+_current_workflow: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("workflow_id", default=None)
+
+# time.monotonic() 到微秒级 Unix 时间的偏移，记录用单调时钟，导出时换算
+_EPOCH_OFFSET = time.time() - time.monotonic()
+
+
+def _to_us(monotonic_seconds: float) -> int:
+    return int((monotonic_seconds + _EPOCH_OFFSET) * 1_000_000)
+
+
+class Tracer:
+    """
+    追踪记录器。
+
+    用法::
+
+        with tracer.bind(workflow_id):
+            with tracer.span("turn", agent="ceo"):
+                ...
+            tracer.instant("handoff", to="writer")
+        trace = tracer.export(workflow_id)
+
+    没有绑定工作流或追踪关闭时，span 和事件都直接跳过，开销只有一次上下文变量读取。
+    生成器中无法用 with 包住 yield 的时间段，可以自己取 time.monotonic() 后调用 ``complete``。
+    """
+
+    def __init__(self, capacity: int = DEFAULT_BUFFER_SIZE, enabled: bool = TRACING_ENABLED):
+        """
+        初始化记录器
+
+        Args:
+            capacity (int, optional): 环形缓冲区容量（事件数）
+            enabled (bool, optional): 是否记录
+        """
+        self.enabled = enabled
+        self._events: deque = deque(maxlen=max(1, capacity))
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.pid = os.getpid()
+
+    @contextmanager
+    def bind(self, workflow_id: Optional[str]) -> Iterator[None]:
+        """在当前线程或协程中把后续记录关联到 workflow_id"""
+        token = _current_workflow.set(workflow_id)
+        try:
+            yield
+        finally:
+            _current_workflow.reset(token)
+
+    @staticmethod
+    def current_workflow() -> Optional[str]:
+        return _current_workflow.get()
+
+    def _append(self, event: Dict[str, Any]) -> None:
+        thread = threading.current_thread()
+        event["pid"] = self.pid
+        event["tid"] = thread.ident
+        with self._lock:
+            self._events.append(event)
+            if thread.ident not in self._threads:
+                self._threads[thread.ident] = thread.name
+
+    def complete(self, name: str, start: float, end: Optional[float] = None,
+                 workflow_id: Optional[str] = None, category: str = "workflow", **args: Any) -> None:
+        """
+        记录一个已结束的时间段
+
+        Args:
+            name (str): 名称
+            start (float): 开始时间（time.monotonic）
+            end (Optional[float]): 结束时间，默认为现在
+            workflow_id (Optional[str]): 工作流ID，默认使用当前绑定的
+            category (str, optional): 分类
+            **args: 附加参数（显示在 Perfetto 的详情中）
+        """
+        workflow_id = workflow_id or _current_workflow.get()
+        if not self.enabled or workflow_id is None:
+            return
+        end = time.monotonic() if end is None else end
+        self._append({"name": name, "cat": category, "ph": "X", "ts": _to_us(start),
+                      "dur": max(0, int((end - start) * 1_000_000)), "wf": workflow_id, "args": args})
+
+    def instant(self, name: str, at: Optional[float] = None, workflow_id: Optional[str] = None,
+                category: str = "workflow", **args: Any) -> None:
+        """
+        记录一个瞬时事件
+
+        Args:
+            name (str): 名称
+            at (Optional[float]): 发生时间（time.monotonic），默认为现在
+            workflow_id (Optional[str]): 工作流ID，默认使用当前绑定的
+            category (str, optional): 分类
+            **args: 附加参数
+        """
+        workflow_id = workflow_id or _current_workflow.get()
+        if not self.enabled or workflow_id is None:
+            return
+        at = time.monotonic() if at is None else at
+        self._append({"name": name, "cat": category, "ph": "i", "s": "t", "ts": _to_us(at),
+                      "wf": workflow_id, "args": args})
+
+    @contextmanager
+    def span(self, name: str, category: str = "workflow", **args: Any) -> Iterator[Dict[str, Any]]:
+        """
+        记录 with 块的时间段，产出的字典可在块内补充参数；块内抛出的异常记为 error 参数
+
+        Args:
+            name (str): 名称
+            category (str, optional): 分类
+            **args: 附加参数
+        """
+        workflow_id = _current_workflow.get()
+        if not self.enabled or workflow_id is None:
+            yield args
+            return
+        start = time.monotonic()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.complete(name, start, workflow_id=workflow_id, category=category, **args)
+
+    def traced(self, name: Optional[str] = None, category: str = "workflow") -> Callable:
+        """把函数调用记录为时间段的装饰器"""
+        def decorator(fn: Callable) -> Callable:
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or _current_workflow.get() is None:
+                    return fn(*args, **kwargs)
+                with self.span(span_name, category=category):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def events(self, workflow_id: str) -> List[Dict[str, Any]]:
+        """缓冲区中某个工作流的全部记录（按时间排序）"""
+        with self._lock:
+            events = [event for event in self._events if event["wf"] == workflow_id]
+        return sorted(events, key=lambda event: event["ts"])
+
+    def export(self, workflow_id: str) -> Dict[str, Any]:
+        """
+        导出某个工作流的 Chrome trace-event JSON
+
+        Args:
+            workflow_id (str): 工作流ID
+
+        Returns:
+            Dict[str, Any]: 可直接序列化的 trace，包含线程名元数据
+        """
+        events = [{key: value for key, value in event.items() if key != "wf"}
+                  for event in self.events(workflow_id)]
+        with self._lock:
+            thread_names = {tid: self._threads.get(tid, str(tid)) for tid in {event["tid"] for event in events}}
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                     "args": {"name": f"workflow {workflow_id}"}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": thread_name}}
+                     for tid, thread_name in thread_names.items()]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms",
+                "otherData": {"workflow_id": workflow_id}}
+
+    def workflows(self) -> List[str]:
+        """缓冲区中有记录的工作流ID"""
+        with self._lock:
+            return list(dict.fromkeys(event["wf"] for event in self._events))
+
+
+def run_in_context(fn: Callable, *args: Any, **kwargs: Any) -> Callable[[], Any]:
+    """把调用和当前上下文（含绑定的工作流ID）打包，交给线程池执行时记录仍能关联到工作流"""
+    context = contextvars.copy_context()
+    return lambda: context.run(fn, *args, **kwargs)
+
+
+# 进程内共享的记录器
+tracer = Tracer()
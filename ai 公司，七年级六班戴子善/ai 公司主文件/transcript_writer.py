@@ -0,0 +1,246 @@
+# File: transcript_writer.py
+# 对话记录写入器
+# 只追加新的增量文本，由一个后台线程批量写入：定期刷新、按间隔合并 fsync，
+# 每个会话的每个智能体一个文件，超过大小上限时轮转
+
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("AI-Workflow-Transcript")
+
+TRANSCRIPT_DIR_NAME = "transcripts"
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_FSYNC_INTERVAL = 5.0
+DEFAULT_MAX_FILE_BYTES = 8 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+# 缓冲超过该字节数时立即唤醒写线程，不等刷新间隔
+FLUSH_THRESHOLD = 256 * 1024
+MAX_OPEN_FILES = 64
+
+
+def transcript_path(directory: str, session_id: str, agent_id: str) -> str:
+    """某个会话中某个智能体的记录文件路径"""
+    safe_session = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(session_id))[:64] or "default"
+    return os.path.join(directory, TRANSCRIPT_DIR_NAME, f"{agent_id}_{safe_session}.md")
+
+
+class _OpenFile:
+    __slots__ = ("handle", "size", "dirty_since")
+
+    def __init__(self, handle, size: int):
+        self.handle = handle
+        self.size = size
+        self.dirty_since: Optional[float] = None
+
+
+class TranscriptWriter:
+    """
+    缓冲的追加写入器。
+
+    用法::
+
+        writer = TranscriptWriter()
+        writer.start_turn(project_dir, session_id, "writer")
+        for chunk in stream:
+            writer.append(project_dir, session_id, "writer", chunk)
+        writer.flush()  # 需要确保落盘时调用
+
+    append 只把文本放入内存缓冲，写文件、fsync 和轮转都在后台线程中完成，
+    因此生成流的线程不会被磁盘 IO 阻塞。
+    """
+
+    def __init__(self, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+                 max_file_bytes: int = DEFAULT_MAX_FILE_BYTES, backups: int = DEFAULT_BACKUPS):
+        """
+        初始化写入器
+
+        Args:
+            flush_interval (float, optional): 缓冲写入文件的间隔（秒）
+            fsync_interval (float, optional): 同一文件两次 fsync 之间的最短间隔（秒）
+            max_file_bytes (int, optional): 单个文件的大小上限，超过后轮转
+            backups (int, optional): 轮转时保留的旧文件数（name.1.md ... name.N.md）
+        """
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_file_bytes = max_file_bytes
+        self.backups = backups
+        self._pending: Dict[str, List[str]] = defaultdict(list)
+        self._pending_bytes = 0
+        self._files: "OrderedDict[str, _OpenFile]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._flush_requested = 0
+        self._flushed = 0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"appends": 0, "writes": 0, "fsyncs": 0, "rotations": 0, "bytes": 0, "errors": 0}
+
+    def _ensure_thread(self) -> None:
+        """首次写入时启动后台线程（调用方持有锁）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+            self._thread.start()
+
+    def append(self, directory: str, session_id: str, agent_id: str, text: str) -> None:
+        """
+        追加一段增量文本
+
+        Args:
+            directory (str): 项目文件夹
+            session_id (str): 会话ID
+            agent_id (str): 智能体ID
+            text (str): 新增的文本
+        """
+        if not text:
+            return
+        path = transcript_path(directory, session_id, agent_id)
+        with self._cond:
+            if self._closed:
+                logger.warning(f"写入器已关闭，丢弃 {path} 的记录")
+                return
+            self._pending[path].append(text)
+            self._pending_bytes += len(text)
+            self.stats["appends"] += 1
+            self._ensure_thread()
+            if self._pending_bytes >= FLUSH_THRESHOLD:
+                self._cond.notify()
+
+    def start_turn(self, directory: str, session_id: str, agent_id: str, title: Optional[str] = None) -> None:
+        """写入新回合的标题"""
+        heading = title or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.append(directory, session_id, agent_id, f"\n\n## {heading}\n\n")
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """
+        立即写入所有缓冲并 fsync，等待完成
+
+        Returns:
+            bool: 是否在超时前完成
+        """
+        with self._cond:
+            if self._thread is None:
+                return True
+            self._flush_requested += 1
+            target = self._flush_requested
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._flushed >= target or not self._thread.is_alive(),
+                                       timeout=timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """写完剩余缓冲并关闭所有文件"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and self._flushed >= self._flush_requested \
+                        and self._pending_bytes < FLUSH_THRESHOLD:
+                    self._cond.wait(timeout=self.flush_interval)
+                pending, self._pending = self._pending, defaultdict(list)
+                self._pending_bytes = 0
+                flush_target = self._flush_requested
+                closing = self._closed
+            force_sync = closing or flush_target > self._flushed
+            for path, parts in pending.items():
+                self._write(path, "".join(parts))
+            self._sync(force=force_sync)
+            if closing:
+                with self._cond:
+                    # 关闭期间仍可能有最后一批写入
+                    if self._pending:
+                        continue
+                self._close_files()
+                with self._cond:
+                    self._flushed = self._flush_requested
+                    self._cond.notify_all()
+                return
+            if force_sync:
+                with self._cond:
+                    self._flushed = flush_target
+                    self._cond.notify_all()
+
+    def _open(self, path: str) -> _OpenFile:
+        entry = self._files.get(path)
+        if entry is not None:
+            self._files.move_to_end(path)
+            return entry
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, 'a', encoding='utf-8')
+        entry = self._files[path] = _OpenFile(handle, os.path.getsize(path))
+        while len(self._files) > MAX_OPEN_FILES:
+            _, oldest = self._files.popitem(last=False)
+            self._close_entry(oldest)
+        return entry
+
+    def _rotate(self, path: str) -> None:
+        """把 name.md 依次改名为 name.1.md、name.2.md ...，超出保留数的旧文件删除"""
+        entry = self._files.pop(path, None)
+        if entry is not None:
+            self._close_entry(entry)
+        stem, ext = os.path.splitext(path)
+        for index in range(self.backups, 0, -1):
+            source = path if index == 1 else f"{stem}.{index - 1}{ext}"
+            target = f"{stem}.{index}{ext}"
+            if os.path.exists(source):
+                os.replace(source, target)
+        if self.backups <= 0 and os.path.exists(path):
+            os.remove(path)
+        self.stats["rotations"] += 1
+
+    def _write(self, path: str, text: str) -> None:
+        data_bytes = len(text.encode('utf-8'))
+        try:
+            entry = self._open(path)
+            if entry.size and entry.size + data_bytes > self.max_file_bytes:
+                self._rotate(path)
+                entry = self._open(path)
+            entry.handle.write(text)
+            entry.handle.flush()
+            entry.size += data_bytes
+            if entry.dirty_since is None:
+                entry.dirty_since = time.monotonic()
+            self.stats["writes"] += 1
+            self.stats["bytes"] += data_bytes
+        except OSError as e:
+            self.stats["errors"] += 1
+            logger.error(f"写入对话记录失败 {path}: {str(e)}")
+
+    def _sync(self, force: bool = False) -> None:
+        """对距上次 fsync 超过间隔的文件执行 fsync（force 时全部执行）"""
+        now = time.monotonic()
+        for path, entry in self._files.items():
+            if entry.dirty_since is None:
+                continue
+            if force or now - entry.dirty_since >= self.fsync_interval:
+                try:
+                    os.fsync(entry.handle.fileno())
+                    self.stats["fsyncs"] += 1
+                except OSError as e:
+                    self.stats["errors"] += 1
+                    logger.error(f"同步对话记录失败 {path}: {str(e)}")
+                entry.dirty_since = None
+
+    def _close_entry(self, entry: _OpenFile) -> None:
+        try:
+            if entry.dirty_since is not None:
+                entry.handle.flush()
+                os.fsync(entry.handle.fileno())
+                self.stats["fsyncs"] += 1
+            entry.handle.close()
+        except OSError as e:
+            logger.error(f"关闭对话记录失败: {str(e)}")
+
+    def _close_files(self) -> None:
+        while self._files:
+            _, entry = self._files.popitem(last=False)
+            self._close_entry(entry)
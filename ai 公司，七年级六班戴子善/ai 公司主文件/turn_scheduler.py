@@ -0,0 +1,233 @@
+# File: turn_scheduler.py
+# 智能体回合的调度器
+# 固定数量的工作线程 + 有上限的等待队列（满时拒绝，由调用方返回 429），
+# 各会话轮流出队，同一会话同时只执行一个回合，避免一个会话的长循环占满所有线程
+
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger("AI-Workflow-Scheduler")
+
+DEFAULT_WORKERS = 3
+DEFAULT_MAX_QUEUE = 50
+# 估算 Retry-After 时使用的回合耗时初值（秒）
+DEFAULT_TURN_SECONDS = 20.0
+EWMA_ALPHA = 0.2
+
+
+class SchedulerFull(Exception):
+    """等待队列已满"""
+
+    def __init__(self, retry_after: int, queue_depth: int):
+        super().__init__(f"回合队列已满（{queue_depth} 个等待中），请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+
+
+class ScheduledTurn:
+    """一个排队中的回合"""
+    __slots__ = ("session_key", "fn", "args", "kwargs", "enqueued_at", "started_at")
+
+    def __init__(self, session_key: str, fn: Callable, args: tuple, kwargs: dict):
+        self.session_key = session_key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+
+class TurnScheduler:
+    """
+    公平的回合调度器。
+
+    用法::
+
+        scheduler = TurnScheduler(workers=3, max_queue=50)
+        try:
+            scheduler.submit(session_id, generate_agent_response, session, text, response_id)
+        except SchedulerFull as e:
+            return 429, e.retry_after
+
+    有待执行回合的会话排成一个环，工作线程每次从环首的会话取一个回合，执行后该会话排到环尾；
+    正在执行回合的会话暂时离开环，因此同一会话的回合按顺序执行，也不会占用多个线程。
+    回合函数返回 Future 时（例如提交到事件循环的协程），工作线程立即释放，会话在 Future 完成后才重新入环。
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE,
+                 wait_observer: Optional[Callable[[float], None]] = None):
+        """
+        初始化调度器
+
+        Args:
+            workers (int, optional): 工作线程数
+            max_queue (int, optional): 等待中的回合数上限（不含正在执行的）
+            wait_observer (Optional[Callable[[float], None]]): 每个回合开始执行时以其排队秒数调用（用于指标）
+        """
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.wait_observer = wait_observer
+        self._queues: Dict[str, Deque[ScheduledTurn]] = {}
+        self._ready: "OrderedDict[str, None]" = OrderedDict()
+        self._running: Dict[str, ScheduledTurn] = {}
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+        self._avg_turn = DEFAULT_TURN_SECONDS
+        self._avg_wait = 0.0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def _ensure_workers(self) -> None:
+        """首次提交时启动工作线程（调用方持有锁）"""
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"turn-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def retry_after(self) -> int:
+        """按平均回合耗时估算排队中的回合全部开始所需的秒数"""
+        with self._cond:
+            return self._retry_after_locked()
+
+    def _retry_after_locked(self) -> int:
+        estimate = self._avg_turn * max(1, self._queued) / self.workers
+        return int(min(120, max(1, estimate)))
+
+    def submit(self, session_key: str, fn: Callable, *args: Any, **kwargs: Any) -> ScheduledTurn:
+        """
+        提交一个回合
+
+        Args:
+            session_key (str): 会话ID，用于公平调度和同一会话内的串行
+            fn (Callable): 回合函数
+            *args, **kwargs: 传给回合函数的参数
+
+        Returns:
+            ScheduledTurn: 排队中的回合
+
+        Raises:
+            SchedulerFull: 等待队列已满
+            RuntimeError: 调度器已关闭
+        """
+        turn = ScheduledTurn(session_key, fn, args, kwargs)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("调度器已关闭")
+            if self._queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise SchedulerFull(self._retry_after_locked(), self._queued)
+            self._queues.setdefault(session_key, deque()).append(turn)
+            self._queued += 1
+            self.stats["submitted"] += 1
+            if session_key not in self._running:
+                self._ready[session_key] = None
+            self._ensure_workers()
+            self._cond.notify()
+        return turn
+
+    def _next_turn(self) -> Optional[ScheduledTurn]:
+        """取环首会话的下一个回合（调用方持有锁）"""
+        while self._ready:
+            session_key, _ = self._ready.popitem(last=False)
+            queue = self._queues.get(session_key)
+            if not queue:
+                self._queues.pop(session_key, None)
+                continue
+            turn = queue.popleft()
+            if not queue:
+                del self._queues[session_key]
+            self._queued -= 1
+            self._running[session_key] = turn
+            return turn
+        return None
+
+    def _finish(self, turn: ScheduledTurn, failed: bool) -> None:
+        """回合结束：记录耗时，会话还有排队的回合时排到环尾"""
+        with self._cond:
+            self._running.pop(turn.session_key, None)
+            self.stats["failed" if failed else "completed"] += 1
+            duration = time.monotonic() - (turn.started_at or turn.enqueued_at)
+            self._avg_turn += EWMA_ALPHA * (duration - self._avg_turn)
+            if self._queues.get(turn.session_key):
+                self._ready[turn.session_key] = None
+                self._cond.notify()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                turn = self._next_turn()
+                while turn is None:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    turn = self._next_turn()
+                turn.started_at = time.monotonic()
+                waited = turn.started_at - turn.enqueued_at
+                self._avg_wait += EWMA_ALPHA * (waited - self._avg_wait)
+            if self.wait_observer is not None:
+                self.wait_observer(waited)
+            try:
+                result = turn.fn(*turn.args, **turn.kwargs)
+            except Exception as e:
+                logger.error(f"回合执行失败 ({turn.session_key}): {e}", exc_info=True)
+                self._finish(turn, failed=True)
+                continue
+            if isinstance(result, Future):
+                # 在别处执行的回合：线程立即释放，完成后会话再重新参与调度
+                result.add_done_callback(lambda future, turn=turn: self._finish(turn, future.exception() is not None))
+            else:
+                self._finish(turn, failed=False)
+
+    def pending(self, session_key: str) -> int:
+        """
+        某个会话排队中和执行中的回合数
+
+        Args:
+            session_key (str): 会话ID
+
+        Returns:
+            int: 回合数（执行中的回合在返回的 Future 完成前都计入）
+        """
+        with self._cond:
+            return len(self._queues.get(session_key, ())) + (1 if session_key in self._running else 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        当前的队列状态
+
+        Returns:
+            Dict[str, Any]: 工作线程数、队列上限、等待和执行中的回合数、最久等待时间、平均等待时间、
+            平均回合耗时、各会话的等待数和累计计数
+        """
+        now = time.monotonic()
+        with self._cond:
+            oldest = min((queue[0].enqueued_at for queue in self._queues.values() if queue), default=None)
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queued': self._queued,
+                'running': len(self._running),
+                'sessions_waiting': len(self._queues),
+                'oldest_wait_seconds': round(now - oldest, 3) if oldest is not None else 0.0,
+                'avg_wait_seconds': round(self._avg_wait, 3),
+                'avg_turn_seconds': round(self._avg_turn, 3),
+                'per_session': {key: len(queue) for key, queue in self._queues.items()},
+                **self.stats
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """停止接收新回合；已排队的回合执行完后工作线程退出"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,257 @@
+# File: web_search.py
+# 并发的批量网络搜索
+# 一批查询在有并发上限的线程池中执行（带超时、参数正确编码），结果按规范化后的 URL 跨查询去重，
+# 单条查询的结果按 TTL 缓存；搜索后端可替换，便于对本地模拟服务器测试
+
+import hashlib
+import re
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from response_cache import ResponseCache
+
+logger = logging.getLogger("AI-Workflow-Web-Search")
+
+DEFAULT_SEARCH_URL = "https://api.duckduckgo.com/"
+DEFAULT_CONCURRENCY = 4
+# (连接超时, 读取超时)
+DEFAULT_TIMEOUT = (3.05, 10.0)
+DEFAULT_RESULTS_PER_QUERY = 5
+SEARCH_CACHE_TTL = 3600
+SEARCH_CACHE_ENTRIES = 512
+
+# 不影响页面内容的跟踪参数，规范化 URL 时去掉
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "spm", "ref", "ref_src"}
+# suggest_search_queries 生成的查询可能带编号、引号或兜底前缀
+_QUERY_PREFIX = re.compile(r"^\s*(?:\d+[.、)）]\s*|[-*•]\s*|在浏览器中搜索[:：]\s*)+")
+
+
+def normalize_url(url: str) -> str:
+    """
+    规范化 URL，用于跨查询去重：协议和主机名小写、去掉默认端口、片段、跟踪参数和末尾的斜杠，查询参数排序
+
+    Args:
+        url (str): 原始 URL
+
+    Returns:
+        str: 规范化后的 URL
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS))
+    path = parts.path.rstrip("/") or ""
+    # http 和 https 视为同一页面
+    return urlunsplit(("https" if scheme in ("http", "https") else scheme, host, path, query, ""))
+
+
+def clean_query(query: str) -> str:
+    """去掉查询建议中的编号、列表符号、引号和多余空白"""
+    query = _QUERY_PREFIX.sub("", query)
+    return " ".join(query.strip().strip("\"'“”‘’「」").split())
+
+
+class SearchBackend:
+    """
+    搜索后端接口。子类实现 search，返回 title、description、url 组成的结果列表；
+    网络或解析错误直接抛出，由 WebSearchPipeline 记录并跳过该查询。
+    """
+
+    name = "base"
+
+    def search(self, session: requests.Session, query: str, limit: int,
+               timeout: Tuple[float, float]) -> List[Dict[str, str]]:
+        raise NotImplementedError
+
+    def cache_namespace(self) -> str:
+        """区分不同后端（及不同地址）的缓存"""
+        return self.name
+
+
+class DuckDuckGoBackend(SearchBackend):
+    """DuckDuckGo Instant Answer 接口（或与之格式相同的本地模拟服务器）"""
+
+    name = "duckduckgo"
+
+    def __init__(self, url: str = DEFAULT_SEARCH_URL):
+        self.url = url
+
+    def cache_namespace(self) -> str:
+        return f"{self.name}:{self.url}"
+
+    @staticmethod
+    def _flatten(topics: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """RelatedTopics 中可能嵌套分组（Topics），展开成一层"""
+        for topic in topics:
+            if 'Topics' in topic:
+                yield from DuckDuckGoBackend._flatten(topic['Topics'])
+            else:
+                yield topic
+
+    def search(self, session: requests.Session, query: str, limit: int,
+               timeout: Tuple[float, float]) -> List[Dict[str, str]]:
+        response = session.get(self.url, params={"q": query, "format": "json", "no_html": 1,
+                                                 "skip_disambig": 1}, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        results = []
+        if data.get('AbstractURL') and data.get('AbstractText'):
+            results.append({
+                'title': data.get('Heading') or data['AbstractText'][:60],
+                'description': data['AbstractText'],
+                'url': data['AbstractURL']
+            })
+        for item in list(data.get('Results', [])) + list(self._flatten(data.get('RelatedTopics', []))):
+            if len(results) >= limit:
+                break
+            text = item.get('Text', '')
+            if text and item.get('FirstURL'):
+                results.append({
+                    'title': text.split(' - ')[0],
+                    'description': text,
+                    'url': item['FirstURL']
+                })
+        return results[:limit]
+
+
+class WebSearchPipeline:
+    """
+    批量搜索流水线。
+
+    用法::
+
+        pipeline = WebSearchPipeline(DuckDuckGoBackend())
+        results = pipeline.search(["python asyncio", "python 线程池"])
+
+    同一个流水线可被多个线程共享：所有调用共用一个信号量限制同时进行的请求数，
+    并共用连接池和结果缓存。
+    """
+
+    def __init__(self, backend: Optional[SearchBackend] = None, max_concurrency: int = DEFAULT_CONCURRENCY,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+                 results_per_query: int = DEFAULT_RESULTS_PER_QUERY,
+                 cache: Optional[ResponseCache] = None, cache_ttl: float = SEARCH_CACHE_TTL):
+        """
+        初始化流水线
+
+        Args:
+            backend (Optional[SearchBackend]): 搜索后端，默认 DuckDuckGo
+            max_concurrency (int, optional): 同时进行的搜索请求数上限
+            timeout (Tuple[float, float], optional): (连接超时, 读取超时)，秒
+            results_per_query (int, optional): 每条查询最多保留的结果数
+            cache (Optional[ResponseCache]): 结果缓存，默认使用只在内存中的缓存
+            cache_ttl (float, optional): 缓存的过期时间（秒），为 0 时不缓存
+        """
+        self.backend = backend or DuckDuckGoBackend()
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.results_per_query = results_per_query
+        self.cache_ttl = cache_ttl
+        self.cache = cache or ResponseCache(db_path=None, max_memory_entries=SEARCH_CACHE_ENTRIES, ttl=cache_ttl)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_concurrency, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.stats = {"queries": 0, "cache_hits": 0, "errors": 0, "duplicates": 0}
+        self._stats_lock = threading.Lock()
+
+    def _cache_key(self, query: str) -> str:
+        raw = f"{self.backend.cache_namespace()}\n{self.results_per_query}\n{query.lower()}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def search_one(self, query: str) -> List[Dict[str, str]]:
+        """
+        执行单条查询（先查缓存）
+
+        Args:
+            query (str): 查询
+
+        Returns:
+            List[Dict[str, str]]: 结果列表，出错时为空列表
+        """
+        self._count("queries")
+        key = self._cache_key(query)
+        if self.cache_ttl > 0:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+        started = time.time()
+        try:
+            with self._slots:
+                results = self.backend.search(self.session, query, self.results_per_query, self.timeout)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._count("errors")
+            logger.error(f"搜索出错 ({query}): {str(e)}")
+            return []
+        logger.debug(f"搜索 {query} 用时 {time.time() - started:.2f} 秒，{len(results)} 条结果")
+        if self.cache_ttl > 0:
+            self.cache.set(key, results, ttl=self.cache_ttl)
+        return results
+
+    def iter_search(self, queries: Iterable[str]) -> Iterator[Tuple[str, List[Dict[str, str]]]]:
+        """
+        并发执行一批查询，按完成顺序逐条产出 (查询, 结果)；重复或空的查询只执行一次
+
+        Args:
+            queries (Iterable[str]): 查询列表
+
+        Yields:
+            Tuple[str, List[Dict[str, str]]]: 查询及其结果
+        """
+        unique = list(dict.fromkeys(q for q in (clean_query(query) for query in queries) if q))
+        if not unique:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(unique)),
+                                thread_name_prefix="web-search") as executor:
+            futures = {executor.submit(self.search_one, query): query for query in unique}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def search(self, queries: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        并发执行一批查询，合并结果并按规范化后的 URL 去重
+
+        Args:
+            queries (Iterable[str]): 查询列表
+
+        Returns:
+            List[Dict[str, Any]]: 结果列表（title、description、url、queries），按查询的原始顺序排列
+        """
+        queries = list(dict.fromkeys(q for q in (clean_query(query) for query in queries) if q))
+        by_query = dict(self.iter_search(queries))
+        merged: Dict[str, Dict[str, Any]] = {}
+        for query in queries:
+            for result in by_query.get(query, []):
+                key = normalize_url(result['url']) if result.get('url') else f"text:{result['description']}"
+                if key in merged:
+                    self._count("duplicates")
+                    if query not in merged[key]['queries']:
+                        merged[key]['queries'].append(query)
+                    continue
+                merged[key] = dict(result, queries=[query])
+        return list(merged.values())
+
+    def close(self) -> None:
+        self.session.close()
+
@@ -0,0 +1,202 @@
+# File: workflow_journal.py
+# 工作流状态的追加日志和快照
+# 每个回合只追加一条状态增量（JSON Lines），每隔若干条把完整状态压缩成一个快照并清空日志；
+# 恢复时读取快照再重放其后的增量，耗时只与最近的增量条数有关
+
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("AI-Workflow-Journal")
+
+DEFAULT_SNAPSHOT_EVERY = 20
+DEFAULT_MAX_JOURNAL_BYTES = 4 * 1024 * 1024
+SNAPSHOT_SUFFIX = ".snapshot.json"
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+
+def _safe_id(session_id: str) -> str:
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(session_id))[:128]
+    if not safe:
+        raise ValueError("会话ID不能为空")
+    return safe
+
+
+def list_sessions(directory: str) -> List[Dict[str, Any]]:
+    """
+    列出目录中可以恢复的会话
+
+    Args:
+        directory (str): 日志目录
+
+    Returns:
+        List[Dict[str, Any]]: session_id 和 updated_at（最后写入时间），最近的在前
+    """
+    sessions: Dict[str, float] = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                for suffix in (SNAPSHOT_SUFFIX, JOURNAL_SUFFIX):
+                    if entry.name.endswith(suffix):
+                        session_id = entry.name[:-len(suffix)]
+                        sessions[session_id] = max(sessions.get(session_id, 0), entry.stat().st_mtime)
+    except FileNotFoundError:
+        return []
+    return [{'session_id': session_id, 'updated_at': updated_at}
+            for session_id, updated_at in sorted(sessions.items(), key=lambda item: -item[1])]
+
+
+class WorkflowJournal:
+    """
+    一个会话的日志。
+
+    - ``append`` 追加一条增量并 fsync（每个回合一条，写入量与回合内容成正比，与累计状态无关）
+    - ``should_compact`` 为真时，调用方用 ``write_snapshot`` 写入完整状态，之后日志被清空
+    - ``load`` 返回 (快照, 快照之后的增量列表)
+
+    快照和增量都带有递增的序号，快照写入后、日志清空前崩溃也不会重复重放。
+    """
+
+    def __init__(self, directory: str, session_id: str, snapshot_every: int = DEFAULT_SNAPSHOT_EVERY,
+                 max_journal_bytes: int = DEFAULT_MAX_JOURNAL_BYTES):
+        """
+        初始化日志
+
+        Args:
+            directory (str): 日志目录
+            session_id (str): 会话ID
+            snapshot_every (int, optional): 累计多少条增量后压缩为快照
+            max_journal_bytes (int, optional): 日志超过该大小时也压缩为快照
+        """
+        self.directory = directory
+        self.session_id = session_id
+        self.snapshot_every = snapshot_every
+        self.max_journal_bytes = max_journal_bytes
+        base = os.path.join(directory, _safe_id(session_id))
+        self.snapshot_path = base + SNAPSHOT_SUFFIX
+        self.journal_path = base + JOURNAL_SUFFIX
+        self._lock = threading.Lock()
+        self._file = None
+        self.seq = 0
+        self.records_since_snapshot = 0
+        self.journal_bytes = 0
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    def load(self) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        读取快照和其后的增量
+
+        Returns:
+            Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]: 快照（没有时为None）和增量列表
+        """
+        snapshot = None
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+        except FileNotFoundError:
+            pass
+        base_seq = snapshot.get('seq', 0) if snapshot else 0
+
+        deltas = []
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as file:
+                for line_number, line in enumerate(file, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时最后一行可能只写了一半
+                        logger.warning(f"日志 {self.journal_path} 第 {line_number} 行不完整，已忽略")
+                        break
+                    if record.get('seq', 0) > base_seq:
+                        deltas.append(record)
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self.seq = max([base_seq] + [record['seq'] for record in deltas])
+            self.records_since_snapshot = len(deltas)
+            self.journal_bytes = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        return snapshot, deltas
+
+    def append(self, record_type: str, data: Dict[str, Any]) -> int:
+        """
+        追加一条增量
+
+        Args:
+            record_type (str): 增量类型
+            data (Dict[str, Any]): 可 JSON 序列化的增量内容
+
+        Returns:
+            int: 该增量的序号
+        """
+        with self._lock:
+            self.seq += 1
+            record = dict(data, seq=self.seq, type=record_type, ts=time.time())
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            try:
+                if self._file is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._file = open(self.journal_path, 'a', encoding='utf-8')
+                self._file.write(line)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                logger.error(f"写入工作流日志失败 {self.journal_path}: {str(e)}")
+            self.records_since_snapshot += 1
+            self.journal_bytes += len(line.encode('utf-8'))
+            return self.seq
+
+    @property
+    def should_compact(self) -> bool:
+        return self.records_since_snapshot >= self.snapshot_every or self.journal_bytes >= self.max_journal_bytes
+
+    def write_snapshot(self, state: Dict[str, Any]) -> None:
+        """
+        写入完整状态的快照（原子替换），然后清空日志
+
+        Args:
+            state (Dict[str, Any]): 可 JSON 序列化的完整状态
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self.snapshot_path + ".tmp"
+            try:
+                with open(tmp, 'w', encoding='utf-8') as file:
+                    json.dump(dict(state, seq=self.seq, saved_at=time.time()), file, ensure_ascii=False)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp, self.snapshot_path)
+                # 快照已包含日志中的全部增量
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                with open(self.journal_path, 'w', encoding='utf-8'):
+                    pass
+            except OSError as e:
+                logger.error(f"写入工作流快照失败 {self.snapshot_path}: {str(e)}")
+                return
+            self.records_since_snapshot = 0
+            self.journal_bytes = 0
+
+    def delete(self) -> None:
+        """删除该会话的快照和日志"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            for path in (self.snapshot_path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None